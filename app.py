@@ -1,55 +1,302 @@
 # app.py
+import atexit
+import hmac
+import json
 import os
-from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from datetime import datetime, timedelta
+import click
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import (
-    JWTManager, create_access_token, jwt_required, get_jwt_identity
+    JWTManager, create_access_token, jwt_required, get_jwt, get_jwt_identity
 )
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from sentence_transformers import SentenceTransformer
-import chromadb
-import ollama
+from sqlalchemy.exc import IntegrityError
 import re
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlsplit
+
+from auth import HashingBusy, Identity, PasswordHasher
+from embedding import EmbeddingBatcher, HashingEncoder, RemoteEmbedder, set_torch_threads
+from grading import AnswerKey, ItemStatistics
+from llm_gateway import LLMGateway, LLMTimeout, Overloaded, process_limits
+from metrics import (
+    QUERY_BUCKETS, MetricsRegistry, ProfileStore, SamplingProfiler, TimedService, install_query_timer,
+    server_timing, span, start_trace,
+)
+from db_config import configure_database
+from ingest import ingest_documents, read_jsonl, validate_document
+from jobs import JobRunner
+from listing import csv_lines, decode_cursor, encode_cursor, ndjson_lines
+from transcript import transcript_doc_id, transcript_documents
+from prompting import SYSTEM_PROMPT, PromptBuilder, TokenCounter, UsageStats
+from retrieval import HybridRetriever
+from vector_store import ChromaStore, NumpyStore
+from write_behind import WriteBehindQueue
+from cache import LRUCache, RagAnswerCache, ReadThroughCache, make_backend, normalize_query
+from services import ServiceRegistry, ServiceUnavailable
+from summaries import fold, windows
+from topics import ChatVectorIndex, topic_clusters, unit_rows
+from streaming import stream_chat_events, stream_text_events
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True, resources={r"/*": {"origins": "http://localhost:3000"}})
 
 # Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///course_website.db'
+# DATABASE_URL, pool sizing and SQLite pragmas come from the environment (see db_config.py)
+configure_database(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'super-secret-key'  # Change this in production!
 app.config['JWT_COOKIE_CSRF_PROTECT'] = False
 
-MODEL = "deepseek-r1:1.5b"
-OLLAMA_HOST = "http://localhost:9999"
+# Authentication: hashing cost and pool size for logins; protected routes take
+# the caller's id and role from the signed token instead of querying User
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+app.config['PASSWORD_HASH_MAX_QUEUE'] = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 64))
+app.config['AUTH_TRUST_CLAIMS'] = os.environ.get('AUTH_TRUST_CLAIMS', '1').lower() in ('1', 'true')
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 60))
+passwords = PasswordHasher(
+    app.config['PASSWORD_HASH_METHOD'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_queue=app.config['PASSWORD_HASH_MAX_QUEUE'],
+)
 
-client = ollama.Client(
-    host=OLLAMA_HOST
-    )
-available_models = client.list()
-is_model_available = False
-for i in available_models.models:
-    if MODEL in i.model:
-        is_model_available = True
-        break
+MODEL = "deepseek-r1:1.5b"
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', "http://localhost:9999")
+
+# LLM serving limits: calls beyond concurrency + queue are rejected with 429.
+# Both are for the whole server and split between the gunicorn workers, which
+# also cap admission below their thread count (see process_limits)
+app.config['LLM_CONCURRENCY'] = int(os.environ.get('LLM_CONCURRENCY', 2))
+app.config['LLM_MAX_QUEUE'] = int(os.environ.get('LLM_MAX_QUEUE', 16))
+app.config['LLM_WORKERS'] = int(os.environ.get('WEB_CONCURRENCY', 1))
+app.config['LLM_REQUEST_THREADS'] = int(os.environ.get('GUNICORN_THREADS', 0)) or None
+app.config['LLM_TIMEOUTS'] = {
+    "rag": float(os.environ.get('LLM_TIMEOUT_RAG', 60)),
+    "llm": float(os.environ.get('LLM_TIMEOUT_LLM', 60)),
+    "chat_history": float(os.environ.get('LLM_TIMEOUT_CHAT_HISTORY', 120)),
+}
 
-if not is_model_available:
-    client.pull(MODEL)
+# Prompts are assembled within a per-route token budget; num_ctx must leave
+# room after the largest budget for the (thinking) answer
+app.config['PROMPT_BUDGETS'] = {
+    "rag": int(os.environ.get('PROMPT_BUDGET_RAG', 1536)),
+    "llm": int(os.environ.get('PROMPT_BUDGET_LLM', 1024)),
+    "chat_history": int(os.environ.get('PROMPT_BUDGET_CHAT_HISTORY', 2048)),
+}
+app.config['LLM_NUM_CTX'] = int(os.environ.get('LLM_NUM_CTX', 4096))
+app.config['LLM_KEEP_ALIVE'] = os.environ.get('LLM_KEEP_ALIVE', '30m')
+token_counter = TokenCounter()
+prompts = PromptBuilder(token_counter, app.config['PROMPT_BUDGETS'])
+llm_usage = UsageStats(token_counter)
+
+def record_llm_usage(route, messages, response):
+    usage = llm_usage.record(route, messages, response)
+    app.logger.info("llm route=%s prompt_tokens=%s completion_tokens=%s estimated_prompt_tokens=%s",
+                    route, usage["prompt_tokens"], usage["completion_tokens"], usage["estimated_prompt_tokens"])
+
+# Embedding model and micro-batching of concurrent encode calls
+app.config['EMBED_MAX_BATCH'] = int(os.environ.get('EMBED_MAX_BATCH', 32))
+app.config['EMBED_MAX_WAIT_MS'] = float(os.environ.get('EMBED_MAX_WAIT_MS', 5))
+app.config['EMBED_MODEL'] = os.environ.get('EMBED_MODEL', "sentence-transformers/all-mpnet-base-v2")
+# local: each process loads the model on first use; preload: loaded at import,
+# i.e. once in the gunicorn master and shared by the forked workers; sidecar:
+# workers call embed_server.py over EMBED_SOCKET and never load the model;
+# hashing: a deterministic stand-in with no model, for benchmarks and offline runs
+app.config['EMBED_MODE'] = os.environ.get('EMBED_MODE', 'local')
+app.config['EMBED_HASHING_DIMENSION'] = int(os.environ.get('EMBED_HASHING_DIMENSION', 384))
+app.config['EMBED_SOCKET'] = os.environ.get('EMBED_SOCKET', '/tmp/course-website-embed.sock')
+app.config['EMBED_TORCH_THREADS'] = int(os.environ.get('EMBED_TORCH_THREADS', 0))
+
+# Vector store for RAG chunks: chroma, or numpy for the in-process memory-mapped
+# index (exact search, or IVF when VECTOR_IVF_LISTS > 0)
+app.config['VECTOR_STORE'] = os.environ.get('VECTOR_STORE', 'chroma')
+app.config['CHROMA_PATH'] = os.environ.get('CHROMA_PATH', "./chroma_db")
+app.config['CHROMA_URL'] = os.environ.get('CHROMA_URL')
+app.config['VECTOR_STORE_PATH'] = os.environ.get('VECTOR_STORE_PATH', "./vector_index")
+app.config['VECTOR_IVF_LISTS'] = int(os.environ.get('VECTOR_IVF_LISTS', 0))
+app.config['VECTOR_IVF_PROBES'] = int(os.environ.get('VECTOR_IVF_PROBES', 8))
+
+# Documents are split into overlapping word windows before embedding
+app.config['RAG_CHUNK_SIZE'] = int(os.environ.get('RAG_CHUNK_SIZE', 200))
+app.config['RAG_CHUNK_OVERLAP'] = int(os.environ.get('RAG_CHUNK_OVERLAP', 40))
+
+# Repeated questions skip the embedding and, within the TTL, the whole RAG pipeline
+app.config['QUERY_EMBED_CACHE_SIZE'] = int(os.environ.get('QUERY_EMBED_CACHE_SIZE', 4096))
+app.config['RAG_CACHE_SIZE'] = int(os.environ.get('RAG_CACHE_SIZE', 1024))
+app.config['RAG_CACHE_TTL'] = float(os.environ.get('RAG_CACHE_TTL', 3600))
+app.config['RAG_SEMANTIC_THRESHOLD'] = (
+    float(os.environ['RAG_SEMANTIC_THRESHOLD']) if os.environ.get('RAG_SEMANTIC_THRESHOLD') else None
+)
+# Retrieval: dense and BM25 candidates fused by reciprocal rank, optionally
+# reranked by a cross-encoder
+app.config['RAG_TOP_K'] = int(os.environ.get('RAG_TOP_K', 5))
+app.config['RAG_HYBRID'] = os.environ.get('RAG_HYBRID', '1').lower() in ('1', 'true')
+app.config['RAG_CANDIDATES'] = int(os.environ.get('RAG_CANDIDATES', 20))
+app.config['RAG_RRF_K'] = int(os.environ.get('RAG_RRF_K', 60))
+app.config['RAG_RERANKER_MODEL'] = os.environ.get('RAG_RERANKER_MODEL')
+
+query_embeddings = LRUCache(maxsize=app.config['QUERY_EMBED_CACHE_SIZE'])
+rag_answers = RagAnswerCache(
+    maxsize=app.config['RAG_CACHE_SIZE'],
+    ttl=app.config['RAG_CACHE_TTL'],
+    semantic_threshold=app.config['RAG_SEMANTIC_THRESHOLD'],
+)
 
-# Load embedding model
-embed_model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+# ------------------
+# Heavy services load on first use (or at startup with WARMUP=1), so importing
+# the app for health checks, migrations or seeding stays fast
+def load_llm():
+    """Makes sure MODEL is available in Ollama, pulling it if needed, and starts the gateway."""
+    import ollama
+    client = ollama.Client(host=OLLAMA_HOST)
+    if not any(MODEL in model.model for model in client.list().models):
+        client.pull(MODEL)
+    # All request-path LLM calls go through the async gateway
+    concurrency, max_queue = process_limits(
+        app.config['LLM_CONCURRENCY'], app.config['LLM_MAX_QUEUE'],
+        workers=app.config['LLM_WORKERS'], threads=app.config['LLM_REQUEST_THREADS'],
+    )
+    gateway = LLMGateway(
+        OLLAMA_HOST,
+        concurrency=concurrency,
+        max_queue=max_queue,
+        timeouts=app.config['LLM_TIMEOUTS'],
+        options={"num_ctx": app.config['LLM_NUM_CTX']},
+        keep_alive=app.config['LLM_KEEP_ALIVE'],
+        on_usage=record_llm_usage,
+    )
+    return TimedService(gateway, "llm", ("chat",), streams=("stream_chat",))
+
+def load_embed_model():
+    if app.config['EMBED_MODE'] == 'hashing':
+        return HashingEncoder(app.config['EMBED_HASHING_DIMENSION'])
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(app.config['EMBED_MODEL'])
+    set_torch_threads(app.config['EMBED_TORCH_THREADS'])
+    return model
+
+def load_embedder():
+    if app.config['EMBED_MODE'] == 'sidecar':
+        embedder = RemoteEmbedder(app.config['EMBED_SOCKET'])
+        embedder.dimension  # fails the load while the sidecar is down
+    else:
+        # Concurrent encode calls are coalesced into one batch per window
+        embedder = EmbeddingBatcher(
+            services.get("embed_model"),
+            max_batch_size=app.config['EMBED_MAX_BATCH'],
+            max_wait_ms=app.config['EMBED_MAX_WAIT_MS'],
+        )
+    return TimedService(embedder, "embedding", ("encode",))
+
+def load_reranker():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(app.config['RAG_RERANKER_MODEL'])
+
+def load_vector_store():
+    if app.config['VECTOR_STORE'] == 'numpy':
+        return NumpyStore(
+            app.config['VECTOR_STORE_PATH'],
+            ivf_lists=app.config['VECTOR_IVF_LISTS'],
+            probes=app.config['VECTOR_IVF_PROBES'],
+        )
+    import chromadb
+    if app.config['CHROMA_URL']:
+        # One Chroma server shared by every worker instead of a client per process on CHROMA_PATH
+        url = urlsplit(app.config['CHROMA_URL'])
+        chroma_client = chromadb.HttpClient(host=url.hostname, port=url.port or 8000, ssl=url.scheme == "https")
+    else:
+        chroma_client = chromadb.PersistentClient(path=app.config['CHROMA_PATH'])
+    return ChromaStore(chroma_client.get_or_create_collection(name="documents"))
+
+services = ServiceRegistry()
+# Threads, event loops and open connections do not survive a fork, so those
+# services are rebuilt in every worker; only the model itself is shared
+services.register("llm", load_llm, per_process=True)
+if app.config['EMBED_MODE'] != 'sidecar':
+    services.register("embed_model", load_embed_model)
+services.register("embedder", load_embedder, per_process=True)
+services.register("vector_store", load_vector_store, per_process=True)
+llm = services.proxy("llm")
+embedder = services.proxy("embedder")
+vector_store = services.proxy("vector_store")
+if app.config['RAG_RERANKER_MODEL']:
+    services.register("reranker", load_reranker)
+retriever = HybridRetriever(
+    vector_store,
+    candidates=app.config['RAG_CANDIDATES'],
+    rrf_k=app.config['RAG_RRF_K'],
+    reranker=services.proxy("reranker") if app.config['RAG_RERANKER_MODEL'] else None,
+    hybrid=app.config['RAG_HYBRID'],
+)
 
-# Initialize ChromaDB (or FAISS)
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(name="documents")
+if app.config['EMBED_MODE'] == 'preload':
+    services.get("embed_model")
+if os.environ.get('WARMUP', '').lower() in ('1', 'true'):
+    threading.Thread(target=services.warmup, name="warmup", daemon=True).start()
+# Bearer token for POST /api/ready; unset, warming up over HTTP is disabled
+app.config['WARMUP_TOKEN'] = os.environ.get('WARMUP_TOKEN') or None
 
 # Initialize extensions
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 jwt = JWTManager(app)
+jobs = JobRunner(app, max_workers=int(os.environ.get('JOB_WORKERS', 2)))
+# How long a background job's claim on shared work lasts without being renewed
+app.config['JOB_LEASE_SECONDS'] = float(os.environ.get('JOB_LEASE_SECONDS', 600))
+
+# Chat logs and submissions are inserted in batches by a background writer
+# instead of one commit per request; WRITE_BEHIND=0 writes them inline
+app.config['WRITE_BEHIND'] = os.environ.get('WRITE_BEHIND', '1').lower() in ('1', 'true')
+app.config['WRITE_BEHIND_INTERVAL_MS'] = float(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 200))
+app.config['WRITE_BEHIND_BATCH'] = int(os.environ.get('WRITE_BEHIND_BATCH', 500))
+app.config['WRITE_BEHIND_MAX_QUEUE'] = int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', 10000))
+app.config['SUBMISSION_ACK_TIMEOUT'] = float(os.environ.get('SUBMISSION_ACK_TIMEOUT', 10))
+def write_engine():
+    with app.app_context():
+        return db.engine
+
+writes = WriteBehindQueue(
+    write_engine,
+    flush_interval=app.config['WRITE_BEHIND_INTERVAL_MS'] / 1000,
+    max_batch=app.config['WRITE_BEHIND_BATCH'],
+    max_queue=app.config['WRITE_BEHIND_MAX_QUEUE'],
+    enabled=app.config['WRITE_BEHIND'],
+)
+atexit.register(writes.close)
+
+# Read-through cache for the course catalog; CACHE_URL=redis://... shares it across workers
+app.config['CACHE_URL'] = os.environ.get('CACHE_URL', 'memory://')
+app.config['CACHE_SIZE'] = int(os.environ.get('CACHE_SIZE', 2048))
+app.config['CACHE_TTL'] = float(os.environ.get('CACHE_TTL', 300)) or None
+catalog_cache = ReadThroughCache(make_backend(
+    app.config['CACHE_URL'], maxsize=app.config['CACHE_SIZE'], ttl=app.config['CACHE_TTL']
+))
+
+def user_courses_key(email):
+    return f"courses:user:{email}"
+
+def course_key(course_id):
+    return f"course:{course_id}"
+
+def answer_key_key(assignment_id):
+    return f"answer_key:v2:{assignment_id}"
+
+# Identities of users whose tokens predate the uid claim, or of every caller
+# when AUTH_TRUST_CLAIMS=0; on the CACHE_URL backend, so that role changes
+# made by bulk_load reach the workers through a shared one
+user_cache = ReadThroughCache(make_backend(
+    app.config['CACHE_URL'], maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL']
+))
+
+def user_key(email):
+    return f"user:{email}"
 
 # ------------------
 # Database Models
@@ -58,22 +305,24 @@ jwt = JWTManager(app)
 user_courses = db.Table(
     'user_courses',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id', name="fk_user_courses_user"), primary_key=True),
-    db.Column('course_id', db.Integer, db.ForeignKey('course.id', name="fk_user_courses_course"), primary_key=True)
+    db.Column('course_id', db.Integer, db.ForeignKey('course.id', name="fk_user_courses_course"), primary_key=True),
+    # The primary key covers user -> courses; this covers course -> users
+    db.Index('ix_user_courses_course_id', 'course_id')
 )
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))  # scrypt hashes are longer than 128 characters
     role = db.Column(db.String(20))  # "student" or "teacher"
 
     courses = db.relationship('Course', secondary=user_courses, back_populates='users')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
 
 class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -103,8 +352,12 @@ class Assignment(db.Model):
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     due_date = db.Column(db.DateTime)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, index=True)
     content = db.Column(db.JSON(True))
+    # Compiled from content on every change, see AnswerKey
+    answer_key = db.Column(db.JSON, nullable=True)
+    # Bumped whenever answer_key changes, so a cached key can be checked against it
+    key_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     # A one-to-many relationship: an assignment can have many submissions
     submissions = db.relationship('Submission', backref='assignment', lazy=True)
 
@@ -112,23 +365,124 @@ class Lecture(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, index=True)
     video_link = db.Column(db.String(256))
     transcript = db.Column(db.Text)
+    # Set once the transcript is in the vector store, cleared when it changes
+    transcript_indexed_at = db.Column(db.DateTime, nullable=True)
 
 class Submission(db.Model):
+    # Teacher views list an assignment's submissions in time order, optionally
+    # for one student (?student=); bulk loads match on student and assignment
+    __table_args__ = (
+        db.Index('ix_submission_assignment_submitted', 'assignment_id', 'submitted_at'),
+        db.Index('ix_submission_student_assignment', 'student_email', 'assignment_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_email = db.Column(db.String(120), nullable=False)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
     submitted_at = db.Column(db.DateTime, default=db.func.now())
     content = db.Column(db.JSON(True)) 
     score = db.Column(db.Float, nullable=True)
+    # Assignment.key_version the score was computed with
+    key_version = db.Column(db.Integer, nullable=True)
 
 class Chathistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user = db.Column(db.String(120), nullable=False)
-    message = db.Column(db.String(256), nullable=False)
-    created_at = db.Column(db.DateTime, default=db.func.now())
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.now(), index=True)
+    course_id = db.Column(db.String(50), nullable=True, index=True)
+
+class ChatSummary(db.Model):
+    """Rolling summary of the chat history in one scope (course and time range)."""
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(200), unique=True, nullable=False)
+    summary = db.Column(db.Text)
+    # High-water mark: every Chathistory row up to this id is in the summary
+    last_message_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+class JobLease(db.Model):
+    """Claim on work that one background job across all workers should do at a time."""
+    name = db.Column(db.String(250), primary_key=True)
+    holder = db.Column(db.String(32), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class ChatEmbedding(db.Model):
+    """Unit-length embedding of a chat message (float32 bytes), for topic analytics."""
+    chathistory_id = db.Column(db.Integer, db.ForeignKey('chathistory.id'), primary_key=True)
+    vector = db.Column(db.LargeBinary, nullable=False)
+
+# Enrollment changes drop the affected user's course list once the change is committed
+def invalidate_after_commit(*keys):
+    db.session.info.setdefault("cache_invalidations", set()).update(keys)
+
+@db.event.listens_for(db.session, "after_commit")
+def flush_cache_invalidations(session):
+    keys = session.info.pop("cache_invalidations", None)
+    if keys:
+        catalog_cache.invalidate(*keys)
+
+@db.event.listens_for(db.session, "after_rollback")
+def discard_cache_invalidations(session):
+    session.info.pop("cache_invalidations", None)
+
+@db.event.listens_for(User.courses, "append")
+@db.event.listens_for(User.courses, "remove")
+def user_enrollment_changed(user, course, initiator):
+    invalidate_after_commit(user_courses_key(user.email))
+
+@db.event.listens_for(Course.users, "append")
+@db.event.listens_for(Course.users, "remove")
+def course_enrollment_changed(course, user, initiator):
+    invalidate_after_commit(user_courses_key(user.email))
+
+# Editing the questions recompiles the answer key, bumps its version and drops
+# the cached copy; the invalidation only reaches this worker's memory:// cache,
+# the version reaches every worker (see current_answer_key)
+@db.event.listens_for(Assignment.content, "set")
+def assignment_content_changed(assignment, content, old_content, initiator):
+    try:
+        answer_key = AnswerKey.compile(content).to_json()
+    except ValueError:
+        answer_key = None
+    if assignment.id is not None and answer_key != assignment.answer_key:
+        assignment.key_version = Assignment.key_version + 1
+        invalidate_after_commit(answer_key_key(assignment.id))
+    assignment.answer_key = answer_key
+
+def load_answer_key(assignment_id):
+    """(course pk, AnswerKey, key version) for an assignment, or None if it does not exist."""
+    row = db.session.execute(
+        db.select(Assignment.course_id, Assignment.answer_key, Assignment.key_version).filter_by(id=assignment_id)
+    ).first()
+    if row is None:
+        return None
+    if row.answer_key is not None:
+        return row.course_id, AnswerKey.from_json(row.answer_key), row.key_version
+    # Assignments created before answer keys existed are compiled on first use
+    content = db.session.execute(db.select(Assignment.content).filter_by(id=assignment_id)).scalar()
+    try:
+        return row.course_id, AnswerKey.compile(content), row.key_version
+    except ValueError:
+        return row.course_id, None, row.key_version
+
+def current_answer_key(assignment_id):
+    """
+    load_answer_key() through the cache, reloaded when the stored key version
+    is newer than the cached one (an edit made in another worker).
+    """
+    key = answer_key_key(assignment_id)
+    cached = catalog_cache.get_or_load(key, lambda: load_answer_key(assignment_id))
+    if cached is None:
+        return None
+    version = db.session.execute(db.select(Assignment.key_version).filter_by(id=assignment_id)).scalar()
+    if version != cached[2]:
+        catalog_cache.invalidate(key)
+        cached = catalog_cache.get_or_load(key, lambda: load_answer_key(assignment_id))
+    return cached
 
 def check_cheating(query):
     forbidden_keywords = [ "solve", "answer", "solution"]
@@ -137,10 +491,192 @@ def check_cheating(query):
 def clean_answer(answer):
     """Removes content enclosed within <think>...</think> tags."""
     return re.sub(r'<think>.*?</think>', '', answer, flags=re.DOTALL).strip()
+
+def wants_stream(data):
+    """Streaming is requested with {"stream": true} in the body or ?stream=1."""
+    return bool(data.get("stream")) or request.args.get("stream") in ("1", "true")
+
+def event_stream(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+@app.errorhandler(Overloaded)
+def llm_overloaded(e):
+    response = jsonify({"error": "The assistant is busy, please try again shortly"})
+    response.headers["Retry-After"] = "5"
+    return response, 429
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({"success": False, "message": "Too many sign-ins at once, please try again shortly"})
+    response.headers["Retry-After"] = "2"
+    return response, 429
+
+@app.errorhandler(LLMTimeout)
+def llm_timeout(e):
+    return jsonify({"error": "The assistant took too long to respond"}), 504
+
+@app.errorhandler(ServiceUnavailable)
+def service_unavailable(e):
+    app.logger.warning("%s", e)
+    response = jsonify({"error": f"{e.name} is not available right now"})
+    response.headers["Retry-After"] = "10"
+    return response, 503
+
+# ------------------
+# Instrumentation: time per request and per phase (db, embedding, retrieval,
+# llm), SQL statements per request, all exported at /metrics; PROFILING=1
+# lets a request ask for a sampled profile with ?profile=1 or X-Profile: 1.
+# METRICS_DIR (set by gunicorn.conf.py) is shared by the workers, so any of
+# them answers /metrics and /api/profiles for the whole server
+# ------------------
+app.config['PROFILING'] = os.environ.get('PROFILING', '').lower() in ('1', 'true')
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+app.config['SQL_QUERY_WARN'] = int(os.environ.get('SQL_QUERY_WARN', 50))
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR') or None
+app.config['METRICS_WRITE_INTERVAL'] = float(os.environ.get('METRICS_WRITE_INTERVAL', 5))
+metrics_registry = MetricsRegistry(app.config['METRICS_DIR'], app.config['METRICS_WRITE_INTERVAL'])
+request_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "Time to produce the response (first byte for streams)",
+    ("endpoint", "method", "status"))
+phase_seconds = metrics_registry.histogram(
+    "http_request_phase_seconds", "Time a request spent in each phase", ("endpoint", "phase"))
+request_queries = metrics_registry.histogram(
+    "http_request_sql_queries", "SQL statements executed per request", ("endpoint",), QUERY_BUCKETS)
+profiles = ProfileStore(app.config['METRICS_DIR']) if app.config['METRICS_DIR'] else LRUCache(maxsize=32)
+install_query_timer()
+
+def wants_profile():
+    return app.config['PROFILING'] and (
+        request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+    )
+
+@app.before_request
+def begin_request_trace():
+    metrics_registry.attach()
+    start_trace()
+    if wants_profile():
+        interval = app.config['PROFILE_INTERVAL_MS'] / 1000
+        g.profiler = SamplingProfiler(threading.get_ident(), interval=interval).start()
+
+def observe_trace(trace, endpoint, method, path, status):
+    elapsed = time.perf_counter() - trace["start"]
+    request_seconds.observe(elapsed, endpoint=endpoint, method=method, status=status)
+    for phase, seconds in trace["phases"].items():
+        phase_seconds.observe(seconds, endpoint=endpoint, phase=phase)
+    request_queries.observe(trace["queries"], endpoint=endpoint)
+    if trace["queries"] >= app.config['SQL_QUERY_WARN']:
+        # Usually a relationship loaded once per row (N+1)
+        app.logger.warning("%s %s ran %d SQL statements", method, path, trace["queries"])
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.get("trace")
+    if trace is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    observed = (trace, endpoint, request.method, request.path, response.status_code)
+    if response.is_streamed:
+        # A streamed body (and the LLM call behind it) runs after this hook;
+        # its phases are observed once it has been sent
+        response.call_on_close(lambda: observe_trace(*observed))
+    else:
+        observe_trace(*observed)
+    if trace["phases"]:
+        response.headers["Server-Timing"] = server_timing(trace)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profile_id = uuid.uuid4().hex
+        profiles.set(profile_id, profiler.stop().collapsed())
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+@metrics_registry.collector
+def service_metrics():
+    for name, status in services.status().items():
+        yield "service_warm", "gauge", "1 once a lazily loaded service is loaded", {"service": name}, \
+            int(status["state"] == "warm")
+        yield "service_load_seconds", "gauge", "How long the service took to load", {"service": name}, \
+            round(status["load_ms"] / 1000, 6) if status["load_ms"] is not None else None
+    if services.is_loaded("llm"):
+        gateway = llm.stats()
+        yield "llm_queued", "gauge", "LLM calls waiting for a slot", {}, gateway["queued"]
+        yield "llm_in_flight", "gauge", "LLM calls running", {}, gateway["in_flight"]
+    if services.is_loaded("embedder"):
+        batcher = embedder.stats()
+        yield "embedding_queue_depth", "gauge", "Texts waiting to be embedded", {}, batcher.get("queue_depth")
+        yield "embedding_batches_total", "counter", "encode() batches run", {}, batcher.get("batches")
+        yield "embedding_texts_total", "counter", "Texts embedded", {}, batcher.get("texts")
+
+@metrics_registry.collector
+def llm_token_metrics():
+    for route, stats in llm_usage.stats()["routes"].items():
+        labels = {"route": route}
+        yield "llm_requests_total", "counter", "Completed LLM calls", labels, stats["requests"]
+        yield "llm_prompt_tokens_total", "counter", "Prompt tokens evaluated by Ollama", labels, stats["prompt_tokens"]
+        yield "llm_completion_tokens_total", "counter", "Tokens generated by Ollama", labels, stats["completion_tokens"]
+        yield "llm_prompt_eval_seconds_total", "counter", "Ollama prompt evaluation time", labels, \
+            round(stats["prompt_seconds"], 6)
+        yield "llm_completion_seconds_total", "counter", "Ollama generation time", labels, \
+            round(stats["completion_seconds"], 6)
+
+@metrics_registry.collector
+def storage_metrics():
+    writes_stats = writes.stats()
+    yield "write_behind_queue_depth", "gauge", "Rows waiting for the write-behind writer", {}, writes_stats["queue_depth"]
+    yield "write_behind_rows_total", "counter", "Rows written by the write-behind writer", {"outcome": "written"}, \
+        writes_stats["written"]
+    yield "write_behind_rows_total", "counter", "Rows written by the write-behind writer", {"outcome": "failed"}, \
+        writes_stats["failed"]
+    yield "write_behind_flushes_total", "counter", "Write-behind transactions", {}, writes_stats["flushes"]
+    for name, cache in (("catalog", catalog_cache), ("query_embeddings", query_embeddings),
+                        ("rag_answers", rag_answers), ("users", user_cache)):
+        stats = cache.stats()
+        for outcome in ("hits", "misses"):
+            yield "cache_requests_total", "counter", "Cache lookups", {"cache": name, "outcome": outcome}, \
+                stats.get(outcome)
+    hashing = passwords.stats()
+    yield "password_hashes_total", "counter", "Password hashes and checks", {"op": "hash"}, hashing["hashes"]
+    yield "password_hashes_total", "counter", "Password hashes and checks", {"op": "verify"}, hashing["verifies"]
+    yield "password_hashes_rejected_total", "counter", "Logins turned away by the full hashing pool", {}, \
+        hashing["rejected"]
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id):
+    profile = profiles.get(profile_id) if app.config['PROFILING'] else None
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(profile, mimetype="text/plain")
+
 # ------------------
 # API Endpoints
 # ------------------
 
+def lookup_user(email):
+    """Identity of a user by email, through the user cache; None if there is no such user."""
+    def load():
+        row = db.session.execute(db.select(User.id, User.role).where(User.email == email)).first()
+        return Identity(email, row.id, row.role) if row is not None else None
+    return user_cache.get_or_load(user_key(email), load)
+
+def current_identity():
+    """The caller's identity: straight from the signed token claims, or looked up by email."""
+    email = get_jwt_identity()
+    claims = get_jwt()
+    if app.config['AUTH_TRUST_CLAIMS'] and "uid" in claims and "role" in claims:
+        return Identity(email, claims["uid"], claims["role"])
+    return lookup_user(email)
+
+def caller_role():
+    identity = current_identity()
+    return identity.role if identity else None
+
 # User Registration Endpoint (for demonstration)
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -154,6 +690,7 @@ def register():
     user.set_password(password)
     db.session.add(user)
     db.session.commit()
+    user_cache.invalidate(user_key(email))
     return jsonify({"success": True, "message": "User registered successfully."}), 201
 
 # Login Endpoint: Validate credentials and return a JWT token
@@ -165,7 +702,13 @@ def login():
     role = data.get('role')
     user = User.query.filter_by(email=email, role=role).first()
     if user and user.check_password(password):
-        access_token = create_access_token(identity=user.email, additional_claims={"role": user.role}, expires_delta=False)
+        # Hashes from an older PASSWORD_HASH_METHOD are upgraded while the password is at hand
+        if passwords.needs_rehash(user.password_hash):
+            user.set_password(password)
+            db.session.commit()
+        access_token = create_access_token(
+            identity=user.email, additional_claims={"role": user.role, "uid": user.id}, expires_delta=False
+        )
         response = jsonify({
             "success": True,
             "message": "Login successful",
@@ -188,58 +731,168 @@ def login():
 @jwt_required(locations=["cookies"])
 def get_courses():
     jwt = get_jwt_identity()
-    user = User.query.filter_by(email=jwt).first()
-    courses = user.courses
-    courses_list = [
-        {"id": course.course_id, "name": course.name, "description": course.description}
-        for course in courses
-    ]
+
+    def load():
+        user = User.query.filter_by(email=jwt).first()
+        return [
+            {"id": course.course_id, "name": course.name, "description": course.description}
+            for course in user.courses
+        ]
+
+    courses_list = catalog_cache.get_or_load(user_courses_key(jwt), load)
     return jsonify(courses_list)
 
-# Protected Endpoint: Retrieve course details (including dummy materials)
+def assignment_json(assignment, include_content=False):
+    data = {
+        "id": assignment.id,
+        "title": assignment.title,
+        "description": assignment.description,
+        "due_date": assignment.due_date,
+    }
+    if include_content:
+        data["content"] = assignment.content
+    return data
+
+def lecture_json(lecture, include_transcript=False):
+    data = {
+        "id": lecture.id,
+        "title": lecture.title,
+        "description": lecture.description,
+        "video_link": lecture.video_link,
+    }
+    if include_transcript:
+        data["transcript"] = lecture.transcript
+    return data
+
+def conditional_json(payload):
+    """JSON response with an ETag; answers 304 when If-None-Match matches."""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+def requested_fields():
+    return {field.strip() for field in request.args.get("include", "").split(",") if field.strip()}
+
+def page_args():
+    page = request.args.get("page", 1, type=int)
+    per_page = min(request.args.get("per_page", 20, type=int), 100)
+    return max(page, 1), max(per_page, 1)
+
+# Protected Endpoint: Retrieve course details
+# Summaries only by default; ?include=content,transcript adds the heavy fields,
+# which are otherwise deferred and never loaded from the database.
 @app.route('/api/course/<course_id>', methods=['GET'])
 @jwt_required(locations=["cookies"])
 def get_course(course_id):
-    course = Course.query.filter_by(course_id=course_id).first()
-    if not course:
+    include = requested_fields()
+    include_content = "content" in include
+    include_transcript = "transcript" in include
+    # Only the default summary is cached; the heavy variants are rare
+    if not include_content and not include_transcript:
+        course = catalog_cache.get_or_load(
+            course_key(course_id), lambda: load_course(course_id, False, False)
+        )
+    else:
+        course = load_course(course_id, include_content, include_transcript)
+    if course is None:
         return jsonify({"message": "Course not found"}), 404
-    course = {
+    return conditional_json(course)
+
+def load_course(course_id, include_content, include_transcript):
+    assignments = db.selectinload(Course.assignments)
+    lectures = db.selectinload(Course.lectures)
+    if not include_content:
+        assignments = assignments.defer(Assignment.content)
+    if not include_transcript:
+        lectures = lectures.defer(Lecture.transcript)
+
+    course = Course.query.options(assignments, lectures).filter_by(course_id=course_id).first()
+    if not course:
+        return None
+    return {
         "id": course.course_id,
         "name": course.name,
         "description": course.description,
         "assignments": [
-            {
-                "id": assignment.id,
-                "title": assignment.title,
-                "description": assignment.description,
-                "due_date": assignment.due_date,
-                "content": assignment.content
-            }
-            for assignment in course.assignments
+            assignment_json(assignment, include_content)
+            for assignment in sorted(course.assignments, key=lambda a: a.id)
         ],
         "lectures": [
-            {
-                "id": lecture.id,
-                "title": lecture.title,
-                "description": lecture.description,
-                "video_link": lecture.video_link,
-                "transcript": lecture.transcript
-            }
-            for lecture in course.lectures
+            lecture_json(lecture, include_transcript)
+            for lecture in sorted(course.lectures, key=lambda l: l.id)
         ]
     }
 
-    return jsonify(course)
+def course_pk(course_id):
+    return db.session.query(Course.id).filter_by(course_id=course_id).scalar()
+
+# Paginated lecture summaries for a course
+@app.route('/api/course/<course_id>/lectures', methods=['GET'])
+@jwt_required(locations=["cookies"])
+def get_course_lectures(course_id):
+    pk = course_pk(course_id)
+    if pk is None:
+        return jsonify({"message": "Course not found"}), 404
+    page, per_page = page_args()
+    include_transcript = "transcript" in requested_fields()
+    query = db.select(Lecture).filter_by(course_id=pk).order_by(Lecture.id)
+    if not include_transcript:
+        query = query.options(db.defer(Lecture.transcript))
+    lectures = db.paginate(query, page=page, per_page=per_page, error_out=False)
+    return conditional_json({
+        "lectures": [lecture_json(lecture, include_transcript) for lecture in lectures.items],
+        "page": lectures.page,
+        "per_page": lectures.per_page,
+        "total": lectures.total,
+    })
+
+# A single lecture with its transcript
+@app.route('/api/course/<course_id>/lectures/<int:lecture_id>', methods=['GET'])
+@jwt_required(locations=["cookies"])
+def get_course_lecture(course_id, lecture_id):
+    pk = course_pk(course_id)
+    lecture = db.session.get(Lecture, lecture_id) if pk is not None else None
+    if not lecture or lecture.course_id != pk:
+        return jsonify({"message": "Lecture not found"}), 404
+    return conditional_json(lecture_json(lecture, include_transcript=True))
+
+# Paginated assignment summaries for a course
+@app.route('/api/course/<course_id>/assignments', methods=['GET'])
+@jwt_required(locations=["cookies"])
+def get_course_assignments(course_id):
+    pk = course_pk(course_id)
+    if pk is None:
+        return jsonify({"message": "Course not found"}), 404
+    page, per_page = page_args()
+    include_content = "content" in requested_fields()
+    query = db.select(Assignment).filter_by(course_id=pk).order_by(Assignment.id)
+    if not include_content:
+        query = query.options(db.defer(Assignment.content))
+    assignments = db.paginate(query, page=page, per_page=per_page, error_out=False)
+    return conditional_json({
+        "assignments": [assignment_json(assignment, include_content) for assignment in assignments.items],
+        "page": assignments.page,
+        "per_page": assignments.per_page,
+        "total": assignments.total,
+    })
+
+# A single assignment with its questions
+@app.route('/api/course/<course_id>/assignments/<int:assignment_id>', methods=['GET'])
+@jwt_required(locations=["cookies"])
+def get_course_assignment(course_id, assignment_id):
+    pk = course_pk(course_id)
+    assignment = db.session.get(Assignment, assignment_id) if pk is not None else None
+    if not assignment or assignment.course_id != pk:
+        return jsonify({"message": "Assignment not found"}), 404
+    return conditional_json(assignment_json(assignment, include_content=True))
 
 @app.route('/api/submit_assignment/<course_id>/<assignment_id>', methods=['POST'])
 @jwt_required(locations=["cookies"])
 def submit_assignment(course_id, assignment_id):
-    user_email = get_jwt_identity()
-    user_email = "student@example.com"
-    user = User.query.filter_by(email=user_email).first()
-
+    user = current_identity()
     if not user:
         return jsonify({"success": False, "message": "User not found"}), 404
+    user_email = user.email
 
     # Check if the user is a student
     if user.role != "student":
@@ -250,62 +903,164 @@ def submit_assignment(course_id, assignment_id):
     if not course:
         return jsonify({"success": False, "message": "Course not found"}), 404
 
-    # Check if the assignment exists
-    assignment = Assignment.query.filter_by(course_id=course.id).first()
-    if not assignment:
+    # Check if the assignment exists in this course; its answer key is cached
+    # and checked against the stored key version
+    try:
+        assignment_id = int(assignment_id)
+    except ValueError:
         return jsonify({"success": False, "message": "Assignment not found"}), 404
-
-    # Create a new submission record
-    submission = Submission(
-        student_email=user_email,
-        assignment_id=assignment.id,
-        content=request.get_json(),  # Assuming the submission content is sent in the request body
-        score=0
-    )
-    
-    for i, selected_option in enumerate(request.get_json()):
-        print(assignment.content[i]['correct_option'], selected_option)
-        if assignment.content[i]['correct_option'] == assignment.content[i]['options'][int(selected_option)]:
-            submission.score += 1
-    assignment.submissions.append(submission)
-    db.session.commit()
+    cached = current_answer_key(assignment_id)
+    if cached is None or cached[0] != course.id:
+        return jsonify({"success": False, "message": "Assignment not found"}), 404
+    answer_key = cached[1]
+    if answer_key is None:
+        return jsonify({"success": False, "message": "Assignment questions are malformed"}), 409
+
+    selections = request.get_json()
+    try:
+        score = answer_key.grade(selections)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    # Create a new submission record; concurrent submissions share one commit,
+    # and the student only hears back once theirs is on disk. The request's
+    # connection goes back to the pool first, so waiting requests cannot
+    # starve the writer of connections.
+    db.session.close()
+    saved = writes.enqueue(Submission.__table__, {
+        "student_email": user_email,
+        "assignment_id": assignment_id,
+        "content": selections,
+        "score": score,
+        "key_version": cached[2],
+        "submitted_at": datetime.utcnow(),
+    }, wait=True)
+    try:
+        saved.result(timeout=app.config['SUBMISSION_ACK_TIMEOUT'])
+    except FutureTimeout:
+        return jsonify({"success": False, "message": "Submission is still being saved, check again shortly"}), 503
+    except Exception:
+        return jsonify({"success": False, "message": "Submission could not be saved"}), 500
     return jsonify({"success": True, "message": "Assignment submitted successfully"})
 
-# Protected Endpoint: Fetch submissions for a specific assignment
-@app.route('/api/submissions/<assignment_id>', methods=['GET'])
-@jwt_required(locations=["cookies"])
-def fetch_submissions(assignment_id):
-    identity = get_jwt_identity()
-    user = User.query.filter_by(email=identity).first()
+SUBMISSION_COLUMNS = ("id", "student_email", "submitted_at", "content", "score")
+
+def submission_filters(assignment_id):
+    """Filters shared by the listing and the export: ?student=&min_score=&max_score=."""
+    filters = [Submission.assignment_id == assignment_id]
+    if request.args.get("student"):
+        filters.append(Submission.student_email == request.args["student"])
+    min_score = request.args.get("min_score", type=float)
+    if min_score is not None:
+        filters.append(Submission.score >= min_score)
+    max_score = request.args.get("max_score", type=float)
+    if max_score is not None:
+        filters.append(Submission.score <= max_score)
+    return filters
+
+def submission_queries(assignment_id, after=None):
+    """
+    Queries for an assignment's submissions in listing order, starting after
+    the (submitted_at, id) of a cursor. Submissions without a submitted_at
+    come first in id order. They are read separately because NULL sorts first
+    on SQLite and last on PostgreSQL, and a cursor cannot compare with it.
+    """
+    query = db.select(*(getattr(Submission, column) for column in SUBMISSION_COLUMNS)) \
+        .where(*submission_filters(assignment_id))
+    undated = query.where(Submission.submitted_at.is_(None)).order_by(Submission.id)
+    dated = query.where(Submission.submitted_at.is_not(None)).order_by(Submission.submitted_at, Submission.id)
+    if after is None:
+        return [undated, dated]
+    submitted_at, last_id = after
+    if submitted_at is None:
+        return [undated.where(Submission.id > last_id), dated]
+    return [dated.where(db.or_(
+        Submission.submitted_at > submitted_at,
+        db.and_(Submission.submitted_at == submitted_at, Submission.id > last_id),
+    ))]
+
+def teacher_assignment(assignment_id):
+    """Returns (assignment, None) for a teacher, or (None, error response)."""
+    user = current_identity()
     if not user:
-        return jsonify({"success": False, "message": "User not found"}), 404
+        return None, (jsonify({"success": False, "message": "User not found"}), 404)
     # Check if the user is a teacher
     if user.role != "teacher":
-        return jsonify({"success": False, "message": "Only teachers can view submissions"}), 403
+        return None, (jsonify({"success": False, "message": "Only teachers can view submissions"}), 403)
     # Check if the assignment exists
     assignment = Assignment.query.filter_by(id=assignment_id).first()
     if not assignment:
-        return jsonify({"success": False, "message": "Assignment not found"}), 404
-    # Fetch submissions for the assignment
-    submissions = Submission.query.filter_by(assignment_id=assignment.id).all()
-    submissions_list = [
-        {
-            "id": submission.id,
-            "student_email": submission.student_email,
-            "submitted_at": submission.submitted_at,
-            "content": submission.content,
-            "score": submission.score
-        }
-        for submission in submissions
-    ]
-    return jsonify({"success": True, "submissions": submissions_list})
+        return None, (jsonify({"success": False, "message": "Assignment not found"}), 404)
+    return assignment, None
+
+def list_submissions(assignment):
+    """One keyset page of submissions ordered by (submitted_at, id), undated ones first."""
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = decode_cursor(request.args["cursor"])
+        except ValueError:
+            return jsonify({"success": False, "message": "Invalid cursor"}), 400
+
+    rows = []
+    for query in submission_queries(assignment.id, after):
+        rows += db.session.execute(query.limit(limit + 1 - len(rows))).all()
+        if len(rows) > limit:
+            break
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].submitted_at, rows[-1].id)
+    return jsonify({
+        "success": True,
+        "submissions": [dict(zip(SUBMISSION_COLUMNS, row)) for row in rows],
+        "next_cursor": next_cursor
+    })
+
+# Protected Endpoint: Fetch submissions for a specific assignment
+# Keyset paginated: pass next_cursor back as ?cursor= to get the following page
+@app.route('/api/submissions/<assignment_id>', methods=['GET'])
+@jwt_required(locations=["cookies"])
+def fetch_submissions(assignment_id):
+    assignment, error = teacher_assignment(assignment_id)
+    if error:
+        return error
+    return list_submissions(assignment)
+
+# Protected Endpoint: Export all submissions of an assignment as CSV or NDJSON
+# Rows are streamed from a server-side cursor, so memory stays flat for any size
+@app.route('/api/submissions/<assignment_id>/export', methods=['GET'])
+@jwt_required(locations=["cookies"])
+def export_submissions(assignment_id):
+    assignment, error = teacher_assignment(assignment_id)
+    if error:
+        return error
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "ndjson"):
+        return jsonify({"success": False, "message": "format must be csv or ndjson"}), 400
+
+    queries = submission_queries(assignment.id)
+
+    def rows():
+        for query in queries:
+            for partition in db.session.execute(query.execution_options(yield_per=1000)).partitions():
+                yield from partition
+
+    lines = csv_lines if export_format == "csv" else ndjson_lines
+    response = Response(
+        stream_with_context(lines(SUBMISSION_COLUMNS, rows())),
+        mimetype="text/csv" if export_format == "csv" else "application/x-ndjson",
+    )
+    response.headers["Content-Disposition"] = \
+        f"attachment; filename=assignment-{assignment.id}-submissions.{export_format}"
+    return response
 
 # Protected Teacher Endpoint: Upload an assignment file
 @app.route('/api/teacher/upload-assignment', methods=['POST'])
 @jwt_required(locations=["cookies"])
 def upload_assignment():
-    identity = get_jwt_identity()
-    if identity.get('role') != 'teacher':
+    if caller_role() != 'teacher':
         return jsonify({"message": "Unauthorized"}), 403
 
     data = request.get_json()
@@ -324,7 +1079,12 @@ def upload_assignment():
     course = Course.query.filter_by(course_id=course_id).first()
     if not course:
         return jsonify({"success": False, "message": "Course not found"}), 404
-    
+
+    try:
+        AnswerKey.compile(content)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
     assignment = Assignment(
         title=assignment_title,
         description=assignment_description,
@@ -334,18 +1094,164 @@ def upload_assignment():
     )
     db.session.add(assignment)
     db.session.commit()
+    catalog_cache.invalidate(course_key(course.course_id))
     return jsonify({"success": True, "message": "Assignment uploaded successfully"})
 
-# Protected Teacher Endpoint: View submissions (dummy data)
+def regrade_assignment(job, assignment_id, batch_size=1000):
+    """
+    Re-scores every submission of an assignment against its current answer key.
+
+    Submissions are read in id order in batches, scored with one array
+    comparison per batch and written back with a bulk UPDATE. Item statistics
+    are accumulated along the way.
+
+    Every submission records the key version it was scored with. Any worker
+    may still write one graded with an older key after the first pass, so the
+    job keeps regrading submissions whose version is behind until none have
+    turned up for SUBMISSION_ACK_TIMEOUT, the longest a submission waits for
+    its write.
+    """
+    started = time.monotonic()
+    # From here on new submissions are graded with the current key
+    catalog_cache.invalidate(answer_key_key(assignment_id))
+    writes.flush(timeout=5)
+    assignment = db.session.get(Assignment, assignment_id)
+    answer_key = AnswerKey.compile(assignment.content)
+    version = assignment.key_version
+    total = db.session.execute(
+        db.select(db.func.count(Submission.id)).filter_by(assignment_id=assignment_id)
+    ).scalar()
+    statistics = ItemStatistics(len(answer_key))
+    processed = changed = invalid = 0
+    last_id = 0
+    # Rows scored with a newer key belong to a later regrade
+    current = db.or_(Submission.key_version.is_(None), Submission.key_version <= version)
+    behind = db.or_(Submission.key_version.is_(None), Submission.key_version < version)
+    columns = (Submission.id, Submission.content, Submission.score, Submission.key_version)
+
+    def regrade(rows):
+        nonlocal processed, changed, invalid
+        matrix, valid = answer_key.selection_matrix([row.content for row in rows])
+        correct, scores = answer_key.grade_matrix(matrix[valid])
+        statistics.add(correct, scores)
+
+        # Rows that cannot be scored keep their score but are stamped too
+        scored = dict(zip([row.id for row, ok in zip(rows, valid) if ok], map(float, scores)))
+        updates = [
+            {"id": row.id, "score": scored.get(row.id, row.score), "key_version": version}
+            for row in rows
+            if row.score != scored.get(row.id, row.score) or row.key_version != version
+        ]
+        if updates:
+            db.session.execute(db.update(Submission), updates)
+        db.session.commit()
+
+        processed += len(rows)
+        changed += sum(row.id in scored and row.score != scored[row.id] for row in rows)
+        invalid += len(rows) - len(scored)
+        job.update(progress=min(processed / total, 1.0) if total else 1.0,
+                   message=f"{processed}/{total} submissions regraded")
+
+    while True:
+        rows = db.session.execute(
+            db.select(*columns)
+            .where(Submission.assignment_id == assignment_id, Submission.id > last_id, current)
+            .order_by(Submission.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        regrade(rows)
+
+    while True:
+        writes.flush(timeout=5)
+        rows = db.session.execute(
+            db.select(*columns)
+            .where(Submission.assignment_id == assignment_id, behind)
+            .order_by(Submission.id)
+            .limit(batch_size)
+        ).all()
+        if rows:
+            regrade(rows)
+        elif time.monotonic() - started >= app.config['SUBMISSION_ACK_TIMEOUT']:
+            break
+        else:
+            time.sleep(0.5)
+
+    return {
+        "assignment_id": assignment_id,
+        "submissions": processed,
+        "changed": changed,
+        "invalid": invalid,
+        "questions": statistics.result(),
+    }
+
+# Protected Teacher Endpoint: Regrade all submissions of an assignment in the background
+@app.route('/api/teacher/assignments/<int:assignment_id>/regrade', methods=['POST'])
+@jwt_required(locations=["cookies"])
+def start_regrade(assignment_id):
+    if caller_role() != 'teacher':
+        return jsonify({"message": "Unauthorized"}), 403
+    if db.session.get(Assignment, assignment_id) is None:
+        return jsonify({"success": False, "message": "Assignment not found"}), 404
+    job = jobs.submit("regrade", regrade_assignment, assignment_id)
+    return jsonify({"success": True, "job_id": job.id}), 202
+
+# Protected Teacher Endpoint: Edit an assignment; changed questions recompile its answer key
+@app.route('/api/teacher/assignments/<int:assignment_id>', methods=['PUT'])
+@jwt_required(locations=["cookies"])
+def edit_assignment(assignment_id):
+    if caller_role() != 'teacher':
+        return jsonify({"message": "Unauthorized"}), 403
+
+    data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "message": "No data provided"}), 400
+
+    assignment = db.session.get(Assignment, assignment_id)
+    if not assignment:
+        return jsonify({"success": False, "message": "Assignment not found"}), 404
+
+    old_key = assignment.answer_key
+    if 'content' in data:
+        try:
+            AnswerKey.compile(data['content'])
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        assignment.content = data['content']
+    if data.get('title'):
+        assignment.title = data['title']
+    if 'description' in data:
+        assignment.description = data['description']
+    if data.get('due_date'):
+        assignment.due_date = datetime.strptime(data['due_date'], "%Y-%m-%dT%H:%M:%S")
+
+    key_changed = assignment.answer_key != old_key
+    db.session.commit()
+    catalog_cache.invalidate(course_key(assignment.course.course_id))
+
+    response = {"success": True, "message": "Assignment updated successfully"}
+    # Existing scores were computed against the old key
+    if key_changed:
+        response["regrade_job_id"] = jobs.submit("regrade", regrade_assignment, assignment_id).id
+    return jsonify(response)
+
+# Protected Teacher Endpoint: View submissions of an assignment (?assignment_id=)
+# Same filters and keyset pagination as /api/submissions/<assignment_id>
 @app.route('/api/teacher/view-submissions', methods=['GET'])
 @jwt_required(locations=["cookies"])
 def view_submissions():
-    identity = get_jwt_identity()
-    if identity.get('role') != 'teacher':
+    if caller_role() != 'teacher':
         return jsonify({"message": "Unauthorized"}), 403
-    
-    # TODO: get submissions
-    return jsonify(["Yet to implement end point"])
+
+    assignment_id = request.args.get("assignment_id", type=int)
+    if assignment_id is None:
+        return jsonify({"success": False, "message": "assignment_id is required"}), 400
+    assignment = db.session.get(Assignment, assignment_id)
+    if not assignment:
+        return jsonify({"success": False, "message": "Assignment not found"}), 404
+    return list_submissions(assignment)
 
 
 
@@ -353,8 +1259,7 @@ def view_submissions():
 @app.route('/api/teacher/upload-lecture', methods=['POST'])
 @jwt_required(locations=["cookies"])
 def upload_lecture():
-    identity = get_jwt_identity()
-    if identity.get('role') != 'teacher':
+    if caller_role() != 'teacher':
         return jsonify({"message": "Unauthorized"}), 403
 
     data = request.get_json()
@@ -365,6 +1270,7 @@ def upload_lecture():
     lecture_description = data.get('description')
     course_id = data.get('course_id')
     video_link = data.get('video_link')
+    transcript = data.get('transcript')
 
     if not lecture_title or not course_id or not video_link:
         return jsonify({"success": False, "message": "Missing required fields"}), 400
@@ -377,13 +1283,71 @@ def upload_lecture():
         title=lecture_title,
         description=lecture_description,
         course_id=course.id,
-        video_link=video_link
+        video_link=video_link,
+        transcript=transcript
     )
 
     db.session.add(lecture)
     db.session.commit()
+    catalog_cache.invalidate(course_key(course.course_id))
+    if lecture.transcript:
+        jobs.submit("index_transcripts", index_transcripts_job, [lecture.id])
     return jsonify({"success": True, "message": "Lecture uploaded successfully"})
 
+def index_changed():
+    """Drops everything derived from the vector store's contents after a write."""
+    rag_answers.invalidate()
+    retriever.invalidate()
+
+def index_transcripts(lecture_ids=None):
+    """
+    Indexes lecture transcripts into the vector store, scoped by course.
+
+    With no ids, every lecture whose transcript is not indexed yet is picked up,
+    so the job is incremental and safe to re-run.
+    """
+    query = Lecture.query.options(db.joinedload(Lecture.course))
+    if lecture_ids is None:
+        query = query.filter(Lecture.transcript_indexed_at.is_(None))
+    else:
+        query = query.filter(Lecture.id.in_(lecture_ids))
+    lectures = query.all()
+
+    empty = [transcript_doc_id(lecture.id) for lecture in lectures if not lecture.transcript]
+    if empty:
+        vector_store.delete_documents(empty)
+    stats = ingest_documents(
+        transcript_documents(lectures), embedder, vector_store,
+        chunk_size=app.config['RAG_CHUNK_SIZE'], overlap=app.config['RAG_CHUNK_OVERLAP'],
+    )
+
+    now = datetime.utcnow()
+    for lecture in lectures:
+        lecture.transcript_indexed_at = now
+    db.session.commit()
+    index_changed()
+    return stats
+
+@app.cli.command("index-transcripts")
+@click.option("--all", "everything", is_flag=True,
+              help="Re-index every lecture, e.g. after switching VECTOR_STORE.")
+def index_transcripts_command(everything):
+    """Index lecture transcripts that are not in the vector store yet."""
+    lecture_ids = [lecture_id for (lecture_id,) in db.session.query(Lecture.id)] if everything else None
+    print(json.dumps(index_transcripts(lecture_ids)))
+
+def index_transcripts_job(job, lecture_ids=None):
+    job.update(message="Indexing transcripts")
+    return index_transcripts(lecture_ids)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@jwt_required(locations=["cookies"])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
 @app.route("/api/rag/add_document", methods=["POST"])
 def add_document():
     data = request.json
@@ -393,10 +1357,101 @@ def add_document():
     if not doc_text or not doc_id:
         return jsonify({"error": "Missing text or id"}), 400
 
-    embedding = embed_model.encode(doc_text).tolist()
-    collection.add(ids=[doc_id], embeddings=[embedding], metadatas=[{"text": doc_text}])
+    metadata = {"course_id": data["course_id"]} if data.get("course_id") else None
+    stats = ingest_documents(
+        [{"id": doc_id, "text": doc_text, "metadata": metadata}], embedder, vector_store,
+        chunk_size=app.config['RAG_CHUNK_SIZE'], overlap=app.config['RAG_CHUNK_OVERLAP'],
+    )
+    index_changed()
+
+    return jsonify({"message": "Document added", "chunks": stats["chunks"]})
+
+# Bulk ingestion: JSON lines body, a multipart "file" upload, or {"documents": [...]}
+@app.route("/api/rag/bulk_add", methods=["POST"])
+def bulk_add_documents():
+    try:
+        chunk_size = int(request.args.get("chunk_size", app.config['RAG_CHUNK_SIZE']))
+        overlap = int(request.args.get("overlap", app.config['RAG_CHUNK_OVERLAP']))
+    except ValueError:
+        return jsonify({"error": "chunk_size and overlap must be integers"}), 400
+
+    if "file" in request.files:
+        documents = read_jsonl(request.files["file"].stream)
+    elif request.is_json:
+        data = request.get_json()
+        documents = data.get("documents", []) if isinstance(data, dict) else data
+        if not isinstance(documents, list):
+            return jsonify({"error": "documents must be a list"}), 400
+        # A JSON body is all in memory, so reject it before any document is written
+        try:
+            for number, document in enumerate(documents):
+                validate_document(number, document)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        documents = read_jsonl(request.get_data(as_text=True).splitlines())
+
+    try:
+        stats = ingest_documents(documents, embedder, vector_store, chunk_size=chunk_size, overlap=overlap)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        index_changed()
+
+    return jsonify({"message": "Documents added", **stats})
+
+@app.route("/api/rag/embedding_stats", methods=["GET"])
+def embedding_stats():
+    if not services.is_loaded("embedder"):
+        return jsonify({"state": "cold"})
+    return jsonify(embedder.stats())
+
+@app.route("/api/rag/index_stats", methods=["GET"])
+def index_stats():
+    return jsonify({**vector_store.stats(), "retrieval": retriever.stats()})
+
+@app.route("/api/metrics/llm", methods=["GET"])
+def llm_metrics():
+    return jsonify({
+        "gateway": llm.stats() if services.is_loaded("llm") else {"state": "cold"},
+        "budgets": app.config['PROMPT_BUDGETS'],
+        "num_ctx": app.config['LLM_NUM_CTX'],
+        **llm_usage.stats(),
+    })
+
+@app.route("/api/metrics/writes", methods=["GET"])
+def write_metrics():
+    return jsonify(writes.stats())
 
-    return jsonify({"message": "Document added"})
+@app.route("/api/metrics/cache", methods=["GET"])
+def cache_metrics():
+    return jsonify({
+        "catalog": catalog_cache.stats(),
+        "query_embeddings": query_embeddings.stats(),
+        "rag_answers": rag_answers.stats(),
+        "users": user_cache.stats(),
+    })
+
+@app.route("/api/rag/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "query_embeddings": query_embeddings.stats(),
+        "answers": rag_answers.stats(),
+    })
+
+def embed_query(user_query):
+    key = normalize_query(user_query)
+    embedding = query_embeddings.get(key)
+    if embedding is None:
+        embedding = embedder.encode(user_query)
+        query_embeddings.set(key, embedding)
+    return embedding
+
+def log_chat(message, course_id):
+    """Queues the question for the chat history; the request does not wait for the write."""
+    writes.enqueue(Chathistory.__table__, {
+        "user": "user", "message": message, "course_id": course_id, "created_at": datetime.utcnow(),
+    })
 
 # Function to query RAG
 @app.route("/api/rag/query", methods=["POST"])
@@ -412,25 +1467,54 @@ def query_rag():
     if check_cheating(user_query):
         return jsonify({"error": "Cheating detected"}), 403
 
-    query_embedding = embed_model.encode(user_query).tolist()
-    results = collection.query(query_embeddings=[query_embedding], n_results=5)
+    query_embedding = embed_query(user_query)
+
+    # Answers cached before the store last changed, in any worker, are misses
+    version = retriever.store_version()
+    cached = rag_answers.get(user_query, course_id, query_embedding, version)
+    if cached is not None:
+        log_chat(user_query, course_id)
+        if wants_stream(data):
+            return event_stream(stream_text_events(
+                cached["answer"],
+                preamble=[("sources", {"query": user_query, "sources": cached["sources"]})],
+                cached=True,
+            ))
+        return jsonify({
+            "query": user_query,
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "cached": True
+        })
+
+    # Only search the material of the course the student is looking at
+    with span("retrieval"):
+        hits = retriever.retrieve(
+            user_query, query_embedding, k=app.config['RAG_TOP_K'],
+            where={"course_id": course.course_id} if course else None,
+        )
 
-    retrieved_docs = [doc["text"] for doc in results["metadatas"][0]]
-    context = "\n".join(retrieved_docs)
+    # Overlapping chunks are merged and the context is cut to the route's token budget
+    messages, retrieved_docs = prompts.rag(user_query, hits, course)
 
-    # Pass retrieved context to LLM
-    response = client.chat(model=MODEL, messages=[
-    {"role": "system", "content": "Use the context to answer accurately in less than 4 lines."},
-    {"role": "user", "content": f"Context: {context+str(course)}\nQuestion: {user_query}"}
-])
+    log_chat(user_query, course_id)
 
-    chat = Chathistory(user="user", message=user_query)
-    db.session.add(chat)
-    db.session.commit()
+    if wants_stream(data):
+        chunks = llm.stream_chat("rag", model=MODEL, messages=messages)
+        return event_stream(stream_chat_events(
+            chunks, preamble=[("sources", {"query": user_query, "sources": retrieved_docs})],
+            on_complete=lambda answer: rag_answers.set(
+                user_query, course_id, query_embedding, answer, retrieved_docs, version),
+        ))
+
+    # Pass retrieved context to LLM
+    response = llm.chat("rag", model=MODEL, messages=messages)
+    answer = clean_answer(response["message"]["content"])
+    rag_answers.set(user_query, course_id, query_embedding, answer, retrieved_docs, version)
 
     return jsonify({
         "query": user_query,
-        "answer": clean_answer(response["message"]["content"]),
+        "answer": answer,
         "sources": retrieved_docs
     })
 
@@ -442,31 +1526,308 @@ def query_llm():
     if not user_query:
         return jsonify({"error": "Missing query"}), 400
 
-    response = client.chat(model=MODEL, messages=[
-        {"role": "user", "content": user_query}
-    ])
+    messages = prompts.llm(user_query)
+
+    if wants_stream(data):
+        chunks = llm.stream_chat("llm", model=MODEL, messages=messages)
+        return event_stream(stream_chat_events(
+            chunks, preamble=[("query", {"query": user_query})]
+        ))
+
+    response = llm.chat("llm", model=MODEL, messages=messages)
 
     return jsonify({
         "query": user_query,
         "answer": response["message"]["content"]
     })
 
-# Function to get summary of chat history
+def chat_history_filters(course_id, since, until):
+    filters = []
+    if course_id:
+        filters.append(Chathistory.course_id == course_id)
+    if since:
+        filters.append(Chathistory.created_at >= since)
+    if until:
+        filters.append(Chathistory.created_at < until)
+    return filters
+
+def chat_history_after(filters, last_id, page_size=500):
+    """(id, message) rows after the high-water mark, read page by page."""
+    while True:
+        rows = db.session.execute(
+            db.select(Chathistory.id, Chathistory.message)
+            .where(Chathistory.id > last_id, *filters)
+            .order_by(Chathistory.id)
+            .limit(page_size)
+        ).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+def claim_lease(name):
+    """
+    Takes the named JobLease unless another holder's has not expired yet;
+    returns the holder token to renew and release it with, or None.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
+    holder = uuid.uuid4().hex
+    current = db.session.execute(db.select(JobLease.expires_at).filter_by(name=name)).scalar()
+    if current is None:
+        try:
+            db.session.execute(db.insert(JobLease).values(name=name, holder=holder, expires_at=expires_at))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker inserted it first
+            db.session.rollback()
+            return None
+        return holder
+    if current > now:
+        db.session.rollback()
+        return None
+    claimed = db.session.execute(
+        db.update(JobLease).where(JobLease.name == name, JobLease.expires_at == current)
+        .values(holder=holder, expires_at=expires_at)
+    ).rowcount
+    db.session.commit()
+    return holder if claimed else None
+
+def renew_lease(name, holder):
+    """Extends a lease in the current transaction; False if it expired and was taken over."""
+    expires_at = datetime.utcnow() + timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
+    return bool(db.session.execute(
+        db.update(JobLease).where(JobLease.name == name, JobLease.holder == holder).values(expires_at=expires_at)
+    ).rowcount)
+
+def release_lease(name, holder):
+    db.session.rollback()
+    db.session.execute(db.delete(JobLease).where(JobLease.name == name, JobLease.holder == holder))
+    db.session.commit()
+
+def summary_lease(scope):
+    return f"chat_summary:{scope}"
+
+def summarize_chat_history(job, scope, course_id, since, until, holder):
+    """
+    Folds messages newer than the scope's high-water mark into its stored
+    summary. The caller holds the scope's lease, which keeps other workers
+    from folding the same messages; it is renewed with every saved window.
+    """
+    try:
+        writes.flush(timeout=5)
+        summary = ChatSummary.query.filter_by(scope=scope).first()
+        if summary is None:
+            summary = ChatSummary(scope=scope, last_message_id=0)
+            db.session.add(summary)
+            db.session.commit()
+
+        def chat(messages):
+            response = llm.chat("chat_history", model=MODEL, messages=messages)
+            return clean_answer(response["message"]["content"])
+
+        def save(text, last_id):
+            if not renew_lease(summary_lease(scope), holder):
+                db.session.rollback()
+                raise RuntimeError("The lease ran out and another worker took over this summary")
+            summary.summary = text
+            summary.last_message_id = last_id
+            summary.updated_at = datetime.utcnow()
+            db.session.commit()
+            job.update(message=f"Summarized through message {last_id}")
+
+        rows = chat_history_after(chat_history_filters(course_id, since, until), summary.last_message_id)
+        windowed = windows(rows, max_chars=prompts.window_chars("chat_history"))
+        fold(chat, summary.summary, windowed, on_progress=save)
+        return {"scope": scope, "last_message_id": summary.last_message_id}
+    finally:
+        release_lease(summary_lease(scope), holder)
+
+def parse_time_arg(name):
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+# Summary of chat history, optionally scoped by ?course= and ?since=&until= (ISO dates).
+# The stored summary is returned immediately; messages that arrived since it
+# was written are folded in by a background job, one per scope across all workers.
 @app.route("/api/chat_history", methods=["GET"])
 def get_chat_history():
-    chat_history = Chathistory.query.all() 
-    chat_history = [chat.message for chat in chat_history]
+    course_id = request.args.get("course")
+    try:
+        since, until = parse_time_arg("since"), parse_time_arg("until")
+    except ValueError:
+        return jsonify({"error": "since and until must be ISO dates"}), 400
+    scope = f"course={course_id or '*'}|since={since.isoformat() if since else ''}|until={until.isoformat() if until else ''}"
+
+    summary = ChatSummary.query.filter_by(scope=scope).first()
+    last_id = summary.last_message_id if summary else 0
+    pending = db.session.execute(
+        db.select(db.func.count(Chathistory.id))
+        .where(Chathistory.id > last_id, *chat_history_filters(course_id, since, until))
+    ).scalar()
+
+    # Read before claiming the lease, whose commit expires the loaded row
+    result = {
+        "answer": summary.summary if summary and summary.summary else "",
+        "updated_at": summary.updated_at if summary else None,
+        "pending_messages": pending,
+        "refreshing": bool(pending)
+    }
+    if pending:
+        holder = claim_lease(summary_lease(scope))
+        if holder:
+            jobs.submit("summarize_chat_history", summarize_chat_history, scope, course_id, since, until, holder)
+    return jsonify(result)
 
-    response = client.chat(model=MODEL, messages=[
-    {"role": "system", "content": "Use the context to answer accurately in less than 4 lines."},
-    {"role": "user", "content": f"Chat history: {chat_history}\nQuestion: Can summarise the chat history? with information like which topics is frequently queried"}])
-    return jsonify({"answer": clean_answer(response["message"]["content"])})
+# ------------------
+# Topic analytics: chat messages are embedded once, kept in memory and
+# clustered on request; each cluster is labelled with the nearest indexed chunk
+app.config['TOPIC_EMBED_BATCH'] = int(os.environ.get('TOPIC_EMBED_BATCH', 256))
+app.config['TOPICS_MAX_K'] = int(os.environ.get('TOPICS_MAX_K', 12))
+chat_vectors = ChatVectorIndex()
+topic_reports = LRUCache(maxsize=64)
+CHAT_EMBEDDING_LEASE = "chat_embeddings"
+
+def embed_chat_history(job, holder):
+    """
+    Embeds chat messages newer than the last stored vector, oldest first. The
+    caller holds CHAT_EMBEDDING_LEASE, so one worker embeds at a time; the
+    lease is renewed with every batch.
+    """
+    try:
+        writes.flush(timeout=5)
+        last_id = db.session.execute(db.select(db.func.max(ChatEmbedding.chathistory_id))).scalar() or 0
+        embedded = 0
+        while True:
+            rows = db.session.execute(
+                db.select(Chathistory.id, Chathistory.message)
+                .where(Chathistory.id > last_id)
+                .order_by(Chathistory.id)
+                .limit(app.config['TOPIC_EMBED_BATCH'])
+            ).all()
+            if not rows:
+                return {"embedded": embedded, "last_message_id": last_id}
+            vectors = unit_rows(embedder.encode([row.message for row in rows]))
+            if not renew_lease(CHAT_EMBEDDING_LEASE, holder):
+                db.session.rollback()
+                raise RuntimeError("The lease ran out and another worker took over embedding")
+            db.session.execute(db.insert(ChatEmbedding), [
+                {"chathistory_id": row.id, "vector": vector.tobytes()} for row, vector in zip(rows, vectors)
+            ])
+            db.session.commit()
+            last_id = rows[-1].id
+            embedded += len(rows)
+            job.update(message=f"Embedded through message {last_id}")
+    finally:
+        release_lease(CHAT_EMBEDDING_LEASE, holder)
+
+def stored_chat_vectors(last_id):
+    return db.session.execute(
+        db.select(ChatEmbedding.chathistory_id, Chathistory.course_id,
+                  Chathistory.created_at, ChatEmbedding.vector)
+        .join(Chathistory, Chathistory.id == ChatEmbedding.chathistory_id)
+        .where(ChatEmbedding.chathistory_id > last_id)
+        .order_by(ChatEmbedding.chathistory_id)
+    ).all()
+
+def label_topic(centroid, course_id):
+    """The indexed chunk closest to the cluster centre, as (label, doc_id)."""
+    hits = vector_store.query(centroid, k=1, where={"course_id": course_id} if course_id else None)
+    if not hits:
+        return None, None
+    metadata = hits[0]["metadata"]
+    text = " ".join(metadata.get("text", "").split())
+    label = metadata.get("title") or (text[:80] + ("..." if len(text) > 80 else ""))
+    return label, metadata.get("doc_id")
+
+def topic_report(course_id, since, until, k):
+    ids, created, vectors = chat_vectors.select(course_id, since, until)
+    clusters = topic_clusters(ids, created, vectors, k, now=datetime.utcnow(), max_k=app.config['TOPICS_MAX_K'])
+    examples = dict(db.session.execute(
+        db.select(Chathistory.id, Chathistory.message)
+        .where(Chathistory.id.in_([cluster["representative_id"] for cluster in clusters]))
+    ).all())
+    topics = []
+    for cluster in clusters:
+        label, source = label_topic(cluster.pop("centroid"), course_id)
+        topics.append({
+            "label": label,
+            "source": source,
+            "example": examples.get(cluster.pop("representative_id")),
+            "share": round(cluster["count"] / len(ids), 4),
+            **cluster,
+        })
+    return {"messages": len(ids), "topics": topics}
+
+def describe_topics(topics):
+    lines = "\n".join(
+        f"- {topic['label'] or topic['example']}: {topic['count']} questions "
+        f"({topic.get('recent', 0)} this week, {topic.get('previous', 0)} the week before)"
+        for topic in topics
+    )
+    response = llm.chat("chat_history", model=MODEL, messages=[
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Topics students asked about:\n{lines}\n"
+                                    "Question: Summarize which topics are frequently queried and how that is changing."},
+    ])
+    return clean_answer(response["message"]["content"])
+
+# Topic counts and trends, scoped like /api/chat_history; ?k= fixes the number
+# of topics and ?prose=1 adds an LLM-written summary of the table.
+@app.route("/api/analytics/topics", methods=["GET"])
+def get_topics():
+    course_id = request.args.get("course")
+    try:
+        since, until = parse_time_arg("since"), parse_time_arg("until")
+        k = int(request.args["k"]) if request.args.get("k") else None
+    except ValueError:
+        return jsonify({"error": "since and until must be ISO dates and k an integer"}), 400
+
+    chat_vectors.refresh(stored_chat_vectors)
+    pending = db.session.execute(
+        db.select(db.func.count(Chathistory.id)).where(Chathistory.id > chat_vectors.last_id)
+    ).scalar()
+    if pending:
+        holder = claim_lease(CHAT_EMBEDDING_LEASE)
+        if holder:
+            jobs.submit("embed_chat_history", embed_chat_history, holder)
+
+    key = (course_id, since, until, k, chat_vectors.last_id)
+    report = topic_reports.get(key)
+    if report is None:
+        report = topic_report(course_id, since, until, k)
+        topic_reports.set(key, report)
+
+    result = {**report, "pending_messages": pending, "refreshing": bool(pending)}
+    if request.args.get("prose") in ("1", "true") and report["topics"]:
+        result["summary"] = describe_topics(report["topics"])
+    return jsonify(result)
 
 # Health Check
 @app.route("/api/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "ok"})
 
+# Readiness: 200 once every heavy service is loaded, 503 while any is cold.
+# POST loads them (the same as starting with WARMUP=1); it loads models and
+# calls the LLM, so it needs "Authorization: Bearer <WARMUP_TOKEN>".
+@app.route("/api/ready", methods=["GET", "POST"])
+def readiness():
+    if request.method == "POST":
+        token = app.config['WARMUP_TOKEN']
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not token or not hmac.compare_digest(given.encode(), token.encode()):
+            return jsonify({"error": "Warmup needs the WARMUP_TOKEN bearer token"}), 403
+    status = services.warmup() if request.method == "POST" else services.status()
+    ready = all(service["state"] == "warm" for service in status.values())
+    return jsonify({"ready": ready, "services": status}), 200 if ready else 503
+
+@app.cli.command("warmup")
+def warmup_command():
+    """Load the LLM, embedding model and vector store now instead of on first use."""
+    for name, service in services.warmup().items():
+        print(f"{name}: {service['state']} {service['error'] or service['load_ms']}")
+
 # Serve static files (e.g., lecture videos) from the "public" folder
 @app.route('/static/<path:filename>', methods=['GET'])
 def serve_static(filename):
@@ -0,0 +1,110 @@
+# auth.py
+"""
+Password hashing and caller identity.
+
+Hashing is deliberately slow, so a login storm (everyone signing in when an
+exam opens) can take every CPU. PasswordHasher runs hashes on a small thread
+pool; hashlib releases the GIL while it works, so the pool spreads over the
+cores, and calls beyond the pool and its queue fail fast with HashingBusy
+instead of piling up behind each other.
+"""
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import percentile
+
+# What a protected route needs to know about its caller
+Identity = namedtuple("Identity", "email user_id role")
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool and its queue are full."""
+
+
+def hash_method(password_hash):
+    """The method part of a werkzeug hash, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"."""
+    return password_hash.split("$", 1)[0] if password_hash else None
+
+
+class PasswordHasher:
+    """
+    werkzeug password hashing with a configurable method on a bounded pool.
+
+    `method` is anything generate_password_hash accepts ("scrypt",
+    "scrypt:16384:8:1", "pbkdf2:sha256:200000", ...). Hashes made with another
+    method still verify; needs_rehash() tells the caller to store a new one.
+    """
+
+    def __init__(self, method="scrypt", workers=None, max_queue=64):
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._current_method = None
+        self._hashes = 0
+        self._verifies = 0
+        self._rejected = 0
+        self._latencies = deque(maxlen=1000)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        if not password_hash or password is None:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        if self._current_method is None:
+            # Methods like "scrypt" expand to their full parameters only in a hash
+            self._current_method = hash_method(generate_password_hash("", self.method))
+        return hash_method(password_hash) != self._current_method
+
+    def _pool(self):
+        # Pool threads do not survive a fork; each worker process starts its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy()
+        try:
+            start = time.perf_counter()
+            result = self._pool().submit(fn, *args).result()
+            with self._lock:
+                if fn is generate_password_hash:
+                    self._hashes += 1
+                else:
+                    self._verifies += 1
+                self._latencies.append(time.perf_counter() - start)
+            return result
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "hashes": self._hashes,
+                "verifies": self._verifies,
+                "rejected": self._rejected,
+                "p50_ms": percentile(latencies, 50),
+                "p99_ms": percentile(latencies, 99),
+            }
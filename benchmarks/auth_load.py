@@ -0,0 +1,158 @@
+# benchmarks/auth_load.py
+"""
+Login throughput and the cost of resolving the caller on protected routes.
+
+Logins: `--clients` threads post /api/login for `--seconds` against one user
+whose password was hashed with each `--methods` entry, for each hashing
+pool size in `--pools`. Reports logins/s, p50/p99 latency and how many were
+turned away with 429 because the pool and its queue were full.
+
+Protected routes: GET /api/teacher/view-submissions without an assignment
+id, which answers 400 right after the role check, so the time is the JWT
+check plus identity resolution. Modes:
+
+  claims    role and user id taken from the signed token (the default)
+  cached    AUTH_TRUST_CLAIMS=0, User looked up through the user cache
+  database  AUTH_TRUST_CLAIMS=0 with the cache disabled: one query per request
+
+Runs against a temporary SQLite database; the LLM and models are never loaded.
+
+Usage:
+    python benchmarks/auth_load.py [--methods scrypt,pbkdf2:sha256:600000,pbkdf2:sha256:100000]
+                                   [--pools 1,4] [--clients 16] [--seconds 5] [--requests 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DIRECTORY = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORY, 'auth.db')}"
+
+import app as course_app  # noqa: E402
+from auth import PasswordHasher  # noqa: E402
+from cache import MemoryBackend  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+EMAIL = "teacher@example.com"
+PASSWORD = "correct horse battery staple"
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies) * 1000
+    if not len(latencies):
+        return {"p50_ms": None, "p99_ms": None}
+    return {"p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2)}
+
+
+def setup():
+    with course_app.app.app_context():
+        course_app.db.create_all()
+        teacher = course_app.User(email=EMAIL, role="teacher")
+        teacher.set_password(PASSWORD)
+        course_app.db.session.add(teacher)
+        course_app.db.session.commit()
+
+
+def set_method(method, pool, clients):
+    course_app.passwords = PasswordHasher(method, workers=pool, max_queue=clients)
+    with course_app.app.app_context():
+        teacher = course_app.User.query.filter_by(email=EMAIL).first()
+        teacher.set_password(PASSWORD)
+        course_app.db.session.commit()
+
+
+def logins(method, pool, clients, seconds):
+    set_method(method, pool, clients)
+    statuses, latencies = {}, []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        http = course_app.app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = http.post("/api/login", json={"email": EMAIL, "password": PASSWORD, "role": "teacher"})
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "method": method,
+        "pool": pool,
+        "clients": clients,
+        "logins_per_sec": round(statuses.get(200, 0) / elapsed, 1),
+        "rejected": statuses.get(429, 0),
+        **percentiles(latencies),
+    }
+
+
+def protected(mode, requests):
+    config = course_app.app.config
+    config["AUTH_TRUST_CLAIMS"] = mode == "claims"
+    # A fresh, process-local identity cache; one that holds nothing for "database"
+    course_app.user_cache.backend = MemoryBackend(
+        maxsize=0 if mode == "database" else config["USER_CACHE_SIZE"], ttl=config["USER_CACHE_TTL"])
+    with course_app.app.app_context():
+        user_id = course_app.User.query.filter_by(email=EMAIL).first().id
+        token = create_access_token(identity=EMAIL, additional_claims={"role": "teacher", "uid": user_id})
+    http = course_app.app.test_client()
+    http.set_cookie("access_token_cookie", token)
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = http.get("/api/teacher/view-submissions")
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 400, response.get_data(as_text=True)
+    return {
+        "mode": mode,
+        "requests_per_sec": round(len(latencies) / sum(latencies), 1),
+        "mean_us": round(sum(latencies) / len(latencies) * 1e6, 1),
+        **percentiles(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--methods", default="scrypt,pbkdf2:sha256:600000,pbkdf2:sha256:100000")
+    parser.add_argument("--pools", default=",".join(sorted({"1", str(os.cpu_count())})))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    setup()
+    report = {"logins": [], "protected": []}
+    for method in args.methods.split(","):
+        for pool in [int(p) for p in args.pools.split(",")]:
+            row = logins(method, pool, args.clients, args.seconds)
+            print(f"login {method:24} pool={pool:<3} {row['logins_per_sec']:>8.1f} logins/s  "
+                  f"p50 {row['p50_ms']} ms  p99 {row['p99_ms']} ms  rejected={row['rejected']}")
+            report["logins"].append(row)
+    for mode in ("claims", "cached", "database"):
+        row = protected(mode, args.requests)
+        print(f"route {mode:10} {row['requests_per_sec']:>9.1f} req/s  mean {row['mean_us']} us  "
+              f"p99 {row['p99_ms']} ms")
+        report["protected"].append(row)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
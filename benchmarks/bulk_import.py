@@ -0,0 +1,129 @@
+# benchmarks/bulk_import.py
+"""
+Throughput of bulk_load.py on generated CSV/JSON lines files.
+
+Writes synthetic users, courses, enrollments, lectures, assignments and
+`--submissions` submissions to a temporary directory, loads them into a
+temporary SQLite database (or --database-url), then loads the same files
+again to measure the idempotent re-run, where every row is matched and
+left unchanged. Transcripts are embedded with EMBED_MODE=hashing.
+
+Usage:
+    python benchmarks/bulk_import.py [--submissions 1000000] [--users 20000] [--courses 200]
+                                     [--batch-size 10000] [--database-url postgresql://...]
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DIRECTORY = tempfile.mkdtemp()
+os.environ.setdefault("EMBED_MODE", "hashing")
+os.environ.setdefault("VECTOR_STORE", "numpy")
+os.environ.setdefault("VECTOR_STORE_PATH", os.path.join(DIRECTORY, "vector_index"))
+
+
+def write_csv(path, fields, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    return path
+
+
+def generate(directory, users, courses, lectures, assignments, submissions, enrollments, seed=0):
+    from seed import SUBJECTS, synthetic_questions, synthetic_transcript
+
+    rng = random.Random(seed)
+    subjects = list(SUBJECTS)
+    codes = [f"bulk-{i}" for i in range(courses)]
+    files = {
+        "users": write_csv(os.path.join(directory, "users.csv"), ["email", "role", "password"],
+                           ({"email": f"bulk{i}@example.com", "role": "student", "password": "password"}
+                            for i in range(users))),
+        "courses": write_jsonl(os.path.join(directory, "courses.jsonl"),
+                               ({"course_id": code, "name": f"{subjects[i % len(subjects)]} {i}",
+                                 "description": "Bulk-loaded course"} for i, code in enumerate(codes))),
+    }
+    enrolled = [(i, rng.sample(codes, min(enrollments, courses))) for i in range(users)]
+    files["enrollments"] = write_csv(os.path.join(directory, "enrollments.csv"), ["email", "course_id"],
+                                     ({"email": f"bulk{i}@example.com", "course_id": code}
+                                      for i, chosen in enrolled for code in chosen))
+    topics = {code: SUBJECTS[subjects[i % len(subjects)]] for i, code in enumerate(codes)}
+    files["lectures"] = write_jsonl(os.path.join(directory, "lectures.jsonl"), (
+        {"course_id": code, "title": f"Lecture {n + 1}", "video_link": f"https://example.com/{code}/{n}",
+         "transcript": synthetic_transcript(rng, topics[code])}
+        for code in codes for n in range(lectures)))
+    due = (datetime.datetime.now() + datetime.timedelta(days=365)).isoformat()
+    files["assignments"] = write_jsonl(os.path.join(directory, "assignments.jsonl"), (
+        {"course_id": code, "title": f"Assignment {n + 1}", "due_date": due,
+         "content": synthetic_questions(rng, topics[code])}
+        for code in codes for n in range(assignments)))
+
+    start = datetime.datetime(2025, 1, 1)
+
+    def submission_rows():
+        for number in range(submissions):
+            student, chosen = enrolled[rng.randrange(users)]
+            yield {"email": f"bulk{student}@example.com", "course_id": rng.choice(chosen),
+                   "assignment": f"Assignment {rng.randrange(assignments) + 1}",
+                   "submitted_at": (start + datetime.timedelta(seconds=number)).isoformat(),
+                   "content": json.dumps([rng.randrange(4) for _ in range(5)])}
+    files["submissions"] = write_csv(os.path.join(directory, "submissions.csv"),
+                                     ["email", "course_id", "assignment", "submitted_at", "content"],
+                                     submission_rows())
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submissions", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--lectures", type=int, default=4)
+    parser.add_argument("--assignments", type=int, default=3)
+    parser.add_argument("--enrollments", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(DIRECTORY, 'bulk.db')}"
+    from app import app, db
+    from bulk_load import bulk_load
+
+    start = time.perf_counter()
+    files = generate(DIRECTORY, args.users, args.courses, args.lectures, args.assignments,
+                     args.submissions, args.enrollments)
+    print(f"generated files in {time.perf_counter() - start:.1f}s")
+
+    with app.app_context():
+        db.create_all()
+        report = {}
+        for run in ("first", "rerun"):
+            report[run] = bulk_load(files, args.batch_size)
+            for table in report[run]["tables"]:
+                print(f"{run:6} {table['table']:12} {table['rows']:>9} rows  {table['seconds']:>8}s  "
+                      f"{table['rows_per_sec']:>10} rows/s  inserted {table['inserted']}  "
+                      f"unchanged {table['unchanged']}  rejected {table['rejected']}")
+            if "indexed" in report[run]:
+                print(f"{run:6} transcripts  {report[run]['indexed']}")
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# benchmarks/embedding_memory.py
+"""
+Memory and throughput of the embedding deployment modes with N workers.
+
+  per-process  every worker loads its own model (the EMBED_MODE=local design)
+  preload      the model is loaded once and the workers are forked from it
+  sidecar      one embed_server.py process; workers are thin socket clients
+
+Each worker encodes batches of sentences for a fixed time, then reports its
+queries per second and its memory from /proc (Linux): RSS, PSS (shared pages
+split between the processes that map them) and USS (private pages). Total
+PSS across the workers, plus the sidecar, is the real cost of a mode.
+
+Usage:
+    python benchmarks/embedding_memory.py [--workers 4] [--seconds 10] [--batch 8]
+                                          [--modes per-process,preload,sidecar]
+                                          [--model sentence-transformers/all-mpnet-base-v2]
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from embedding import RemoteEmbedder, set_torch_threads  # noqa: E402
+
+SENTENCES = [
+    "What is the difference between prokaryotic and eukaryotic cells?",
+    "Explain how mitochondria produce energy for the cell.",
+    "How does natural selection lead to evolution?",
+    "What role do ribosomes play in protein synthesis?",
+    "Describe the structure of DNA and how it replicates.",
+    "Why is biodiversity important for ecosystems?",
+    "What happens during photosynthesis in plant cells?",
+    "How do predators and prey populations affect each other?",
+]
+
+# Set in the parent before forking workers in preload mode
+PRELOADED = None
+
+
+def load_model(name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+def memory(pid="self"):
+    """RSS, PSS and USS of a process in MB, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_mb": round(fields["Rss"] / 1024, 1),
+        "pss_mb": round(fields["Pss"] / 1024, 1),
+        "uss_mb": round((fields["Private_Clean"] + fields["Private_Dirty"]) / 1024, 1),
+    }
+
+
+def drive(encode, seconds, batch):
+    texts = (SENTENCES * (batch // len(SENTENCES) + 1))[:batch]
+    encode(texts)  # first call allocates buffers; not timed
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        encode(texts)
+        done += batch
+    return done / (time.perf_counter() - start)
+
+
+def worker(mode, model_name, socket_path, threads, seconds, batch, start_barrier, results):
+    if mode == "sidecar":
+        encode = RemoteEmbedder(socket_path).encode
+    else:
+        model = PRELOADED if mode == "preload" else load_model(model_name)
+        set_torch_threads(threads)
+        encode = model.encode
+    start_barrier.wait()
+    qps = drive(encode, seconds, batch)
+    results.put({"qps": qps, **memory()})
+
+
+def start_sidecar(model_name, socket_path, threads):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "embed_server.py"), "--socket", socket_path,
+         "--model", model_name, "--threads", str(threads)],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 300
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.time() > deadline:
+            raise RuntimeError("embed_server.py did not start")
+        time.sleep(0.2)
+    return process
+
+
+def run(mode, args):
+    global PRELOADED
+    # Preloading needs fork; the other modes spawn clean interpreters like fresh workers
+    context = multiprocessing.get_context("fork" if mode == "preload" else "spawn")
+    threads = max(1, os.cpu_count() // args.workers)
+    sidecar = None
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, "embed.sock")
+        if mode == "preload":
+            PRELOADED = load_model(args.model)
+            gc.freeze()
+        elif mode == "sidecar":
+            # The sidecar serves every worker, so it gets every core
+            sidecar = start_sidecar(args.model, socket_path, os.cpu_count())
+
+        results = context.Queue()
+        barrier = context.Barrier(args.workers)
+        processes = [
+            context.Process(target=worker, args=(mode, args.model, socket_path, threads,
+                                                 args.seconds, args.batch, barrier, results))
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        extra = {}
+        if sidecar:
+            extra = {"sidecar_" + key: value for key, value in memory(sidecar.pid).items()}
+            sidecar.terminate()
+            sidecar.wait()
+        if mode == "preload":
+            extra = {"master_" + key: value for key, value in memory().items()}
+            PRELOADED = None
+            gc.unfreeze()
+            gc.collect()
+
+    total_pss = sum(row["pss_mb"] for row in rows) + extra.get("sidecar_pss_mb", 0) + extra.get("master_pss_mb", 0)
+    return {
+        "mode": mode,
+        "workers": args.workers,
+        "qps": round(sum(row["qps"] for row in rows), 1),
+        "worker_rss_mb": round(sum(row["rss_mb"] for row in rows) / len(rows), 1),
+        "worker_uss_mb": round(sum(row["uss_mb"] for row in rows) / len(rows), 1),
+        "total_pss_mb": round(total_pss, 1),
+        **extra,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=8, help="sentences per encode call")
+    parser.add_argument("--modes", default="per-process,preload,sidecar")
+    parser.add_argument("--model", default=os.environ.get("EMBED_MODEL", "sentence-transformers/all-mpnet-base-v2"))
+    args = parser.parse_args(argv)
+
+    report = []
+    for mode in args.modes.split(","):
+        row = run(mode, args)
+        print(f"{mode:12} workers={row['workers']:<3} {row['qps']:>8.1f} sentences/s  "
+              f"worker RSS {row['worker_rss_mb']:>7.1f} MB  USS {row['worker_uss_mb']:>7.1f} MB  "
+              f"total PSS {row['total_pss_mb']:>7.1f} MB")
+        report.append(row)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/fake_ollama.py
+"""
+Stand-in for the Ollama HTTP API, for benchmarks and offline runs.
+
+Serves the calls the app makes: GET /api/tags, POST /api/pull and
+POST /api/chat, streamed or not. A chat answer takes
+    latency + prompt tokens / prefill rate + answer tokens / token rate
+and reports prompt_eval_count, eval_count and their durations the way Ollama
+does. Prompt tokens are estimated as characters / 4.
+
+Usage:
+    python benchmarks/fake_ollama.py [--port 9999] [--latency-ms 50] [--prefill-rate 2000]
+                                     [--token-rate 50] [--tokens 40]
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODEL = "deepseek-r1:1.5b"
+WORDS = ("cells use energy from food and the answer depends on the context given in the lecture "
+         "notes so review them before the next assignment").split()
+
+
+class FakeOllama(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=9999, latency_ms=50, prefill_rate=2000, token_rate=50, tokens=40, model=MODEL):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.latency = latency_ms / 1000
+        self.prefill_rate = prefill_rate
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.model = model
+        self.calls = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            now = datetime.now(timezone.utc).isoformat()
+            self._json({"models": [{"model": self.server.model, "name": self.server.model, "modified_at": now,
+                                    "digest": "0" * 64, "size": 1, "details": {}}]})
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = self._body()
+        if self.path == "/api/pull":
+            self._json({"status": "success"})
+        elif self.path == "/api/chat":
+            self.server.calls += 1
+            self._chat(body)
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def _chat(self, body):
+        server = self.server
+        prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", [])) // 4 + 1
+        prefill = server.latency + prompt_tokens / server.prefill_rate
+        per_token = 1 / server.token_rate
+        words = ["<think>Looking", "at", "the", "context.</think>"] + \
+            [WORDS[i % len(WORDS)] for i in range(max(server.tokens - 4, 1))]
+        final = {
+            "model": server.model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill * 1e9),
+            "eval_count": len(words),
+            "eval_duration": int(len(words) * per_token * 1e9),
+            "total_duration": int((prefill + len(words) * per_token) * 1e9),
+        }
+        time.sleep(prefill)
+        if not body.get("stream", True):
+            time.sleep(len(words) * per_token)
+            self._json({**final, "message": {"role": "assistant", "content": " ".join(words)}})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(per_token)
+            self._chunk({"model": server.model, "created_at": final["created_at"], "done": False,
+                         "message": {"role": "assistant", "content": word if i == 0 else " " + word}})
+        self._chunk({**final, "message": {"role": "assistant", "content": ""}})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, payload):
+        data = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency-ms", type=float, default=50, help="fixed time before the first token")
+    parser.add_argument("--prefill-rate", type=float, default=2000, help="prompt tokens evaluated per second")
+    parser.add_argument("--token-rate", type=float, default=50, help="answer tokens generated per second")
+    parser.add_argument("--tokens", type=int, default=40, help="answer length in tokens")
+    args = parser.parse_args(argv)
+    server = FakeOllama(args.port, args.latency_ms, args.prefill_rate, args.token_rate, args.tokens)
+    print(f"Fake Ollama listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
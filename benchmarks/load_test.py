@@ -0,0 +1,336 @@
+# benchmarks/load_test.py
+"""
+End-to-end load test of the real endpoints, runnable offline.
+
+Everything the app depends on is replaced by a local stand-in: a temporary
+SQLite database filled by `seed.py --synthetic`, EMBED_MODE=hashing instead
+of the sentence-transformers model, the numpy vector store, and
+benchmarks/fake_ollama.py instead of Ollama. The app itself runs unmodified
+in a separate process, under the Flask development server or gunicorn.
+
+Each scenario runs for --seconds with --concurrency virtual students. Every
+student logs in once, then repeats the scenario's request:
+
+  login         POST /api/login
+  courses       GET  /api/courses
+  course        GET  /api/course/<course_id>
+  submit        POST /api/submit_assignment/<course_id>/<assignment_id>
+  rag           POST /api/rag/query (random questions about the course's topics)
+  chat_history  GET  /api/chat_history?course=<course_id>
+
+The report has requests/s, error count and p50/p95/p99 latency per scenario,
+and the server's RSS/PSS after the run. With --baseline, a previous --output
+file is compared and the exit status is 1 if any scenario's p95 rose or its
+throughput fell by more than --tolerance.
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 16] [--seconds 10] [--scenarios login,courses,...]
+                                   [--server flask|gunicorn] [--workers 2]
+                                   [--users 1000] [--courses 50] [--submissions 10000]
+                                   [--llm-latency-ms 50] [--token-rate 200] [--tokens 40]
+                                   [--output report.json] [--baseline report.json] [--tolerance 0.25]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, BENCHMARKS)
+
+from embedding_memory import memory  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+
+SCENARIOS = ["login", "courses", "course", "submit", "rag", "chat_history"]
+QUESTIONS = ["What is {topic}?", "How does {topic} relate to the rest of the unit?",
+             "Can you explain {topic} with an example?", "Why does {topic} matter?"]
+TOPIC = re.compile(r"which statement about (.+) is true\?")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 2) if len(latencies) else None
+
+
+# ------------------
+# Server under test
+# ------------------
+
+def prepare(directory, args, ollama_url):
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'load.db')}",
+        "EMBED_MODE": "hashing",
+        "VECTOR_STORE": "numpy",
+        "VECTOR_STORE_PATH": os.path.join(directory, "vector_index"),
+        "OLLAMA_HOST": ollama_url,
+        "CACHE_URL": "memory://",
+    }
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "db", "upgrade"],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+    seeded = subprocess.run(
+        [sys.executable, "seed.py", "--synthetic", "--index", "--users", str(args.users),
+         "--courses", str(args.courses), "--submissions", str(args.submissions)],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    )
+    print(f"seeded: {seeded.stdout.strip().splitlines()[-1]}")
+    return env
+
+
+def start_server(directory, env, args, port):
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+        env = {**env, "GUNICORN_BIND": f"127.0.0.1:{port}", "WEB_CONCURRENCY": str(args.workers),
+               "GUNICORN_THREADS": str(max(4, args.concurrency // args.workers))}
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"]
+    # The access log goes to a file: an unread pipe fills up and stalls the server
+    log_path = os.path.join(directory, "server.log")
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            with open(log_path, encoding="utf-8", errors="replace") as f:
+                raise RuntimeError(f"server exited: {f.read()[-2000:]}")
+        try:
+            status, _, _ = request(port, "POST", "/api/ready")
+            if status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("server did not become ready")
+
+
+def server_memory(process):
+    """Summed RSS/PSS of the server and its worker processes, in MB."""
+    pids = [process.pid]
+    try:
+        with open(f"/proc/{process.pid}/task/{process.pid}/children") as f:
+            pids += [int(pid) for pid in f.read().split()]
+    except OSError:
+        pass
+    total = {"processes": 0, "rss_mb": 0.0, "pss_mb": 0.0}
+    for pid in pids:
+        try:
+            usage = memory(pid)
+        except OSError:
+            continue
+        total["processes"] += 1
+        total["rss_mb"] = round(total["rss_mb"] + usage["rss_mb"], 1)
+        total["pss_mb"] = round(total["pss_mb"] + usage["pss_mb"], 1)
+    return total
+
+
+# ------------------
+# Virtual students
+# ------------------
+
+def request(port, method, path, body=None, cookie=None, connection=None):
+    """(status, headers, body bytes); reuses `connection` when given."""
+    own = connection is None
+    connection = connection or http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    headers = {"Content-Type": "application/json"}
+    if cookie:
+        headers["Cookie"] = f"access_token_cookie={cookie}"
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    if own or response.getheader("Connection", "").lower() == "close":
+        connection.close()
+    return response.status, response.headers, data
+
+
+class Student:
+    def __init__(self, port, number):
+        self.port = port
+        self.email = f"student{number}@example.com"
+        self.rng = random.Random(number)
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        self.cookie = None
+        self.courses = []
+
+    def call(self, method, path, body=None):
+        try:
+            return request(self.port, method, path, body, self.cookie, self.connection)
+        except (http.client.HTTPException, OSError):
+            # The server closed a kept-alive connection; retry once on a new one
+            self.connection.close()
+            self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+            return request(self.port, method, path, body, self.cookie, self.connection)
+
+    def login(self):
+        status, headers, data = self.call("POST", "/api/login",
+                                          {"email": self.email, "password": "password", "role": "student"})
+        if status == 200:
+            self.cookie = json.loads(data)["token"]
+        return status
+
+    def setup(self):
+        if self.login() != 200:
+            raise RuntimeError(f"{self.email} cannot log in")
+        _, _, data = self.call("GET", "/api/courses")
+        for course in json.loads(data):
+            _, _, detail = self.call("GET", f"/api/course/{course['id']}?include=content")
+            assignments = json.loads(detail)["assignments"]
+            # Synthetic questions name their topic, which gives the RAG scenario something to ask about
+            topics = {match.group(1) for a in assignments for q in a["content"] or []
+                      if (match := TOPIC.search(q.get("question", "")))}
+            self.courses.append({
+                "id": course["id"],
+                "topics": sorted(topics) or [course["name"]],
+                "assignments": [(a["id"], len(a["content"] or [])) for a in assignments],
+            })
+        if not self.courses:
+            raise RuntimeError(f"{self.email} is not enrolled in any course")
+
+    def run(self, scenario):
+        course = self.rng.choice(self.courses)
+        if scenario == "login":
+            return self.login()
+        if scenario == "courses":
+            return self.call("GET", "/api/courses")[0]
+        if scenario == "course":
+            return self.call("GET", f"/api/course/{course['id']}")[0]
+        if scenario == "submit":
+            assignment_id, questions = self.rng.choice(course["assignments"])
+            selections = [self.rng.randrange(4) for _ in range(questions)]
+            return self.call("POST", f"/api/submit_assignment/{course['id']}/{assignment_id}", selections)[0]
+        if scenario == "rag":
+            topic = self.rng.choice(course["topics"])
+            question = self.rng.choice(QUESTIONS).format(topic=topic)
+            return self.call("POST", "/api/rag/query", {"query": question, "location": f"/course/{course['id']}"})[0]
+        if scenario == "chat_history":
+            return self.call("GET", f"/api/chat_history?course={course['id']}")[0]
+        raise ValueError(f"unknown scenario {scenario}")
+
+
+def run_scenario(students, scenario, seconds):
+    latencies, errors = [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def drive(student):
+        own, failed = [], {}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = student.run(scenario)
+            except (http.client.HTTPException, OSError) as e:
+                status = type(e).__name__
+            if status == 200:
+                own.append(time.perf_counter() - start)
+            else:
+                failed[status] = failed.get(status, 0) + 1
+        with lock:
+            latencies.extend(own)
+            for status, count in failed.items():
+                errors[str(status)] = errors.get(str(status), 0) + count
+
+    threads = [threading.Thread(target=drive, args=(student,)) for student in students]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Scenario rows that regressed against the baseline report."""
+    previous = {row["scenario"]: row for row in baseline["scenarios"]}
+    regressions = []
+    for row in report["scenarios"]:
+        before = previous.get(row["scenario"])
+        if not before or not before["p95_ms"] or not row["p95_ms"]:
+            continue
+        if row["p95_ms"] > before["p95_ms"] * (1 + tolerance) or row["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{row['scenario']}: p95 {before['p95_ms']} -> {row['p95_ms']} ms, "
+                               f"{before['rps']} -> {row['rps']} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--server", choices=["flask", "gunicorn"], default="flask")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    ollama = FakeOllama(0, args.llm_latency_ms, token_rate=args.token_rate, tokens=args.tokens).start()
+    report = {"config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+              "scenarios": []}
+    with tempfile.TemporaryDirectory() as directory:
+        env = prepare(directory, args, ollama.url)
+        port = free_port()
+        server = start_server(directory, env, args, port)
+        try:
+            students = [Student(port, number) for number in range(min(args.concurrency, args.users))]
+            for student in students:
+                student.setup()
+            for scenario in args.scenarios.split(","):
+                row = run_scenario(students, scenario, args.seconds)
+                print(f"{scenario:13} {row['rps']:>8.1f} req/s  p50 {row['p50_ms']} ms  p95 {row['p95_ms']} ms  "
+                      f"p99 {row['p99_ms']} ms  errors {row['errors'] or 0}")
+                report["scenarios"].append(row)
+            report["server_memory"] = server_memory(server)
+            report["llm_calls"] = ollama.calls
+            print(f"server memory: {report['server_memory']}")
+        finally:
+            server.terminate()
+            server.wait()
+            ollama.shutdown()
+
+    print(json.dumps(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
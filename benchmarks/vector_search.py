@@ -0,0 +1,134 @@
+# benchmarks/vector_search.py
+"""
+Recall@k against query latency for the vector store backends.
+
+A synthetic corpus of unit vectors drawn around overlapping topics (like
+chunk embeddings, which bunch up by subject) is loaded into each backend; queries are perturbed copies
+of corpus vectors. Ground truth is an exact top-k computed directly with
+NumPy, so recall@k is the share of the true top-k each backend returns.
+
+Backends: numpy-exact, numpy-ivf for each --probes value, and chroma (an
+ephemeral in-memory collection) when chromadb is installed.
+
+Usage:
+    python benchmarks/vector_search.py [--size 20000] [--dim 768] [--queries 500] [--k 5]
+                                       [--ivf-lists 64] [--probes 1,4,8,16] [--filter]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import ChromaStore, NumpyStore  # noqa: E402
+
+COURSES = ["course1", "course2", "course3"]
+
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def jitter(rng, vectors, spread):
+    """Adds noise of norm about `spread` to each row and renormalizes."""
+    noise = rng.standard_normal(vectors.shape) / np.sqrt(vectors.shape[1])
+    return unit(vectors + spread * noise).astype(np.float32)
+
+
+def corpus(size, dim, topics, seed=0):
+    """Each vector mixes three random topics, so clusters overlap like real chunks do."""
+    rng = np.random.default_rng(seed)
+    centers = unit(rng.standard_normal((topics, dim)))
+    weights = rng.dirichlet(np.full(3, 0.5), size=size)
+    members = rng.integers(topics, size=(size, 3))
+    mixed = np.einsum("nt,ntd->nd", weights, centers[members])
+    return jitter(rng, unit(mixed), 0.5)
+
+
+def load(store, vectors, batch=1000):
+    ids = [f"doc{i}#0" for i in range(len(vectors))]
+    metadatas = [{"doc_id": f"doc{i}", "course_id": COURSES[i % len(COURSES)], "text": str(i)}
+                 for i in range(len(vectors))]
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch):
+        store.upsert(ids[offset:offset + batch], vectors[offset:offset + batch], metadatas[offset:offset + batch])
+    return time.perf_counter() - start
+
+
+def exact_top_k(vectors, queries, k, where):
+    allowed = np.ones(len(vectors), dtype=bool)
+    if where:
+        allowed = np.arange(len(vectors)) % len(COURSES) == COURSES.index(where["course_id"])
+    scores = queries @ vectors.T
+    scores[:, ~allowed] = -np.inf
+    return [set(f"doc{i}#0" for i in np.argsort(-row)[:k]) for row in scores]
+
+
+def measure(store, queries, truth, k, where):
+    latencies, found = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = store.query(query, k=k, where=where)
+        latencies.append(time.perf_counter() - start)
+        found += len(expected & {hit["id"] for hit in hits})
+    latencies = np.array(latencies) * 1000
+    return {
+        f"recall@{k}": round(found / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "qps": round(len(queries) / (latencies.sum() / 1000), 1),
+    }
+
+
+def backends(directory, args):
+    yield "numpy-exact", lambda: NumpyStore(os.path.join(directory, "exact"))
+    for probes in [int(p) for p in args.probes.split(",")]:
+        yield f"numpy-ivf{args.ivf_lists}-p{probes}", lambda probes=probes: NumpyStore(
+            os.path.join(directory, f"ivf{probes}"), ivf_lists=args.ivf_lists, probes=probes)
+    try:
+        import chromadb
+    except ImportError:
+        print("chromadb not installed; skipping the chroma backend")
+        return
+    yield "chroma", lambda: ChromaStore(chromadb.EphemeralClient().get_or_create_collection("bench"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--topics", type=int, default=100)
+    parser.add_argument("--ivf-lists", type=int, default=64)
+    parser.add_argument("--probes", default="1,4,8,16")
+    parser.add_argument("--filter", action="store_true", help="restrict queries to one course, as query_rag does")
+    args = parser.parse_args(argv)
+
+    vectors = corpus(args.size, args.dim, args.topics)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(args.size, size=args.queries)
+    queries = jitter(rng, vectors[picks], 0.5)
+    where = {"course_id": COURSES[0]} if args.filter else None
+    truth = exact_top_k(vectors, queries, args.k, where)
+
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, make in backends(directory, args):
+            store = make()
+            build_seconds = load(store, vectors)
+            row = {"backend": name, "build_s": round(build_seconds, 2),
+                   **measure(store, queries, truth, args.k, where)}
+            print(f"{name:20} recall@{args.k} {row[f'recall@{args.k}']:.4f}  p50 {row['p50_ms']:7.3f} ms  "
+                  f"p99 {row['p99_ms']:7.3f} ms  {row['qps']:>9.1f} q/s  build {row['build_s']:.2f} s")
+            report.append(row)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+# bulk_load.py
+"""
+Bulk import of users, courses, enrollments, lectures, assignments and
+submissions from CSV or JSON lines files.
+
+Rows are written with SQLAlchemy Core executemany, one transaction per
+--batch-size rows. Every table is matched on a natural key, so importing the
+same file again changes nothing and a corrected file updates rows in place:
+
+  users        email                      email, role, password or password_hash
+  courses      course_id                  course_id, name, description
+  enrollments  email, course_id           email, course_id
+  lectures     course_id, title           course_id, title, description, video_link, transcript
+  assignments  course_id, title           course_id, title, description, due_date, content
+  submissions  email, assignment,         email, course_id, assignment (title) or assignment_id,
+               submitted_at               submitted_at, content, score
+
+course_id is the course code. content is a JSON list (questions for an
+assignment, selected option indices for a submission); in a CSV file it is a
+JSON string. Submissions without a score are graded with the assignment's
+answer key. Existing users keep their password. Rows that are incomplete or
+point at a missing course, user or assignment are counted as rejected.
+
+Changed courses, enrollments and user roles are dropped from the cache at
+CACHE_URL. Running servers only see that with a shared backend (redis://);
+with memory:// they keep the old entries until CACHE_TTL or USER_CACHE_TTL
+runs out, and the command warns about it.
+
+New and changed lecture transcripts are embedded afterwards, a few hundred
+lectures at a time.
+
+Usage:
+    python bulk_load.py [--users users.csv] [--courses courses.jsonl] [--enrollments enrollments.csv]
+                        [--lectures lectures.jsonl] [--assignments assignments.jsonl]
+                        [--submissions submissions.csv] [--batch-size 10000] [--no-index]
+"""
+import argparse
+import csv
+import datetime
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import suppress
+from itertools import islice
+
+from sqlalchemy import Column, MetaData, Table, and_, bindparam, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import (
+    app, db, Assignment, Course, Lecture, Submission, User, user_courses,
+    answer_key_key, catalog_cache, course_key, index_transcripts, passwords, user_cache, user_courses_key,
+    user_key,
+)
+from grading import AnswerKey
+from ingest import read_jsonl
+
+DEFAULT_BATCH_SIZE = 10000
+INDEX_BATCH_SIZE = 500
+TABLES = ["users", "courses", "enrollments", "lectures", "assignments", "submissions"]
+
+
+def read_rows(path):
+    """Dicts from a CSV file with a header line, or from a JSON lines file."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            yield from read_jsonl(f)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def value(row, name):
+    """A field with CSV's empty cells read as missing."""
+    field = row.get(name)
+    return None if field == "" else field
+
+
+def json_value(row, name):
+    field = value(row, name)
+    return json.loads(field) if isinstance(field, str) else field
+
+
+def datetime_value(row, name):
+    field = value(row, name)
+    return datetime.datetime.fromisoformat(field) if isinstance(field, str) else field
+
+
+def upsert(connection, table, key, rows, insert_only=(), on_insert=None):
+    """
+    Inserts the rows whose `key` columns are new and updates existing rows
+    where a column differs; identical rows are not written. Later rows win
+    over earlier ones with the same key. `insert_only` columns are never
+    updated. Fields that are not columns of `table` are ignored, apart from
+    being visible to `on_insert`, which is called with the new rows before
+    they are written.
+
+    Returns the new rows and a dict of updated row id -> (row, changed columns).
+    """
+    columns = table.c
+    rows = list({tuple(row[name] for name in key): row for row in rows}.values())
+    if not rows:
+        return [], {}
+    names = [name for name in rows[0] if name in columns]
+    compared = [name for name in names if name not in key and name not in insert_only]
+    has_id = "id" in columns and compared
+
+    selected = list(dict.fromkeys(list(key) + compared + (["id"] if has_id else [])))
+    existing = {tuple(found[name] for name in key): found
+                for found in existing_rows(connection, table, key, rows, selected)}
+
+    new, updates, changed = [], [], {}
+    for row in rows:
+        current = existing.get(tuple(row[name] for name in key))
+        if current is None:
+            new.append(row)
+            continue
+        differs = {name for name in compared if row[name] != current[name]}
+        if differs and has_id:
+            changed[current["id"]] = (row, differs)
+            updates.append({"_id": current["id"], **{name: row[name] for name in compared}})
+
+    if new:
+        if on_insert:
+            on_insert(new)
+        connection.execute(table.insert(), [{name: row[name] for name in row if name in columns} for row in new])
+    if updates:
+        connection.execute(table.update().where(columns.id == bindparam("_id")), updates)
+    return new, changed
+
+
+def existing_rows(connection, table, key, rows, selected):
+    """The `selected` columns of the rows of `table` whose key matches one of `rows`."""
+    columns = table.c
+    query = select(*(columns[name] for name in selected))
+    if len(key) == 1:
+        return connection.execute(query.where(columns[key[0]].in_({row[key[0]] for row in rows}))).mappings().all()
+    # A join against the batch's keys in a temporary table seeks the table's
+    # index once per row, where an IN list per column would probe every
+    # combination of their values. pysqlite's legacy transaction handling can
+    # keep the table past a failed batch, so one that already exists is
+    # emptied first, and a failure still drops it.
+    staging = Table(f"bulk_keys_{table.name}", MetaData(),
+                    *(Column(name, columns[name].type) for name in key), prefixes=["TEMPORARY"])
+    staging.create(connection, checkfirst=True)
+    try:
+        connection.execute(staging.delete())
+        connection.execute(staging.insert(), [{name: row[name] for name in key} for row in rows])
+        found = connection.execute(
+            query.select_from(staging.join(table, and_(*(columns[name] == staging.c[name] for name in key))))
+        ).mappings().all()
+    except Exception:
+        # PostgreSQL refuses statements in the failed transaction, which drops the table anyway
+        with suppress(SQLAlchemyError):
+            staging.drop(connection, checkfirst=True)
+        raise
+    staging.drop(connection)
+    return found
+
+
+def lookup(connection, column, id_column, values):
+    values = {v for v in values if v is not None}
+    if not values:
+        return {}
+    return dict(connection.execute(select(column, id_column).where(column.in_(values))).all())
+
+
+def counts(rows, key, new, changed, rejected):
+    """Row counts for a batch; rows repeating a key are one row, as in upsert()."""
+    distinct = len({tuple(row[name] for name in key) for row in rows})
+    return {"inserted": len(new), "updated": len(changed),
+            "unchanged": distinct - len(new) - len(changed), "rejected": rejected}
+
+
+# ------------------
+# Per-table loaders: (connection, raw rows) -> (counts, cache keys to drop);
+# the users loader's keys are user_cache keys, the others catalog_cache keys
+# ------------------
+
+class UserLoader:
+    def __init__(self):
+        # Hashing is slow; rows that share a password share one hash
+        self.hashes = {}
+
+    def hash_passwords(self, rows):
+        for row in rows:
+            if row.get("password_hash") is None:
+                password = row["password"]
+                if password not in self.hashes:
+                    self.hashes[password] = passwords.hash(password)
+                row["password_hash"] = self.hashes[password]
+
+    def __call__(self, connection, raw):
+        rows, rejected = [], 0
+        for row in raw:
+            email = value(row, "email")
+            password, password_hash = value(row, "password"), value(row, "password_hash")
+            if not email or (password is None and password_hash is None):
+                rejected += 1
+                continue
+            rows.append({"email": email, "role": value(row, "role") or "student",
+                         "password_hash": password_hash, "password": password})
+        new, changed = upsert(connection, User.__table__, ("email",), rows,
+                              insert_only=("password_hash",), on_insert=self.hash_passwords)
+        # Identities are cached with the role
+        return counts(rows, ("email",), new, changed, rejected), \
+            [user_key(row["email"]) for row, names in changed.values() if "role" in names]
+
+
+def load_courses(connection, raw):
+    rows, rejected = [], 0
+    for row in raw:
+        if not value(row, "course_id") or not value(row, "name"):
+            rejected += 1
+            continue
+        rows.append({"course_id": row["course_id"], "name": row["name"],
+                     "description": value(row, "description")})
+    new, changed = upsert(connection, Course.__table__, ("course_id",), rows)
+    return counts(rows, ("course_id",), new, changed, rejected), \
+        [course_key(row["course_id"]) for row, _ in changed.values()]
+
+
+def load_enrollments(connection, raw):
+    users = lookup(connection, User.email, User.id, (value(row, "email") for row in raw))
+    courses = lookup(connection, Course.course_id, Course.id, (value(row, "course_id") for row in raw))
+    rows, rejected = [], 0
+    for row in raw:
+        user_id, course_id = users.get(value(row, "email")), courses.get(value(row, "course_id"))
+        if user_id is None or course_id is None:
+            rejected += 1
+            continue
+        rows.append({"user_id": user_id, "course_id": course_id, "email": row["email"]})
+    new, changed = upsert(connection, user_courses, ("user_id", "course_id"), rows)
+    return counts(rows, ("user_id", "course_id"), new, changed, rejected), \
+        [user_courses_key(row["email"]) for row in new]
+
+
+def course_rows(connection, raw, build):
+    """Resolves each row's course code to its id and builds the table row; returns rows and rejects."""
+    courses = lookup(connection, Course.course_id, Course.id, (value(row, "course_id") for row in raw))
+    rows, rejected = [], 0
+    for row in raw:
+        course_id = courses.get(value(row, "course_id"))
+        if course_id is None or not value(row, "title"):
+            rejected += 1
+            continue
+        try:
+            rows.append({"course_id": course_id, "title": row["title"], "code": row["course_id"], **build(row)})
+        except (TypeError, ValueError):
+            rejected += 1
+    return rows, rejected
+
+
+def load_lectures(connection, raw):
+    rows, rejected = course_rows(connection, raw, lambda row: {
+        "description": value(row, "description"),
+        "video_link": value(row, "video_link"),
+        "transcript": value(row, "transcript"),
+    })
+    table = Lecture.__table__
+    new, changed = upsert(connection, table, ("course_id", "title"), rows)
+    # New lectures start unindexed; changed transcripts are indexed again
+    stale = [{"_id": lecture_id} for lecture_id, (_, names) in changed.items() if "transcript" in names]
+    if stale:
+        connection.execute(table.update().where(table.c.id == bindparam("_id")).values(transcript_indexed_at=None),
+                           stale)
+    codes = {row["code"] for row in new} | {row["code"] for row, _ in changed.values()}
+    return counts(rows, ("course_id", "title"), new, changed, rejected), [course_key(code) for code in codes]
+
+
+def assignment_fields(row):
+    content = json_value(row, "content")
+    try:
+        answer_key = AnswerKey.compile(content).to_json()
+    except ValueError:
+        answer_key = None
+    return {"description": value(row, "description"), "due_date": datetime_value(row, "due_date"),
+            "content": content, "answer_key": answer_key}
+
+
+def load_assignments(connection, raw):
+    rows, rejected = course_rows(connection, raw, assignment_fields)
+    table = Assignment.__table__
+    new, changed = upsert(connection, table, ("course_id", "title"), rows)
+    # Servers compare their cached answer keys with key_version before grading
+    rekeyed = [{"_id": assignment_id} for assignment_id, (_, names) in changed.items() if "answer_key" in names]
+    if rekeyed:
+        connection.execute(table.update().where(table.c.id == bindparam("_id"))
+                           .values(key_version=table.c.key_version + 1), rekeyed)
+    codes = {row["code"] for row in new} | {row["code"] for row, _ in changed.values()}
+    keys = [course_key(code) for code in codes] + [answer_key_key(assignment_id) for assignment_id in changed]
+    return counts(rows, ("course_id", "title"), new, changed, rejected), keys
+
+
+class SubmissionLoader:
+    def __init__(self):
+        # Assignment ids and (answer key, key version), kept across batches
+        self.by_title = {}
+        self.keys = {}
+
+    def resolve(self, connection, raw):
+        wanted = {(value(row, "course_id"), value(row, "assignment")) for row in raw
+                  if value(row, "assignment_id") is None} - set(self.by_title)
+        if wanted:
+            query = select(Course.course_id, Assignment.title, Assignment.id, Assignment.answer_key,
+                           Assignment.key_version) \
+                .join(Course, Assignment.course_id == Course.id) \
+                .where(Course.course_id.in_({code for code, _ in wanted}))
+            for code, title, assignment_id, answer_key, key_version in connection.execute(query):
+                self.by_title[(code, title)] = assignment_id
+                self.keys[assignment_id] = (answer_key, key_version)
+        ids = set()
+        for row in raw:
+            try:
+                ids.add(int(value(row, "assignment_id")))
+            except (TypeError, ValueError):
+                pass
+        missing = ids - set(self.keys)
+        if missing:
+            query = select(Assignment.id, Assignment.answer_key, Assignment.key_version) \
+                .where(Assignment.id.in_(missing))
+            self.keys.update({assignment_id: (answer_key, key_version)
+                              for assignment_id, answer_key, key_version in connection.execute(query)})
+
+    def assignment_id(self, row):
+        if value(row, "assignment_id") is not None:
+            assignment_id = int(row["assignment_id"])
+            return assignment_id if assignment_id in self.keys else None
+        return self.by_title.get((value(row, "course_id"), value(row, "assignment")))
+
+    def grade(self, rows):
+        """
+        Scores ungraded rows, a selection matrix per assignment, and stamps them
+        with the key version; returns the rows that could be graded.
+        """
+        ungraded = {}
+        for row in rows:
+            if row["score"] is None:
+                ungraded.setdefault(row["assignment_id"], []).append(row)
+        invalid = set()
+        for assignment_id, group in ungraded.items():
+            answer_key, key_version = self.keys[assignment_id]
+            if answer_key is None:
+                invalid.update(id(row) for row in group)
+                continue
+            key = AnswerKey.from_json(answer_key)
+            matrix, valid = key.selection_matrix([row["content"] for row in group])
+            _, scores = key.grade_matrix(matrix)
+            for row, ok, score in zip(group, valid, scores):
+                if ok:
+                    row["score"] = float(score)
+                    row["key_version"] = key_version
+                else:
+                    invalid.add(id(row))
+        return [row for row in rows if id(row) not in invalid]
+
+    def __call__(self, connection, raw):
+        self.resolve(connection, raw)
+        rows, rejected = [], 0
+        for row in raw:
+            try:
+                assignment_id = self.assignment_id(row)
+                submitted_at = datetime_value(row, "submitted_at")
+                score = value(row, "score")
+                parsed = {"student_email": value(row, "email"), "assignment_id": assignment_id,
+                          "submitted_at": submitted_at, "content": json_value(row, "content"),
+                          "score": None if score is None else float(score), "key_version": None}
+            except (TypeError, ValueError):
+                rejected += 1
+                continue
+            # submitted_at is part of the key, so it cannot default to the time of the import
+            if assignment_id is None or not parsed["student_email"] or submitted_at is None:
+                rejected += 1
+                continue
+            rows.append(parsed)
+        graded = self.grade(rows)
+        rejected += len(rows) - len(graded)
+        new, changed = upsert(connection, Submission.__table__, ("student_email", "assignment_id", "submitted_at"),
+                              graded)
+        return counts(graded, ("student_email", "assignment_id", "submitted_at"), new, changed, rejected), []
+
+
+def load_table(name, path, batch_size=DEFAULT_BATCH_SIZE):
+    """Loads one file into one table, a transaction per batch. Returns the table's counts and throughput."""
+    loader = {"users": UserLoader(), "courses": load_courses, "enrollments": load_enrollments,
+              "lectures": load_lectures, "assignments": load_assignments,
+              "submissions": SubmissionLoader()}[name]
+    totals = Counter()
+    start = time.perf_counter()
+    for batch in batches(read_rows(path), batch_size):
+        with db.engine.begin() as connection:
+            batch_counts, cache_keys = loader(connection, batch)
+        totals.update(batch_counts)
+        totals["rows"] += len(batch)
+        if cache_keys:
+            (user_cache if name == "users" else catalog_cache).invalidate(*cache_keys)
+    elapsed = time.perf_counter() - start
+    return {
+        "table": name,
+        "rows": totals["rows"],
+        "inserted": totals["inserted"],
+        "updated": totals["updated"],
+        "unchanged": totals["unchanged"],
+        "rejected": totals["rejected"],
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(totals["rows"] / elapsed, 1) if elapsed else None,
+    }
+
+
+def index_pending_transcripts(batch_size=INDEX_BATCH_SIZE):
+    """Embeds every lecture transcript that is not indexed yet, `batch_size` lectures at a time."""
+    lecture_ids = [lecture_id for (lecture_id,) in db.session.execute(
+        select(Lecture.id).where(Lecture.transcript_indexed_at.is_(None)).order_by(Lecture.id)
+    )]
+    totals = Counter()
+    start = time.perf_counter()
+    for offset in range(0, len(lecture_ids), batch_size):
+        stats = index_transcripts(lecture_ids[offset:offset + batch_size])
+        totals.update({"documents": stats["documents"], "chunks": stats["chunks"]})
+        db.session.expunge_all()
+    elapsed = time.perf_counter() - start
+    return {
+        "lectures": len(lecture_ids),
+        "chunks": totals["chunks"],
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(totals["chunks"] / elapsed, 2) if elapsed else None,
+    }
+
+
+def bulk_load(files, batch_size=DEFAULT_BATCH_SIZE, index=True):
+    """Loads {table name: path} in dependency order and indexes new transcripts."""
+    report = {"tables": []}
+    for name in TABLES:
+        if files.get(name):
+            report["tables"].append(load_table(name, files[name], batch_size))
+    if index and files.get("lectures"):
+        report["indexed"] = index_pending_transcripts()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for name in TABLES:
+        parser.add_argument(f"--{name}", help=f"CSV or JSON lines file of {name}")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--no-index", action="store_true", help="leave new transcripts for `flask index-transcripts`")
+    args = parser.parse_args(argv)
+
+    if not app.config['CACHE_URL'].startswith(("redis://", "rediss://", "unix://")):
+        print(f"warning: CACHE_URL is {app.config['CACHE_URL']}, so running servers keep cached courses, "
+              "enrollments and roles until CACHE_TTL or USER_CACHE_TTL runs out; "
+              "set CACHE_URL to the servers' Redis to update them now", file=sys.stderr)
+
+    with app.app_context():
+        report = bulk_load({name: getattr(args, name) for name in TABLES}, args.batch_size, not args.no_index)
+    for table in report["tables"]:
+        print(f"{table['table']:12} {table['rows']:>9} rows  {table['rows_per_sec']:>10} rows/s  "
+              f"inserted {table['inserted']}  updated {table['updated']}  unchanged {table['unchanged']}  "
+              f"rejected {table['rejected']}")
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# cache.py
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a size bound and an optional TTL in seconds."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Snapshot of the live (unexpired) entries, oldest first."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires) in self._data.items()
+                if expires is None or expires > now
+            ]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class MemoryBackend:
+    """Per-process backend; the default."""
+
+    def __init__(self, maxsize=2048, ttl=None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key, _MISSING)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._cache.delete(key)
+
+    def stats(self):
+        return {"backend": "memory", "size": len(self._cache), "maxsize": self._cache.maxsize}
+
+
+class RedisBackend:
+    """
+    Backend for any Redis-compatible server so all workers share one cache.
+    Needs the optional `redis` package.
+    """
+
+    def __init__(self, url, ttl=None, prefix="course-website:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL points at Redis but the 'redis' package is not installed")
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = int(ttl) if ttl else None
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value):
+        self._redis.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._redis.delete(*(self.prefix + key for key in keys))
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+def make_backend(url=None, maxsize=2048, ttl=None):
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, ttl=ttl)
+    return MemoryBackend(maxsize=maxsize, ttl=ttl)
+
+
+class ReadThroughCache:
+    """Loads on miss, counts hits and misses, and drops keys on invalidate()."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, loader):
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        value = loader()
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self.invalidations += len(keys)
+        self.backend.delete(*keys)
+
+    def stats(self):
+        return {**self.backend.stats(), "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations}
+
+
+def normalize_query(query):
+    """Case, whitespace and trailing punctuation do not change what is being asked."""
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+
+class RagAnswerCache:
+    """
+    Answers cached by (normalized query, course).
+
+    With a semantic threshold set, a miss falls back to the cached answer for
+    the same course whose query embedding has the highest cosine similarity,
+    provided it clears the threshold.
+
+    Each answer is stored with the vector store version it was retrieved
+    from, and an answer from another version is a miss. invalidate() only
+    reaches this process; the version also covers writes made by other workers.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, semantic_threshold=None):
+        self.answers = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.semantic_threshold = semantic_threshold
+        self.semantic_hits = 0
+
+    def get(self, query, course_id, embedding=None, version=None):
+        key = (normalize_query(query), course_id)
+        answer = self.answers.get(key)
+        if answer is not None and answer["version"] != version:
+            self.answers.delete(key)
+            answer = None
+        if answer is not None or self.semantic_threshold is None or embedding is None:
+            return answer
+
+        candidates = [
+            value for (_, course), value in self.answers.items()
+            if course == course_id and value["version"] == version
+        ]
+        if not candidates:
+            return None
+        vector = _unit(embedding)
+        matrix = np.stack([candidate["embedding"] for candidate in candidates])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.semantic_threshold:
+            self.semantic_hits += 1
+            return candidates[best]
+        return None
+
+    def set(self, query, course_id, embedding, answer, sources, version=None):
+        self.answers.set((normalize_query(query), course_id), {
+            "answer": answer,
+            "sources": sources,
+            "embedding": _unit(embedding),
+            "version": version,
+        })
+
+    def invalidate(self):
+        # Any change to the document collection can change retrieval results
+        self.answers.clear()
+
+    def stats(self):
+        return {**self.answers.stats(), "semantic_hits": self.semantic_hits,
+                "semantic_threshold": self.semantic_threshold}
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
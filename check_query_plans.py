@@ -0,0 +1,188 @@
+# check_query_plans.py
+"""
+Query-plan regression check for the statements behind the API routes.
+
+Drives the hot routes through app.test_client() the way a student and a
+teacher use them: login, course pages, submitting and listing submissions,
+a RAG question, the chat history summary and topic analytics. A
+before_cursor_execute listener records every statement they issue, including
+the write-behind writer and the background jobs the routes start. Each
+distinct SELECT, UPDATE and DELETE is then run through EXPLAIN, and the check
+exits non-zero if any of them falls back to a full table scan.
+
+The routes run against a scratch SQLite database holding a small synthetic
+dataset from seed.py. With --use-configured-db they run against DATABASE_URL
+instead, which must be a scratch database too: the check creates the tables
+and writes sample rows. Embeddings use EMBED_MODE=hashing, the numpy vector
+store lives in a temporary directory and benchmarks/fake_ollama.py answers
+the LLM calls, so nothing else needs to be running.
+
+Usage:
+    python check_query_plans.py [--use-configured-db] [--verbose]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.fake_ollama import FakeOllama
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+
+class StatementLog:
+    """Distinct statements seen by the engine, with the route or thread that issued each first."""
+
+    def __init__(self):
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, connection, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(EXPLAINED):
+            return
+        if has_request_context():
+            source = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        else:
+            # Background job and writer threads, without their pool numbering
+            source = threading.current_thread().name.rstrip("_0123456789")
+        with self._lock:
+            self.statements.setdefault(statement, (source, parameters))
+
+
+def drive(client, teacher_client, writes, jobs):
+    """Issues the requests of a typical student and teacher session; returns (route, status) pairs."""
+    responses = []
+
+    def call(client, method, url, **kwargs):
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()  # streamed responses run their queries while being read
+        responses.append((f"{method} {url}", response.status_code))
+        return response
+
+    call(client, "POST", "/api/login",
+         json={"email": "student0@example.com", "password": "password", "role": "student"})
+    course_id = call(client, "GET", "/api/courses").get_json()[0]["id"]
+    course = call(client, "GET", f"/api/course/{course_id}?include=content").get_json()
+    call(client, "GET", f"/api/course/{course_id}")
+    lecture_id = course["lectures"][0]["id"]
+    assignment = course["assignments"][0]
+    call(client, "GET", f"/api/course/{course_id}/lectures")
+    call(client, "GET", f"/api/course/{course_id}/lectures/{lecture_id}")
+    call(client, "GET", f"/api/course/{course_id}/assignments")
+    call(client, "GET", f"/api/course/{course_id}/assignments/{assignment['id']}")
+    call(client, "POST", f"/api/submit_assignment/{course_id}/{assignment['id']}",
+         json=[0] * len(assignment["content"]))
+    call(client, "POST", "/api/rag/query",
+         json={"query": "What is covered in the first lecture?", "location": f"/course/{course_id}"})
+    writes.flush(timeout=5)
+
+    call(teacher_client, "POST", "/api/login",
+         json={"email": "teacher0@example.com", "password": "password", "role": "teacher"})
+    page = call(teacher_client, "GET", f"/api/submissions/{assignment['id']}?limit=1").get_json()
+    if page.get("next_cursor"):
+        call(teacher_client, "GET", f"/api/submissions/{assignment['id']}?limit=1&cursor={page['next_cursor']}")
+    call(teacher_client, "GET", f"/api/teacher/view-submissions?assignment_id={assignment['id']}")
+    call(teacher_client, "GET", f"/api/submissions/{assignment['id']}?student=student0@example.com")
+    call(teacher_client, "GET", f"/api/submissions/{assignment['id']}/export")
+    call(teacher_client, "GET", f"/api/chat_history?course={course_id}")
+    call(teacher_client, "GET", "/api/chat_history?since=2025-01-01T00:00:00")
+    call(teacher_client, "GET", f"/api/analytics/topics?course={course_id}")
+    # Once the embedding job has run, the report reads the stored vectors
+    jobs.wait(timeout=60)
+    call(teacher_client, "GET", f"/api/analytics/topics?course={course_id}")
+    jobs.wait(timeout=60)
+    writes.flush(timeout=5)
+    return responses
+
+
+def explain(connection, statement, parameters):
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).fetchall()
+    return [row[0] for row in rows]
+
+
+def full_scans(dialect_name, plan):
+    if dialect_name == "sqlite":
+        # "SCAN user" is a table scan; "SCAN t USING (COVERING) INDEX" walks an index, and
+        # "SCAN CONSTANT ROW" / "SCAN (subquery-1)" read SQLAlchemy's empty IN () placeholder
+        return [line for line in plan if line.startswith("SCAN ") and "INDEX" not in line
+                and not line.startswith(("SCAN CONSTANT ROW", "SCAN (subquery"))]
+    return [line for line in plan if "Seq Scan" in line]
+
+
+def check(engine, statements, verbose=False):
+    failures = 0
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            # Tiny tables are always cheaper to seq-scan; ask whether an index is usable at all
+            connection.exec_driver_sql("SET enable_seqscan = off")
+        for statement, (source, parameters) in statements.items():
+            plan = explain(connection, statement, parameters)
+            scans = full_scans(engine.dialect.name, plan)
+            status = "FULL SCAN" if scans else "ok"
+            text = " ".join(statement.split())
+            print(f"{status:9} {source:48} {text if verbose else text[:100]}")
+            if scans or verbose:
+                for line in plan:
+                    print(f"          {line}")
+            failures += bool(scans)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if a query issued by a hot route does a full table scan.")
+    parser.add_argument("--use-configured-db", action="store_true",
+                        help="run against DATABASE_URL (a scratch database) instead of a temporary SQLite file")
+    parser.add_argument("--verbose", action="store_true", help="print every statement and plan in full")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.TemporaryDirectory()
+    ollama = FakeOllama(0, latency_ms=0, token_rate=100000).start()
+    os.environ.update({
+        "EMBED_MODE": "hashing",
+        "VECTOR_STORE": "numpy",
+        "VECTOR_STORE_PATH": os.path.join(directory.name, "vector_index"),
+        "OLLAMA_HOST": ollama.url,
+    })
+    if not args.use_configured_db:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory.name, 'plans.db')}"
+
+    from app import app, db, jobs, writes
+    from seed import seed_synthetic
+
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(users=20, teachers=1, courses=2, submissions=200)
+        db.session.remove()
+
+        log = StatementLog()
+        event.listen(Engine, "before_cursor_execute", log)
+        try:
+            responses = drive(app.test_client(), app.test_client(), writes, jobs)
+        finally:
+            event.remove(Engine, "before_cursor_execute", log)
+
+        errors = [(route, status) for route, status in responses if status >= 500]
+        for route, status in errors:
+            print(f"{'ERROR':9} {route} answered {status}")
+        failures = check(db.engine, log.statements, args.verbose)
+    ollama.shutdown()
+    directory.cleanup()
+
+    if errors:
+        print(f"{len(errors)} routes failed, so their queries were not all checked")
+    if failures:
+        print(f"{failures} statements from hot routes regressed to a full table scan")
+    if errors or failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
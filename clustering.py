@@ -0,0 +1,37 @@
+# clustering.py
+"""
+Spherical k-means, shared by the chat topic report and the vector store's
+IVF partition.
+"""
+import numpy as np
+
+
+def kmeans(vectors, k, iterations=25, seed=0):
+    """
+    Spherical k-means (cosine similarity) with k-means++ seeding.
+    Returns (labels, centroids); vectors must be L2-normalized.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(n)]
+    closest = 1 - vectors @ centroids[0]
+    for index in range(1, k):
+        weights = np.clip(closest, 0, None).astype(np.float64) ** 2
+        total = weights.sum()
+        choice = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centroids[index] = vectors[choice]
+        closest = np.minimum(closest, 1 - vectors @ centroids[index])
+
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for index in range(k):
+            members = vectors[labels == index]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[index] = centroid / (np.linalg.norm(centroid) or 1)
+    return labels, centroids
@@ -0,0 +1,79 @@
+# db_config.py
+"""
+Database settings read from the environment.
+
+DATABASE_URL selects the database (SQLite by default, PostgreSQL via
+postgresql://...). Pool sizing applies to both; SQLite connections also get
+WAL journaling, a busy timeout and synchronous=NORMAL so concurrent writers
+wait for the lock instead of failing with "database is locked".
+"""
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_DATABASE_URL = "sqlite:///course_website.db"
+
+
+def _env(environ):
+    return os.environ if environ is None else environ
+
+
+def database_url(environ=None):
+    url = _env(environ).get("DATABASE_URL", DEFAULT_DATABASE_URL)
+    # Hosted Postgres often hands out postgres://, which SQLAlchemy no longer accepts
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def engine_options(url, environ=None):
+    environ = _env(environ)
+    if url.startswith("sqlite") and (url in ("sqlite://", "sqlite:///") or ":memory:" in url):
+        return {}
+
+    options = {
+        "pool_size": int(environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(environ.get("DB_POOL_TIMEOUT", 30)),
+    }
+    if url.startswith("sqlite"):
+        # The driver-level timeout is how long sqlite3 waits for the write lock
+        options["connect_args"] = {"timeout": int(environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)) / 1000}
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = int(environ.get("DB_POOL_RECYCLE", 1800))
+    return options
+
+
+def sqlite_pragmas(environ=None):
+    """PRAGMAs applied to every new SQLite connection; an empty value skips one."""
+    environ = _env(environ)
+    pragmas = {
+        "journal_mode": environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "busy_timeout": environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+        "synchronous": environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    }
+    return {name: value for name, value in pragmas.items() if value}
+
+
+def install_sqlite_pragmas(pragmas):
+    @event.listens_for(Engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return set_sqlite_pragmas
+
+
+def configure_database(app, environ=None):
+    url = database_url(environ)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, environ)
+    if url.startswith("sqlite"):
+        install_sqlite_pragmas(sqlite_pragmas(environ))
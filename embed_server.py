@@ -0,0 +1,90 @@
+# embed_server.py
+"""
+Embedding sidecar: loads the SentenceTransformer once and serves every
+gunicorn worker over a Unix socket, so workers stay near the Flask baseline
+in memory. Concurrent requests from all workers share one micro-batcher.
+
+Run it next to the app and start the workers with EMBED_MODE=sidecar.
+
+Usage:
+    python embed_server.py [--socket /tmp/course-website-embed.sock] [--model NAME]
+                           [--threads N] [--max-batch 32] [--max-wait-ms 5]
+"""
+import argparse
+import os
+import socketserver
+
+import numpy as np
+
+from embedding import EmbeddingBatcher, recv_message, send_message, set_torch_threads
+
+DEFAULT_SOCKET = "/tmp/course-website-embed.sock"
+DEFAULT_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """One connection per worker thread, serving requests until it closes."""
+
+    def handle(self):
+        embedder = self.server.embedder
+        while True:
+            try:
+                header, _ = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            op = header.get("op")
+            try:
+                if op == "encode":
+                    vectors = np.ascontiguousarray(embedder.encode(header["texts"]), dtype=np.float32)
+                    send_message(self.request, {"shape": list(vectors.shape)}, vectors.tobytes())
+                elif op == "info":
+                    send_message(self.request, {"dimension": embedder.dimension, "model": self.server.model_name})
+                elif op == "stats":
+                    send_message(self.request, embedder.stats())
+                else:
+                    send_message(self.request, {"error": f"Unknown op {op!r}"})
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                send_message(self.request, {"error": str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, embedder, model_name):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.embedder = embedder
+        self.model_name = model_name
+        super().__init__(socket_path, EmbeddingRequestHandler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve sentence embeddings over a Unix socket.")
+    parser.add_argument("--socket", default=os.environ.get("EMBED_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--model", default=os.environ.get("EMBED_MODEL", DEFAULT_MODEL))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("EMBED_TORCH_THREADS", 0)),
+                        help="torch intra-op threads (default: torch's own choice)")
+    parser.add_argument("--max-batch", type=int, default=int(os.environ.get("EMBED_MAX_BATCH", 32)))
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.environ.get("EMBED_MAX_WAIT_MS", 5)))
+    args = parser.parse_args(argv)
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model)
+    set_torch_threads(args.threads)
+    embedder = EmbeddingBatcher(model, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+    server = EmbeddingServer(args.socket, embedder, args.model)
+    print(f"Serving {args.model} on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# embedding.py
+import hashlib
+import json
+import queue
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import percentile
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching front end for SentenceTransformer.encode.
+
+    Concurrent callers enqueue their texts; a single worker thread waits up to
+    `max_wait_ms` after the first request (or until `max_batch_size` texts are
+    queued), runs one encode() over the whole batch and hands every caller its
+    own rows back.
+    """
+
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5, latency_window=2048):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._batch_sizes = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._batch_sizes["+Inf"] = 0
+        self._batches = 0
+        self._texts = 0
+
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def encode(self, text):
+        """Encodes one string (returns a vector) or a list of strings (returns a matrix)."""
+        single = isinstance(text, str)
+        texts = [text] if single else list(text)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        future = Future()
+        self._queue.put((texts, future, time.perf_counter()))
+        vectors = future.result()
+        return vectors[0] if single else vectors
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        pending = len(requests[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while pending < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            pending += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            texts = [text for request in requests for text in request[0]]
+            try:
+                vectors = self.model.encode(texts, batch_size=self.max_batch_size)
+            except Exception as e:
+                for _, future, _ in requests:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            offset = 0
+            for request_texts, future, enqueued in requests:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+            self._record(len(texts), [done - enqueued for _, _, enqueued in requests])
+
+    def _record(self, batch_size, latencies):
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if batch_size <= b), "+Inf")
+        with self._stats_lock:
+            self._batch_sizes[bucket] += 1
+            self._batches += 1
+            self._texts += batch_size
+            self._latencies.extend(latencies)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000
+            histogram = dict(self._batch_sizes)
+            batches, texts = self._batches, self._texts
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "texts": texts,
+            "mean_batch_size": round(texts / batches, 2) if batches else 0,
+            "batch_size_histogram": {str(bucket): count for bucket, count in histogram.items()},
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p99": percentile(latencies, 99),
+            },
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+class HashingEncoder:
+    """
+    Deterministic stand-in for a SentenceTransformer (EMBED_MODE=hashing):
+    words and word pairs are hashed into `dimension` signed buckets and the
+    vector is normalized. Texts that share words get similar vectors, which
+    is enough for benchmarks and offline runs; there is nothing to download.
+    """
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _vector(self, text):
+        words = re.findall(r"\w+", text.lower())
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if isinstance(sentences, str):
+            return self._vector(sentences)
+        vectors = [self._vector(text) for text in sentences]
+        return np.stack(vectors) if vectors else np.zeros((0, self.dimension), dtype=np.float32)
+
+
+def set_torch_threads(count):
+    """Caps torch's intra-op threads; a no-op when torch has not been imported."""
+    torch = sys.modules.get("torch")
+    if torch is not None and count:
+        torch.set_num_threads(count)
+
+
+# ------------------
+# Embedding sidecar (embed_server.py) protocol: two big-endian lengths, a JSON
+# header and an optional payload (the float32 matrix in encode responses)
+# ------------------
+
+def send_message(sock, header, payload=b""):
+    body = json.dumps(header).encode()
+    sock.sendall(struct.pack("!II", len(body), len(payload)) + body + payload)
+
+
+def recv_message(sock):
+    header_size, payload_size = struct.unpack("!II", _recv_exact(sock, 8))
+    header = json.loads(_recv_exact(sock, header_size))
+    return header, _recv_exact(sock, payload_size)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class RemoteEmbedder:
+    """
+    Client for the embedding sidecar with the same encode/dimension/stats
+    surface as EmbeddingBatcher. Each thread keeps its own connection; the
+    sidecar batches concurrent requests from every worker together.
+    """
+
+    def __init__(self, socket_path, timeout=30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._dimension = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def _call(self, header):
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None) or self._connect()
+            try:
+                send_message(sock, header)
+                response, payload = recv_message(sock)
+                break
+            except OSError:
+                # ConnectionError included: the sidecar restarted, so reconnect once
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        if "error" in response:
+            raise RuntimeError(f"Embedding server error: {response['error']}")
+        return response, payload
+
+    def encode(self, text):
+        single = isinstance(text, str)
+        texts = [text] if single else list(text)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        response, payload = self._call({"op": "encode", "texts": texts})
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(response["shape"])
+        return vectors[0] if single else vectors
+
+    @property
+    def dimension(self):
+        if self._dimension is None:
+            self._dimension = self._call({"op": "info"})[0]["dimension"]
+        return self._dimension
+
+    def stats(self):
+        return {"mode": "sidecar", "socket": self.socket_path, **self._call({"op": "stats"})[0]}
@@ -0,0 +1,139 @@
+# grading.py
+import numpy as np
+
+
+class AnswerKey:
+    """
+    Compiled form of an assignment's questions: the index of the correct
+    option and the number of options for every question.
+    """
+
+    def __init__(self, correct, option_counts):
+        self.correct = np.asarray(correct, dtype=np.int32)
+        self.option_counts = np.asarray(option_counts, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.correct)
+
+    @classmethod
+    def compile(cls, content):
+        """Builds the key from assignment content, raising ValueError if it is malformed."""
+        if not isinstance(content, list) or not content:
+            raise ValueError("Assignment content must be a non-empty list of questions")
+        correct, option_counts = [], []
+        for number, question in enumerate(content, start=1):
+            options = question.get("options") if isinstance(question, dict) else None
+            if not isinstance(options, list) or not options:
+                raise ValueError(f"Question {number} has no options")
+            try:
+                correct.append(options.index(question.get("correct_option")))
+            except ValueError:
+                raise ValueError(f"Question {number}: correct_option is not one of its options")
+            option_counts.append(len(options))
+        return cls(correct, option_counts)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["correct"], data["option_counts"])
+
+    def to_json(self):
+        return {"correct": self.correct.tolist(), "option_counts": self.option_counts.tolist()}
+
+    def parse(self, selections):
+        """
+        Validates a submission (one selected option index per question, as
+        ints or numeric strings; null or "" for unanswered) and returns it as
+        an int array with -1 for unanswered questions.
+        """
+        if not isinstance(selections, list):
+            raise ValueError("Submission must be a list of selected option indices")
+        if len(selections) > len(self):
+            raise ValueError(f"Submission has {len(selections)} answers but the assignment has {len(self)} questions")
+        try:
+            selected = np.array(
+                [-1 if option in (None, "") else int(option) for option in selections], dtype=np.int32
+            )
+        except (TypeError, ValueError):
+            raise ValueError("Selected options must be integers")
+        counts = self.option_counts[:len(selected)]
+        if np.any((selected < -1) | (selected >= counts)):
+            raise ValueError("Selected option out of range")
+        return selected
+
+    def grade(self, selections):
+        """Number of correct answers; questions left out count as wrong."""
+        selected = self.parse(selections)
+        return int(np.count_nonzero(selected == self.correct[:len(selected)]))
+
+    def selection_matrix(self, submissions):
+        """
+        Stacks submission contents into a (submissions x questions) array,
+        padding unanswered questions with -1. Returns the matrix and a mask
+        of the submissions that were valid.
+        """
+        matrix = np.full((len(submissions), len(self)), -1, dtype=np.int32)
+        valid = np.ones(len(submissions), dtype=bool)
+        for row, selections in enumerate(submissions):
+            try:
+                selected = self.parse(selections)
+            except ValueError:
+                valid[row] = False
+                continue
+            matrix[row, :len(selected)] = selected
+        return matrix, valid
+
+    def grade_matrix(self, matrix):
+        """Per-question correctness (bool matrix) and total scores for a selection matrix."""
+        correct = matrix == self.correct
+        return correct, correct.sum(axis=1)
+
+
+class ItemStatistics:
+    """
+    Classical item analysis accumulated batch by batch, so it comes out of the
+    regrading pass without a second read of the submissions.
+
+    difficulty is the share of students answering correctly; discrimination
+    is the point-biserial correlation between answering the question
+    correctly and the score on the remaining questions.
+    """
+
+    def __init__(self, question_count):
+        self.count = 0
+        self.score_sum = 0.0
+        self.score_square_sum = 0.0
+        self.correct_sum = np.zeros(question_count)
+        self.correct_score_sum = np.zeros(question_count)
+
+    def add(self, correct, scores):
+        scores = scores.astype(np.float64)
+        self.count += len(scores)
+        self.score_sum += scores.sum()
+        self.score_square_sum += (scores ** 2).sum()
+        self.correct_sum += correct.sum(axis=0)
+        self.correct_score_sum += correct.T.astype(np.float64) @ scores
+
+    def result(self):
+        if not self.count:
+            return []
+        n = self.count
+        mean = self.score_sum / n
+        score_var = self.score_square_sum / n - mean ** 2
+        p = self.correct_sum / n
+        item_var = p * (1 - p)
+        cov = self.correct_score_sum / n - p * mean
+        # Remove the item itself from the total before correlating
+        rest_cov = cov - item_var
+        rest_var = score_var - 2 * cov + item_var
+        denominator = np.sqrt(item_var * rest_var)
+        questions = []
+        for index in range(len(p)):
+            discrimination = None
+            if denominator[index] > 1e-12:
+                discrimination = round(float(rest_cov[index] / denominator[index]), 4)
+            questions.append({
+                "question": index,
+                "difficulty": round(float(p[index]), 4),
+                "discrimination": discrimination,
+            })
+        return questions
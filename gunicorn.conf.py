@@ -0,0 +1,75 @@
+# gunicorn.conf.py
+"""
+Production server settings: gunicorn -c gunicorn.conf.py app:app
+
+Embedding memory per worker depends on EMBED_MODE (see app.py):
+  local    every worker loads its own copy of the model on first use
+  preload  the model is loaded once in the master and shared copy-on-write
+  sidecar  workers call embed_server.py and never load the model
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+import metrics
+from embedding import set_torch_threads
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# The app splits its LLM limits between the workers and keeps them below the
+# thread count, so it needs the values actually in use
+os.environ["WEB_CONCURRENCY"] = str(workers)
+os.environ["GUNICORN_THREADS"] = str(threads)
+# Workers write their metrics snapshots and profiles here, so whichever
+# worker a scrape or profile download lands on can answer for all of them
+own_metrics_dir = not os.environ.get("METRICS_DIR")
+if own_metrics_dir:
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="gunicorn-metrics-")
+# LLM answers and SSE streams can take minutes
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 180))
+
+# Import the app (and with it the model) in the master before forking
+preload_app = os.environ.get("EMBED_MODE") == "preload"
+
+
+def on_starting(server):
+    metrics.reset(os.environ["METRICS_DIR"])
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far out of the collector's reach, so garbage
+    # collections in the workers do not touch (and un-share) the master's pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Without a cap every worker starts one torch thread per core and they
+    # oversubscribe the CPU; by default split the cores between the workers
+    count = int(os.environ.get("EMBED_TORCH_THREADS") or max(1, multiprocessing.cpu_count() // workers))
+    # A preloaded model already imported torch; otherwise the worker's model
+    # loader reads the setting when it imports torch itself
+    set_torch_threads(count)
+    os.environ["EMBED_TORCH_THREADS"] = str(count)
+
+
+def worker_exit(server, worker):
+    # Commit what the write-behind queue still holds before the worker exits,
+    # and leave its final counts for the other workers to report
+    app = sys.modules.get("app")
+    if app is not None:
+        app.writes.close()
+        app.metrics_registry.save()
+
+
+def child_exit(server, worker):
+    metrics.retire(os.environ["METRICS_DIR"], worker.pid)
+
+
+def on_exit(server):
+    if own_metrics_dir:
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
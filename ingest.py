@@ -0,0 +1,135 @@
+# ingest.py
+"""
+Bulk document ingestion for the RAG collection.
+
+Documents are split into overlapping word windows so long transcripts are not
+truncated at the embedding model's max sequence length, embedded in large
+batches and written with batched upserts.
+
+Usage:
+    python ingest.py documents.jsonl [--chunk-size 200] [--overlap 40] [--batch-size 256]
+
+Each input line is a JSON object with "id" and "text" and an optional
+"metadata" object of scalar values.
+"""
+import argparse
+import json
+import sys
+import time
+
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_OVERLAP = 40
+DEFAULT_BATCH_SIZE = 256
+
+
+def chunk_text(text, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP):
+    """Splits text into windows of chunk_size words, each sharing overlap words with the previous one."""
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    if not 0 <= overlap < chunk_size:
+        raise ValueError("overlap must be between 0 and chunk_size - 1")
+    words = text.split()
+    if len(words) <= chunk_size:
+        return [" ".join(words)] if words else []
+    step = chunk_size - overlap
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+def read_jsonl(lines):
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {number}: {e.msg}")
+
+
+def validate_document(number, document):
+    """Raises ValueError naming document `number` unless it has an id, text and optional metadata object."""
+    if not isinstance(document, dict):
+        raise ValueError(f"Document {number} must be an object with id and text")
+    if document.get("id") in (None, "") or not document.get("text") or not isinstance(document["text"], str):
+        raise ValueError(f"Document {number} needs an id and text")
+    if not isinstance(document.get("metadata") or {}, dict):
+        raise ValueError(f"Document {number} metadata must be an object")
+
+
+def ingest_documents(documents, embedder, store, chunk_size=DEFAULT_CHUNK_SIZE,
+                     overlap=DEFAULT_OVERLAP, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Chunks, embeds and upserts documents into the vector store.
+
+    Re-ingesting a document id replaces all of its previous chunks. Returns
+    throughput statistics for the run.
+    """
+    start = time.perf_counter()
+    doc_count = 0
+    chunk_count = 0
+    ids, texts, metadatas, doc_ids = [], [], [], []
+
+    def flush():
+        nonlocal chunk_count
+        if not ids:
+            return
+        # Drop chunks left over from a longer previous version of these documents
+        store.delete_documents(doc_ids)
+        store.upsert(list(ids), embedder.encode(texts), list(metadatas))
+        chunk_count += len(ids)
+        for pending in (ids, texts, metadatas, doc_ids):
+            pending.clear()
+
+    for number, document in enumerate(documents):
+        validate_document(number, document)
+        doc_id = str(document["id"])
+        text = document["text"]
+        extra = document.get("metadata") or {}
+        doc_count += 1
+        doc_ids.append(doc_id)
+        for index, chunk in enumerate(chunk_text(text, chunk_size, overlap)):
+            ids.append(f"{doc_id}#{index}")
+            texts.append(chunk)
+            metadatas.append({**extra, "text": chunk, "doc_id": doc_id, "chunk": index})
+        if len(ids) >= batch_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": doc_count,
+        "chunks": chunk_count,
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(doc_count / elapsed, 2) if elapsed else None,
+        "chunks_per_sec": round(chunk_count / elapsed, 2) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load documents into the RAG collection.")
+    parser.add_argument("path", help="JSON lines file, or - for stdin")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from app import embedder, vector_store
+
+    stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+    with stream:
+        stats = ingest_documents(
+            read_jsonl(stream), embedder, vector_store,
+            chunk_size=args.chunk_size, overlap=args.overlap, batch_size=args.batch_size,
+        )
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
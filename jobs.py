@@ -0,0 +1,94 @@
+# jobs.py
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.state = "queued"
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def update(self, progress=None, message=None):
+        if progress is not None:
+            self.progress = max(0.0, min(1.0, progress))
+        if message is not None:
+            self.message = message
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "progress": round(self.progress, 4),
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRunner:
+    """
+    Small in-process background job runner.
+
+    Jobs run on a thread pool inside an application context and receive their
+    Job object as the first argument so they can report progress. Only the
+    most recent `history` jobs are kept for status queries.
+    """
+
+    def __init__(self, app, max_workers=2, history=200):
+        self.app = app
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *args, **kwargs):
+        job = Job(name)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.state = "running"
+        with self.app.app_context():
+            try:
+                job.result = fn(job, *args, **kwargs)
+                job.state = "finished"
+                job.progress = 1.0
+            except Exception as e:
+                job.state = "failed"
+                job.error = str(e)
+                traceback.print_exc()
+            finally:
+                job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, timeout=None):
+        """Blocks until every job submitted so far has finished; False if `timeout` ran out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if all(job.finished_at is not None for job in self._jobs.values()):
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
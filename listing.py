@@ -0,0 +1,47 @@
+# listing.py
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+
+
+def encode_cursor(submitted_at, row_id):
+    """Opaque keyset cursor for the (submitted_at, id) ordering."""
+    raw = f"{submitted_at.isoformat() if submitted_at else ''}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return (datetime.fromisoformat(timestamp) if timestamp else None), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps({column: _jsonable(value) for column, value in zip(columns, row)}) + "\n"
+
+
+def csv_lines(columns, rows):
+    """CSV text one line at a time; structured values are written as JSON."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([
+            json.dumps(value) if isinstance(value, (list, dict)) else _jsonable(value)
+            for value in row
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,193 @@
+# llm_gateway.py
+import asyncio
+import queue
+import threading
+
+
+class Overloaded(Exception):
+    """Raised when the LLM queue is full and a request is not admitted."""
+
+
+class LLMTimeout(Exception):
+    """Raised when an LLM call exceeds its route timeout."""
+
+
+_DONE = object()
+
+
+def process_limits(concurrency, max_queue, workers=1, threads=None):
+    """
+    Splits the server-wide `concurrency` and `max_queue` evenly between
+    `workers` processes (at least one call each). With `threads` request
+    threads per process, admission is also capped at threads - 1 so a burst
+    of LLM calls always leaves a thread for the cheap routes.
+    """
+    workers = max(1, workers)
+    concurrency = max(1, concurrency // workers)
+    max_queue = max_queue // workers
+    if threads:
+        admitted = max(1, threads - 1)
+        concurrency = min(concurrency, admitted)
+        max_queue = min(max_queue, admitted - concurrency)
+    return concurrency, max_queue
+
+
+class LLMGateway:
+    """
+    Runs every Ollama call on one background asyncio loop with an async client.
+
+    At most `concurrency` calls reach Ollama at a time and at most `max_queue`
+    more wait for a slot; anything beyond that is rejected straight away with
+    Overloaded so request threads are never parked behind a saturated model.
+    Each route gets its own timeout, covering both the wait and the call.
+
+    `options` (e.g. num_ctx) and `keep_alive` are sent with every call unless
+    the caller overrides them. on_usage(route, messages, final_response) is
+    called once per completed call with Ollama's token counts.
+    """
+
+    def __init__(self, host, concurrency=2, max_queue=16, timeouts=None, default_timeout=120,
+                 options=None, keep_alive=None, on_usage=None):
+        self.host = host
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.options = options or {}
+        self.keep_alive = keep_alive
+        self.on_usage = on_usage
+
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+    # ------------------
+    # Event loop
+    # ------------------
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+            thread.start()
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            self._loop = loop
+            return loop
+
+    async def _setup(self):
+        # The client and semaphore must be created on the loop that uses them;
+        # ollama is imported here so importing the gateway stays cheap
+        import ollama
+        self._client = ollama.AsyncClient(host=self.host)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    # ------------------
+    # Admission control
+    # ------------------
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.concurrency + self.max_queue:
+                raise Overloaded()
+            self._admitted += 1
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def timeout_for(self, route):
+        return self.timeouts.get(route, self.default_timeout)
+
+    def stats(self):
+        with self._lock:
+            admitted = self._admitted
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": min(admitted, self.concurrency),
+            "queued": max(admitted - self.concurrency, 0),
+        }
+
+    # ------------------
+    # Calls
+    # ------------------
+
+    def _request(self, kwargs):
+        request = dict(kwargs)
+        if self.options:
+            request["options"] = {**self.options, **(kwargs.get("options") or {})}
+        if self.keep_alive is not None:
+            request.setdefault("keep_alive", self.keep_alive)
+        return request
+
+    def _report(self, route, kwargs, response):
+        if self.on_usage is not None:
+            self.on_usage(route, kwargs.get("messages"), response)
+
+    async def _chat(self, kwargs):
+        async with self._semaphore:
+            return await self._client.chat(**kwargs)
+
+    def chat(self, route, **kwargs):
+        """Blocking chat call for request threads."""
+        loop = self._ensure_loop()
+        self._admit()
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                asyncio.wait_for(self._chat(self._request(kwargs)), self.timeout_for(route)), loop
+            )
+            try:
+                response = future.result()
+            except asyncio.TimeoutError:
+                raise LLMTimeout(route)
+        finally:
+            self._release()
+        self._report(route, kwargs, response)
+        return response
+
+    async def _stream(self, kwargs, out):
+        try:
+            async with self._semaphore:
+                async for chunk in await self._client.chat(stream=True, **kwargs):
+                    out.put(chunk)
+        finally:
+            out.put(_DONE)
+
+    def stream_chat(self, route, **kwargs):
+        """
+        Streaming chat call. Admission happens here, before any response is
+        sent, so an overloaded model still produces a clean 429.
+        """
+        loop = self._ensure_loop()
+        self._admit()
+        chunks = queue.Queue()
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                asyncio.wait_for(self._stream(self._request(kwargs), chunks), self.timeout_for(route)), loop
+            )
+        except BaseException:
+            self._release()
+            raise
+        return self._drain(route, kwargs, future, chunks)
+
+    def _drain(self, route, kwargs, future, chunks):
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is _DONE:
+                    break
+                if chunk.get("done"):
+                    self._report(route, kwargs, chunk)
+                yield chunk
+            try:
+                future.result()
+            except asyncio.TimeoutError:
+                raise LLMTimeout(route)
+        finally:
+            # Stops the upstream call if the client went away mid-stream
+            future.cancel()
+            self._release()
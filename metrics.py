@@ -0,0 +1,458 @@
+# metrics.py
+"""
+Request instrumentation and Prometheus text exposition, without a client
+library.
+
+Every request carries a trace on flask.g: the time spent in each phase
+(db, embedding, retrieval, llm) and the number of SQL statements it ran.
+Phases are recorded by span() around a block, by TimedService around a
+service's methods, and for SQL by engine events. Work outside a request (jobs, the
+write-behind thread) is not attributed to any request.
+
+Metrics are kept per process. With a directory shared by the gunicorn
+workers, each one writes snapshots there and /metrics merges them, so any
+worker answers for the whole server; sampled profiles are kept there too.
+"""
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+
+import numpy as np
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def describe(self):
+        return {"name": self.name, "kind": self.kind, "help": self.help, "labels": list(self.labels),
+                "values": self.snapshot()}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+    def describe(self):
+        return {"name": self.name, "kind": self.kind, "help": self.help, "labels": list(self.labels),
+                "buckets": list(self.buckets[:-1]), "values": self.snapshot()}
+
+
+def percentile(values, q):
+    """The q-th percentile of `values`, rounded to 2 places for the JSON stats endpoints; None if empty."""
+    return round(float(np.percentile(values, q)), 2) if len(values) else None
+
+
+def _metric_lines(description, values):
+    name, labels = description["name"], tuple(description["labels"])
+    if description["kind"] == "counter":
+        for key, value in sorted(values.items()):
+            yield f"{name}{_labels(labels, key)} {_number(value)}"
+        return
+    buckets = tuple(description["buckets"]) + (float("inf"),)
+    for key, (counts, total) in sorted(values.items()):
+        cumulative = 0
+        for bound, count in zip(buckets, counts):
+            cumulative += count
+            yield f"{name}_bucket{_labels(labels + ('le',), key + (_number(bound),))} {cumulative}"
+        yield f"{name}_sum{_labels(labels, key)} {_number(round(total, 6))}"
+        yield f"{name}_count{_labels(labels, key)} {cumulative}"
+
+
+def merge_snapshots(snapshots, per_process=False):
+    """
+    Prometheus text for one or more process snapshots. Counters and
+    histograms are summed; with `per_process`, gauges get a pid label.
+    """
+    lines, metrics, families = [], {}, {}
+    for snapshot in snapshots:
+        for description in snapshot["metrics"]:
+            merged = metrics.setdefault(description["name"], (description, {}))[1]
+            for key, *value in description["values"]:
+                key = tuple(key)
+                if description["kind"] == "counter":
+                    merged[key] = merged.get(key, 0) + value[0]
+                else:
+                    counts, total = merged.get(key, ([0] * len(value[0]), 0.0))
+                    merged[key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+        lines.extend(f"# {error}" for error in snapshot["errors"])
+        for name, kind, help, labels, value in snapshot["samples"]:
+            if kind == "gauge" and per_process:
+                labels = {**labels, "pid": snapshot["pid"]}
+            samples = families.setdefault(name, (kind, help, {}))[2]
+            key = tuple(labels.items())
+            samples[key] = samples.get(key, 0) + value
+    for description, values in metrics.values():
+        lines.append(f"# HELP {description['name']} {description['help']}")
+        lines.append(f"# TYPE {description['name']} {description['kind']}")
+        lines.extend(_metric_lines(description, values))
+    for name, (kind, help, samples) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in samples.items():
+            lines.append(f"{name}{_labels(tuple(k for k, _ in key), tuple(v for _, v in key))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_json(path, data):
+    """Replaces `path` atomically, so readers never see half a file."""
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(descriptor, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def read_snapshots(directory):
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def retire(directory, pid):
+    """Drops an exited worker's gauges; its counters and histograms still count towards the totals."""
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    snapshot["samples"] = [sample for sample in snapshot["samples"] if sample[1] != "gauge"]
+    _write_json(path, snapshot)
+
+
+def reset(directory):
+    """Empties a shared metrics directory left over from an earlier run."""
+    for pattern in ("*.json", "*.tmp", os.path.join("profiles", "*")):
+        for path in glob.glob(os.path.join(directory, pattern)):
+            os.remove(path)
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms updated as things happen, plus collectors that
+    turn existing stats() dicts into samples when /metrics is scraped. A
+    collector yields (name, kind, help, labels dict, value).
+
+    With a `directory` shared by the gunicorn workers (the multiprocess mode
+    of prometheus_client works the same way), each worker writes a snapshot
+    there every `interval` seconds and render() merges them all.
+    """
+
+    def __init__(self, directory=None, interval=5):
+        self.directory = directory
+        self.interval = interval
+        self._metrics = []
+        self._collectors = []
+        self._pid = None
+        self._writer_lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def snapshot(self):
+        """This process's metrics and collected samples, as JSON-ready data."""
+        samples, errors = [], []
+        for collect in self._collectors:
+            try:
+                collected = list(collect())
+            except Exception as e:
+                errors.append(f"collector {collect.__name__} failed: {_escape(e)}")
+                continue
+            samples.extend([name, kind, help, labels, value]
+                           for name, kind, help, labels, value in collected if value is not None)
+        return {"pid": os.getpid(), "metrics": [metric.describe() for metric in self._metrics],
+                "samples": samples, "errors": errors}
+
+    def save(self):
+        if self.directory is not None:
+            _write_json(os.path.join(self.directory, f"{os.getpid()}.json"), self.snapshot())
+
+    def attach(self):
+        """Starts this process's snapshot writer, once per process (a forked worker has a new pid)."""
+        if self.directory is None or self._pid == os.getpid():
+            return
+        with self._writer_lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.save()
+            except OSError:
+                pass
+
+    def render(self):
+        if self.directory is None:
+            return merge_snapshots([self.snapshot()])
+        self.save()
+        return merge_snapshots(read_snapshots(self.directory), per_process=True)
+
+
+# ------------------
+# Request traces
+# ------------------
+
+def start_trace():
+    g.trace = {"start": time.perf_counter(), "phases": {}, "queries": 0}
+
+
+def current_trace():
+    if has_request_context():
+        return g.get("trace")
+    return None
+
+
+def record(phase, seconds):
+    trace = current_trace()
+    if trace is not None:
+        trace["phases"][phase] = trace["phases"].get(phase, 0.0) + seconds
+
+
+@contextmanager
+def span(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def timed_iter(iterable, phase):
+    """Yields from `iterable`, counting the time spent waiting for each item towards `phase`."""
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                record(phase, time.perf_counter() - start)
+            yield item
+    finally:
+        # Closing early (client went away) must still close the source, e.g. to free an LLM slot
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+class TimedService:
+    """
+    Wraps a service so calls to `methods` count towards `phase` of the current
+    request. `streams` return iterators whose work happens as they are
+    consumed, so the iteration is timed as well as the call.
+    """
+
+    def __init__(self, service, phase, methods, streams=()):
+        self._service = service
+        self._phase = phase
+        self._methods = frozenset(methods)
+        self._streams = frozenset(streams)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._service, name)
+        if name not in self._methods and name not in self._streams:
+            return attribute
+
+        def call(*args, **kwargs):
+            with span(self._phase):
+                result = attribute(*args, **kwargs)
+            return timed_iter(result, self._phase) if name in self._streams else result
+        return call
+
+
+def install_query_timer():
+    """Counts SQL statements and their time towards the current request's "db" phase."""
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def query_finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        trace = current_trace()
+        if trace is not None:
+            trace["queries"] += 1
+            trace["phases"]["db"] = trace["phases"].get("db", 0.0) + time.perf_counter() - started
+
+    @event.listens_for(Engine, "handle_error")
+    def query_failed(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+    return query_started, query_finished, query_failed
+
+
+def server_timing(trace):
+    """Server-Timing header value, so browser dev tools show the phases of a request."""
+    return ", ".join(f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in sorted(trace["phases"].items()))
+
+
+# ------------------
+# Sampling profiler
+# ------------------
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper
+    thread and counts identical stacks. collapsed() returns them in the
+    folded format flamegraph.pl and speedscope read ("outer;inner count").
+    """
+
+    def __init__(self, thread_id, interval=0.005, max_depth=64):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Tally()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """
+    The newest `keep` folded profiles, as files under `directory`/profiles so
+    that any worker can return a profile another one recorded.
+    """
+
+    def __init__(self, directory, keep=32):
+        self.directory = os.path.join(directory, "profiles")
+        self.keep = keep
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, profile_id):
+        return os.path.join(self.directory, f"{profile_id}.folded")
+
+    def set(self, profile_id, profile):
+        _write_json(self._path(profile_id), profile)
+        try:
+            paths = sorted(glob.glob(os.path.join(self.directory, "*.folded")), key=os.path.getmtime)
+        except FileNotFoundError:
+            # Another worker is pruning at the same time
+            return
+        for path in paths[:-self.keep]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, profile_id):
+        if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+            return None
+        try:
+            with open(self._path(profile_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,27 @@
+"""Drop the unused (user, created_at) chat history index
+
+Revision ID: 4f8b2d6a9c1e
+Revises: 9d3f1b5c7e2a
+Create Date: 2026-10-18 09:12:44.208317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8b2d6a9c1e'
+down_revision = '9d3f1b5c7e2a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Every row is logged with user "user", so no query filters on it
+    with op.batch_alter_table('chathistory', schema=None) as batch_op:
+        batch_op.drop_index('ix_chathistory_user_created')
+
+
+def downgrade():
+    with op.batch_alter_table('chathistory', schema=None) as batch_op:
+        batch_op.create_index('ix_chathistory_user_created', ['user', 'created_at'], unique=False)
@@ -0,0 +1,26 @@
+"""Add answer key version to assignments
+
+Revision ID: 6c1e9a4b7d2f
+Revises: 4f8b2d6a9c1e
+Create Date: 2026-10-18 10:05:31.774209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e9a4b7d2f'
+down_revision = '4f8b2d6a9c1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('assignment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key_version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('assignment', schema=None) as batch_op:
+        batch_op.drop_column('key_version')
@@ -0,0 +1,26 @@
+"""Add answer key version to submissions
+
+Revision ID: 8a2d5f1c3e7b
+Revises: 6c1e9a4b7d2f
+Create Date: 2026-10-18 11:42:08.316540
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a2d5f1c3e7b'
+down_revision = '6c1e9a4b7d2f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key_version', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.drop_column('key_version')
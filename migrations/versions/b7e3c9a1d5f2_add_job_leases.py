@@ -0,0 +1,29 @@
+"""Add job leases
+
+Revision ID: b7e3c9a1d5f2
+Revises: 8a2d5f1c3e7b
+Create Date: 2026-10-18 14:20:47.905126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c9a1d5f2'
+down_revision = '8a2d5f1c3e7b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_lease',
+    sa.Column('name', sa.String(length=250), nullable=False),
+    sa.Column('holder', sa.String(length=32), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('job_lease')
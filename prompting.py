@@ -0,0 +1,210 @@
+# prompting.py
+"""
+Prompt assembly under per-route token budgets.
+
+Prefill time on a small local model grows with prompt length, so every
+prompt is built to a budget: retrieved chunks are merged where they overlap,
+deduplicated, and cut once the budget is spent. Token counts are estimated
+from characters and calibrated against the prompt_eval_count Ollama reports
+for the prompts actually sent.
+"""
+import re
+import threading
+
+SYSTEM_PROMPT = "Use the context to answer accurately in less than 4 lines."
+
+# Role markers and separators the chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """
+    Estimates tokens as characters / chars_per_token. observe() feeds back
+    real counts, moving the ratio towards what the model's tokenizer does.
+    """
+
+    def __init__(self, chars_per_token=4.0, smoothing=0.1):
+        self.chars_per_token = chars_per_token
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def count(self, text):
+        return int(len(text) / self.chars_per_token + 0.999) if text else 0
+
+    def count_messages(self, messages):
+        return sum(self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+    def chars(self, tokens):
+        """Roughly how many characters fit in `tokens`."""
+        return int(tokens * self.chars_per_token)
+
+    def observe(self, messages, actual_tokens):
+        if not actual_tokens:
+            return
+        characters = sum(len(message["content"]) for message in messages)
+        text_tokens = actual_tokens - MESSAGE_OVERHEAD_TOKENS * len(messages)
+        if characters < 200 or text_tokens <= 0:
+            # Too short to say anything about the ratio
+            return
+        ratio = min(max(characters / text_tokens, 2.0), 6.0)
+        with self._lock:
+            self.chars_per_token += self.smoothing * (ratio - self.chars_per_token)
+
+
+def fit_to_budget(texts, max_tokens, count_tokens):
+    """
+    Keeps texts in order until the token budget is spent; the first text that
+    does not fit is cut at a word boundary if a useful part of it fits.
+    """
+    kept, used = [], 0
+    for text in texts:
+        size = count_tokens(text)
+        if used + size <= max_tokens:
+            kept.append(text)
+            used += size
+            continue
+        remaining = max_tokens - used
+        if remaining >= 32:
+            # Longest word prefix that fits, by binary search over the word count
+            words = text.split()
+            low, high = 0, len(words)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if count_tokens(" ".join(words[:middle]) + " ...") <= remaining:
+                    low = middle
+                else:
+                    high = middle - 1
+            kept.append(" ".join(words[:low]) + " ...")
+        break
+    return kept
+
+
+def _join_overlapping(first, second):
+    """Appends `second` to `first`, dropping the longest word run that ends one and starts the other."""
+    a, b = first.split(), second.split()
+    for size in range(min(len(a), len(b)), 0, -1):
+        if a[-size:] == b[:size]:
+            return " ".join(a + b[size:])
+    return " ".join(a + b)
+
+
+def merge_passages(hits):
+    """
+    Turns ranked chunk hits into passages for the prompt, in rank order of
+    each passage's best chunk: neighbouring chunks of the same document are
+    joined without their overlapping words and repeated texts are dropped.
+    """
+    groups = {}
+    for hit in hits:
+        metadata = hit["metadata"]
+        groups.setdefault(metadata.get("doc_id", hit["id"]), []).append(metadata)
+
+    passages, seen = [], set()
+    for chunks in groups.values():
+        chunks.sort(key=lambda metadata: metadata.get("chunk", 0))
+        current, last_index = None, None
+        for metadata in chunks:
+            index = metadata.get("chunk", 0)
+            if current is not None and index == last_index + 1:
+                current = _join_overlapping(current, metadata["text"])
+            else:
+                if current is not None:
+                    passages.append(current)
+                current = metadata["text"]
+            last_index = index
+        passages.append(current)
+
+    unique = []
+    for passage in passages:
+        key = re.sub(r"\W+", " ", passage).strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(passage)
+    return unique
+
+
+class PromptBuilder:
+    """Builds the chat messages for each LLM route within its token budget."""
+
+    def __init__(self, counter, budgets, default_budget=1024):
+        self.counter = counter
+        self.budgets = budgets
+        self.default_budget = default_budget
+
+    def budget(self, route):
+        return self.budgets.get(route, self.default_budget)
+
+    def rag(self, question, hits, course=None):
+        """Returns (messages, passages used as context)."""
+        header = ""
+        if course is not None:
+            header = f"Course: {course.name}\n"
+            if course.description:
+                header += f"About the course: {course.description}\n"
+        question_part = f"\nQuestion: {question}"
+        fixed = self.counter.count_messages([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"{header}Context: {question_part}"},
+        ])
+        passages = fit_to_budget(merge_passages(hits), max(self.budget("rag") - fixed, 0), self.counter.count)
+        context = "\n\n".join(passages)
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"{header}Context: {context}{question_part}"},
+        ], passages
+
+    def llm(self, question):
+        budget = self.budget("llm") - MESSAGE_OVERHEAD_TOKENS
+        if self.counter.count(question) > budget:
+            question = fit_to_budget([question], budget, self.counter.count)[0]
+        return [{"role": "user", "content": question}]
+
+    def window_chars(self, route, reserved_tokens=200):
+        """Characters of raw text one prompt of this route can carry besides its instructions."""
+        return self.counter.chars(max(self.budget(route) - reserved_tokens, 0))
+
+
+class UsageStats:
+    """Prompt and completion token totals per route, from Ollama's final response."""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, messages, response):
+        prompt_tokens = response.get("prompt_eval_count") or 0
+        completion_tokens = response.get("eval_count") or 0
+        # Ollama reports durations in nanoseconds
+        prompt_seconds = (response.get("prompt_eval_duration") or 0) / 1e9
+        completion_seconds = (response.get("eval_duration") or 0) / 1e9
+        estimated = self.counter.count_messages(messages or [])
+        self.counter.observe(messages or [], prompt_tokens)
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "requests": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "estimated_prompt_tokens": 0, "max_prompt_tokens": 0,
+                "prompt_seconds": 0.0, "completion_seconds": 0.0,
+            })
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["prompt_seconds"] += prompt_seconds
+            stats["completion_seconds"] += completion_seconds
+            stats["estimated_prompt_tokens"] += estimated
+            stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], prompt_tokens)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "estimated_prompt_tokens": estimated}
+
+    def stats(self):
+        with self._lock:
+            routes = {route: dict(stats) for route, stats in self._routes.items()}
+        for stats in routes.values():
+            requests = stats["requests"]
+            stats["mean_prompt_tokens"] = round(stats["prompt_tokens"] / requests, 1) if requests else None
+            stats["mean_completion_tokens"] = round(stats["completion_tokens"] / requests, 1) if requests else None
+            seconds = stats["completion_seconds"]
+            stats["completion_tokens_per_second"] = round(stats["completion_tokens"] / seconds, 1) if seconds else None
+            seconds = stats["prompt_seconds"]
+            stats["prompt_tokens_per_second"] = round(stats["prompt_tokens"] / seconds, 1) if seconds else None
+        return {"chars_per_token": round(self.counter.chars_per_token, 3), "routes": routes}
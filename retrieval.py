@@ -0,0 +1,196 @@
+# retrieval.py
+"""
+Hybrid retrieval for RAG: BM25 over the indexed chunks plus dense vector
+search, merged with reciprocal rank fusion and optionally reranked by a
+cross-encoder.
+
+Dense search finds paraphrases; BM25 catches short keyword queries
+("mitochondria", "speciation") whose embeddings land far from the chunks
+that mention them.
+"""
+import re
+import threading
+import time
+
+import numpy as np
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i in is it its
+me my of on or so that the their them there these this to was what when where
+which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords; plural 's' is dropped so "cells" matches "cell"."""
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Immutable Okapi BM25 index over (chunk id, metadata) pairs; the text is metadata["text"]."""
+
+    def __init__(self, chunks, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids, self.metadatas = [], []
+        postings = {}
+        lengths = []
+        for chunk_id, metadata in chunks:
+            row = len(self.ids)
+            self.ids.append(chunk_id)
+            self.metadatas.append(metadata)
+            tokens = tokenize(metadata.get("text", ""))
+            lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(row)
+                postings[token][1].append(count)
+        self.lengths = np.array(lengths, dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if lengths else 0.0
+        n = len(self.ids)
+        self.postings = {}
+        for token, (rows, counts) in postings.items():
+            idf = np.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            self.postings[token] = (np.array(rows), np.array(counts, dtype=np.float32), idf)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _column(self, key):
+        if key not in self._columns:
+            self._columns[key] = np.array([metadata.get(key) for metadata in self.metadatas], dtype=object)
+        return self._columns[key]
+
+    def search(self, query, k=5, where=None):
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / (self.average_length or 1))
+        for token in set(tokenize(query)):
+            if token not in self.postings:
+                continue
+            rows, counts, idf = self.postings[token]
+            scores[rows] += idf * counts * (self.k1 + 1) / (counts + norm[rows])
+        candidates = scores > 0
+        for key, value in (where or {}).items():
+            candidates &= self._column(key) == value
+        rows = np.flatnonzero(candidates)
+        if not len(rows):
+            return []
+        top = rows[np.argsort(-scores[rows])[:k]]
+        return [{"id": self.ids[row], "metadata": self.metadatas[row], "score": round(float(scores[row]), 6)}
+                for row in top]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merges ranked hit lists by summing 1 / (k + rank) per chunk id."""
+    fused = {}
+    for hits in rankings:
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["id"], {"id": hit["id"], "metadata": hit["metadata"], "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda hit: -hit["score"])
+
+
+class HybridRetriever:
+    """
+    Dense + BM25 retrieval over one vector store.
+
+    The BM25 index is built from store.chunks() on first use and rebuilt when
+    store.version() changes (checked at most every `refresh_seconds`) or after
+    invalidate(), which the app calls whenever it writes to the store. The
+    same throttled version is offered to callers through store_version(), so
+    anything derived from the store in another worker can notice the change.
+    """
+
+    def __init__(self, store, candidates=20, rrf_k=60, reranker=None, rerank_candidates=20,
+                 hybrid=True, refresh_seconds=5):
+        self.store = store
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        self.hybrid = hybrid
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._version_lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._store_version = None
+        self._checked_at = None
+        self._builds = 0
+        self._queries = 0
+        self._lexical_only = 0
+        self._reranked = 0
+
+    def invalidate(self):
+        with self._version_lock:
+            self._checked_at = None
+        with self._lock:
+            self._version = None
+
+    def store_version(self):
+        """store.version(), read again at most every `refresh_seconds`."""
+        now = time.monotonic()
+        with self._version_lock:
+            if self._checked_at is None or now - self._checked_at >= self.refresh_seconds:
+                self._store_version = self.store.version()
+                self._checked_at = now
+            return self._store_version
+
+    def lexical_index(self):
+        version = self.store_version()
+        if self._index is not None and version == self._version:
+            return self._index
+        with self._lock:
+            if self._index is None or version != self._version:
+                self._index = BM25Index(self.store.chunks())
+                self._version = version
+                self._builds += 1
+            return self._index
+
+    def retrieve(self, query, embedding, k=5, where=None):
+        """Top-k hits ({"id", "metadata", "score"}) for a query and its embedding."""
+        dense = self.store.query(embedding, k=self.candidates, where=where)
+        hits = dense
+        if self.hybrid:
+            lexical = self.lexical_index().search(query, k=self.candidates, where=where)
+            # Counts queries where BM25 surfaces chunks outside the dense top k
+            if {hit["id"] for hit in lexical} - {hit["id"] for hit in dense[:k]}:
+                self._lexical_only += 1
+            hits = reciprocal_rank_fusion([dense, lexical], k=self.rrf_k)
+        self._queries += 1
+        if self.reranker is not None and len(hits) > 1:
+            hits = self.rerank(query, hits[:self.rerank_candidates])
+            self._reranked += 1
+        return hits[:k]
+
+    def rerank(self, query, hits):
+        scores = self.reranker.predict([(query, hit["metadata"].get("text", "")) for hit in hits])
+        for hit, score in zip(hits, scores):
+            hit["score"] = float(score)
+        return sorted(hits, key=lambda hit: -hit["score"])
+
+    def stats(self):
+        index = self._index
+        return {
+            "hybrid": self.hybrid,
+            "reranker": self.reranker is not None,
+            "lexical_chunks": len(index) if index is not None else None,
+            "lexical_terms": len(index.postings) if index is not None else None,
+            "lexical_builds": self._builds,
+            "queries": self._queries,
+            "queries_with_lexical_only_hits": self._lexical_only,
+            "reranked_queries": self._reranked,
+        }
@@ -1,12 +1,13 @@
 # seed.py
-from app import app, db, Course, User, Assignment, Lecture  # Import your app and models
-import chromadb
-from sentence_transformers import SentenceTransformer
+from app import app, db, Course, User, Assignment, Lecture, Submission, index_transcripts  # Import your app and models
+from app import embedder, passwords, user_courses, vector_store
+import argparse
 import datetime
+import random
+import time
 
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(name="documents")
-embed_model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+from grading import AnswerKey
+from ingest import ingest_documents
 
 def seed_data():
     # Seed Courses if none exist
@@ -22,19 +23,19 @@ def seed_data():
 
     # Seed default users if they don't exist
     if User.query.filter_by(email="teacher@example.com").first() is None:
-        teacher = User(email="teacher@example.com", role="teacher", id=0)
+        teacher = User(email="teacher@example.com", role="teacher")
         teacher.set_password("password")
         db.session.add(teacher)
         print("Teacher user seeded.")
     
     if User.query.filter_by(email="student@example.com").first() is None:
-        student = User(email="student@example.com", role="student", id=1)
+        student = User(email="student@example.com", role="student")
         student.set_password("password")
         db.session.add(student)
         print("Student user seeded.")
 
     # Enroll student in course
-    user = User.query.filter_by(id=1).first() 
+    user = User.query.filter_by(email="student@example.com").first()
     course = Course.query.filter_by(course_id="course1").first()
 
     lectures = course.lectures
@@ -43,7 +44,7 @@ def seed_data():
         lecture1 = Lecture(
             title = "Lecture 1: Introduction to Biology",
             description = "This is the content of lecture 1.",
-            course_id = course.course_id,
+            course_id = course.id,
             video_link = "https://www.youtube.com/watch?v=example1",
             transcript = """The Cell: Basic Unit of Life
     Cells are the fundamental units of life, forming the structural and functional basis of all organisms. There are two main types:
@@ -54,7 +55,7 @@ def seed_data():
     Cell organelles like the nucleus, mitochondria, and ribosomes play essential roles in maintaining life processes.""",
         )
         lecture2 = Lecture(
-            course_id = course.course_id,
+            course_id = course.id,
             title = "Lecture 2: Cell Biology",
             description = "This is the content of lecture 2.",
             video_link = "https://www.youtube.com/watch?v=example2",
@@ -93,7 +94,7 @@ Heredity: Transmission of traits from parents to offspring.""",
         ]
         assignment = Assignment(title="Assignment 1", description="Complete the assignment", 
                                 due_date=datetime.datetime.now() + datetime.timedelta(days=365), 
-                                course_id=course.course_id, content=assignment_content)
+                                course_id=course.id, content=assignment_content)
         course.assignments.append(assignment)
 
     db.session.commit()
@@ -153,12 +154,171 @@ Biodiversity: Variety of life forms in an ecosystem.
 
 Sustainability: Practices to maintain ecological balance.
     """] 
-    for i in rag_content:
-        embedding = embed_model.encode(i).tolist()
-        collection.add(ids=[f"doc_{rag_content.index(i)}"], embeddings=[embedding], metadatas=[{"text": i}])
+    # The reference notes belong to the biology course
+    stats = ingest_documents(
+        ({"id": f"doc_{i}", "text": text, "metadata": {"course_id": course.course_id}}
+         for i, text in enumerate(rag_content)),
+        embedder, vector_store,
+    )
+    print(f"Indexed {stats['documents']} documents as {stats['chunks']} chunks.")
+
+    stats = index_transcripts()
+    print(f"Indexed {stats['documents']} lecture transcripts as {stats['chunks']} chunks.")
 
     print("Seeding complete.")
 
+# ------------------
+# Synthetic data for load tests: thousands of users, courses and submissions
+# ------------------
+
+SUBJECTS = {
+    "Biology": ["cells", "mitochondria", "DNA replication", "natural selection", "photosynthesis", "ecosystems"],
+    "Mathematics": ["derivatives", "integrals", "matrices", "eigenvalues", "probability", "proof by induction"],
+    "History": ["the industrial revolution", "the cold war", "colonial empires", "the printing press",
+                "the french revolution", "world war one"],
+    "Chemistry": ["covalent bonds", "reaction rates", "acids and bases", "the periodic table", "oxidation",
+                  "chemical equilibrium"],
+    "Physics": ["momentum", "electric fields", "thermodynamics", "wave interference", "orbital motion",
+                "special relativity"],
+}
+
+SENTENCES = [
+    "{topic} is one of the central ideas of this unit.",
+    "Students often confuse {topic} with {other}, so we compare them side by side.",
+    "A worked example shows how {topic} appears in practice.",
+    "The key definition of {topic} is revisited in the exercises.",
+    "We finish by connecting {topic} to {other}.",
+]
+
+def synthetic_transcript(rng, topics, sentences=12):
+    lines = []
+    for _ in range(sentences):
+        topic, other = rng.sample(topics, 2)
+        lines.append(rng.choice(SENTENCES).format(topic=topic, other=other).capitalize())
+    return " ".join(lines)
+
+def synthetic_questions(rng, topics, count=5):
+    questions = []
+    for number in range(count):
+        topic = rng.choice(topics)
+        options = [f"Option {letter} about {topic}" for letter in "ABCD"]
+        questions.append({
+            "question": f"Question {number + 1}: which statement about {topic} is true?",
+            "options": options,
+            "correct_option": rng.choice(options),
+        })
+    return questions
+
+def insert_rows(model_or_table, rows, batch=5000):
+    table = getattr(model_or_table, "__table__", model_or_table)
+    for offset in range(0, len(rows), batch):
+        db.session.execute(table.insert(), rows[offset:offset + batch])
+
+def seed_synthetic(users=1000, teachers=20, courses=50, assignments=3, lectures=4, submissions=10000,
+                   enrollments=3, index=False, seed=0):
+    """
+    Bulk-inserts a reproducible synthetic dataset next to whatever is already
+    there: student{i}@example.com and teacher{i}@example.com with password
+    "password", courses course-{i}, and lectures, assignments, enrollments and
+    graded submissions for them. With `index`, lecture transcripts are embedded too.
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    # Hashing is deliberately slow, so every synthetic user shares one hash
+    password_hash = passwords.hash("password")
+    course_offset = (db.session.execute(db.select(db.func.max(Course.id))).scalar() or 0)
+
+    existing = set(db.session.execute(db.select(User.email)).scalars())
+    user_rows = [{"email": f"teacher{i}@example.com", "role": "teacher"} for i in range(teachers)] + \
+                [{"email": f"student{i}@example.com", "role": "student"} for i in range(users)]
+    user_rows = [{**row, "password_hash": password_hash} for row in user_rows if row["email"] not in existing]
+    insert_rows(User, user_rows)
+    subjects = list(SUBJECTS)
+    course_rows = []
+    for i in range(courses):
+        subject = subjects[i % len(subjects)]
+        course_rows.append({"course_id": f"course-{course_offset + i + 1}", "name": f"{subject} {100 + i}",
+                            "description": f"A synthetic {subject.lower()} course."})
+    insert_rows(Course, course_rows)
+    db.session.commit()
+
+    course_ids = dict(db.session.execute(
+        db.select(Course.course_id, Course.id).where(Course.course_id.in_([row["course_id"] for row in course_rows]))
+    ).all())
+    student_ids = [user_id for (user_id,) in db.session.execute(
+        db.select(User.id).where(User.email.like("student%@example.com"), User.role == "student"))]
+
+    lecture_rows, assignment_rows, keys = [], [], []
+    due = datetime.datetime.now() + datetime.timedelta(days=365)
+    for row in course_rows:
+        pk = course_ids[row["course_id"]]
+        topics = SUBJECTS[row["name"].rsplit(" ", 1)[0]]
+        for number in range(lectures):
+            lecture_rows.append({"course_id": pk, "title": f"Lecture {number + 1}",
+                                 "description": f"Lecture {number + 1} of {row['name']}",
+                                 "video_link": f"https://www.youtube.com/watch?v={row['course_id']}-{number}",
+                                 "transcript": synthetic_transcript(rng, topics)})
+        for number in range(assignments):
+            content = synthetic_questions(rng, topics)
+            key = AnswerKey.compile(content)
+            assignment_rows.append({"course_id": pk, "title": f"Assignment {number + 1}",
+                                    "description": "Synthetic assignment", "due_date": due,
+                                    "content": content, "answer_key": key.to_json()})
+    insert_rows(Lecture, lecture_rows)
+    insert_rows(Assignment, assignment_rows)
+
+    pairs = set()
+    for student_id in student_ids:
+        for course_pk in rng.sample(list(course_ids.values()), min(enrollments, len(course_ids))):
+            pairs.add((student_id, course_pk))
+    existing = set(db.session.execute(db.select(user_courses.c.user_id, user_courses.c.course_id)).all())
+    insert_rows(user_courses, [{"user_id": user_id, "course_id": course_pk}
+                               for user_id, course_pk in pairs - existing])
+    db.session.commit()
+
+    assignments_by_course = {}
+    for assignment_id, course_pk, answer_key in db.session.execute(
+        db.select(Assignment.id, Assignment.course_id, Assignment.answer_key)
+        .where(Assignment.course_id.in_(list(course_ids.values())))
+    ):
+        assignments_by_course.setdefault(course_pk, []).append((assignment_id, AnswerKey.from_json(answer_key)))
+    emails = dict(db.session.execute(db.select(User.id, User.email).where(User.id.in_(student_ids))).all())
+    pairs = sorted(pairs)
+    submission_rows = []
+    for _ in range(submissions if pairs else 0):
+        student_id, course_pk = rng.choice(pairs)
+        assignment_id, key = rng.choice(assignments_by_course[course_pk])
+        selections = [rng.randrange(count) for count in key.option_counts]
+        submission_rows.append({"student_email": emails[student_id], "assignment_id": assignment_id,
+                                "submitted_at": datetime.datetime.utcnow() - datetime.timedelta(
+                                    minutes=rng.randrange(60 * 24 * 30)),
+                                "content": selections, "score": key.grade(selections)})
+    insert_rows(Submission, submission_rows)
+    db.session.commit()
+
+    counts = {"users": len(user_rows), "courses": courses, "lectures": len(lecture_rows),
+              "assignments": len(assignment_rows), "enrollments": len(pairs), "submissions": len(submission_rows)}
+    if index:
+        counts["indexed"] = index_transcripts()
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    return counts
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed the demo data, or a synthetic dataset with --synthetic.")
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--teachers", type=int, default=20)
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--assignments", type=int, default=3, help="per course")
+    parser.add_argument("--lectures", type=int, default=4, help="per course")
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--enrollments", type=int, default=3, help="courses per student")
+    parser.add_argument("--index", action="store_true", help="embed the synthetic lecture transcripts")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
     with app.app_context():
-        seed_data()
+        if args.synthetic:
+            print(seed_synthetic(args.users, args.teachers, args.courses, args.assignments, args.lectures,
+                                 args.submissions, args.enrollments, args.index, args.seed))
+        else:
+            seed_data()
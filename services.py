@@ -0,0 +1,111 @@
+# services.py
+"""
+Lazily initialized heavy services (LLM client, embedding model, vector store).
+
+Each service is built by its loader on first use, exactly once even under
+concurrent requests, so importing the app stays cheap and commands that only
+need the database never load a model.
+
+Services that own threads, event loops or connections are registered with
+per_process=True and start cold again in a forked child (e.g. a gunicorn
+worker); the others, such as a preloaded model, are shared copy-on-write.
+"""
+import os
+import threading
+import time
+
+
+class ServiceUnavailable(Exception):
+    """Raised when a service's loader fails; the next use tries again."""
+
+    def __init__(self, name, error):
+        super().__init__(f"{name} is unavailable: {error}")
+        self.name = name
+        self.error = error
+
+
+_MISSING = object()
+
+
+class _Service:
+    def __init__(self, name, loader, per_process=False):
+        self.name = name
+        self.loader = loader
+        self.per_process = per_process
+        self.lock = threading.Lock()
+        self.instance = _MISSING
+        self.state = "cold"
+        self.load_ms = None
+        self.error = None
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._services = {}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, name, loader, per_process=False):
+        self._services[name] = _Service(name, loader, per_process)
+
+    def _after_fork(self):
+        for service in self._services.values():
+            if service.per_process:
+                service.instance = _MISSING
+            # A lock held by another thread at fork time would never be released here
+            service.lock = threading.Lock()
+            if service.instance is _MISSING:
+                service.state, service.load_ms, service.error = "cold", None, None
+
+    def get(self, name):
+        service = self._services[name]
+        instance = service.instance
+        if instance is not _MISSING:
+            return instance
+        with service.lock:
+            if service.instance is _MISSING:
+                service.state = "loading"
+                start = time.perf_counter()
+                try:
+                    service.instance = service.loader()
+                except Exception as e:
+                    service.state, service.error = "failed", str(e)
+                    raise ServiceUnavailable(name, e) from e
+                service.load_ms = round((time.perf_counter() - start) * 1000, 1)
+                service.state, service.error = "warm", None
+            return service.instance
+
+    def is_loaded(self, name):
+        return self._services[name].instance is not _MISSING
+
+    def proxy(self, name):
+        return ServiceProxy(self, name)
+
+    def status(self):
+        return {
+            name: {"state": service.state, "load_ms": service.load_ms, "error": service.error}
+            for name, service in self._services.items()
+        }
+
+    def warmup(self, names=None):
+        """Loads the given services (all by default), skipping ones that fail."""
+        for name in names or list(self._services):
+            try:
+                self.get(name)
+            except ServiceUnavailable:
+                pass
+        return self.status()
+
+
+class ServiceProxy:
+    """Stands in for a registered service and loads it on first attribute access."""
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(self._registry.get(self._name), attribute)
+
+    def __repr__(self):
+        return f"<ServiceProxy {self._name}>"
@@ -7,17 +7,7 @@ export OLLAMA_HOST=127.0.0.1:9999
 
 ollama serve &
 
-# Initialize the migration repository if it doesn't exist
-if [ ! -d "migrations" ]; then
-    echo "Initializing migrations..."
-    flask db init
-fi
-
-# Create a migration script (based on your current models)
-echo "Creating migration script..."
-flask db migrate -m "Initial migration."
-
-# Apply the migration to upgrade the database schema
+# Apply the committed migrations to bring the database schema up to date
 echo "Upgrading database..."
 flask db upgrade
 
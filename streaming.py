@@ -0,0 +1,159 @@
+# streaming.py
+import json
+import logging
+import time
+
+from llm_gateway import LLMTimeout, Overloaded
+
+logger = logging.getLogger(__name__)
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag_length(text, tag):
+    """Length of the longest suffix of text that is a proper prefix of tag."""
+    for size in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+
+class ThinkFilter:
+    """
+    Incremental version of clean_answer.
+
+    Tokens are fed in as they arrive from the model. Everything between
+    <think> and </think> is dropped, and a tag split across two chunks is
+    held back until the next chunk decides whether it really is a tag.
+    Leading whitespace of the visible answer is stripped like clean_answer does.
+    """
+
+    def __init__(self):
+        self.in_think = False
+        self.pending = ""
+        self.started = False
+
+    def feed(self, chunk):
+        self.pending += chunk
+        visible = []
+        while self.pending:
+            tag = THINK_CLOSE if self.in_think else THINK_OPEN
+            index = self.pending.find(tag)
+            if index != -1:
+                if not self.in_think:
+                    visible.append(self.pending[:index])
+                self.pending = self.pending[index + len(tag):]
+                self.in_think = not self.in_think
+                continue
+            keep = _partial_tag_length(self.pending, tag)
+            if not self.in_think:
+                visible.append(self.pending[:len(self.pending) - keep])
+            self.pending = self.pending[len(self.pending) - keep:]
+            break
+        return self._emit("".join(visible))
+
+    def flush(self):
+        rest = "" if self.in_think else self.pending
+        self.pending = ""
+        return self._emit(rest)
+
+    def _emit(self, text):
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_chat_events(chunks, strip_think=True, preamble=None, on_complete=None):
+    """
+    Turns an Ollama chat stream into server-sent events.
+
+    Emits optional preamble events first, then one "token" event per visible
+    piece of text and finally a "done" trailer with timing statistics.
+    on_complete(answer) is called with the visible text once the stream has
+    finished without an error, e.g. to cache it.
+    """
+    start = time.perf_counter()
+    first_chunk_at = None
+    first_token_at = None
+    chunk_count = 0
+    final = {}
+    think_filter = ThinkFilter() if strip_think else None
+    visible = []
+
+    for event, data in preamble or []:
+        yield sse(event, data)
+
+    try:
+        for chunk in chunks:
+            now = time.perf_counter()
+            content = chunk["message"]["content"] or ""
+            if content:
+                chunk_count += 1
+                if first_chunk_at is None:
+                    first_chunk_at = now
+            if chunk.get("done"):
+                final = chunk
+
+            text = think_filter.feed(content) if think_filter else content
+            if text:
+                if first_token_at is None:
+                    first_token_at = now
+                visible.append(text)
+                yield sse("token", {"content": text})
+    except LLMTimeout:
+        # Headers are already sent, so failures can only be reported in-band
+        yield sse("error", {"error": "LLM request timed out"})
+        return
+    except Overloaded:
+        yield sse("error", {"error": "The assistant is busy, please try again shortly"})
+        return
+    except Exception as e:
+        # Ollama ResponseError, a dropped connection, ...: end the stream cleanly
+        logger.warning("LLM stream failed: %r", e)
+        yield sse("error", {"error": "LLM request failed"})
+        return
+
+    if think_filter:
+        text = think_filter.flush()
+        if text:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            visible.append(text)
+            yield sse("token", {"content": text})
+
+    if on_complete is not None:
+        on_complete("".join(visible).strip())
+
+    elapsed = time.perf_counter() - start
+    eval_count = final.get("eval_count")
+    eval_duration = final.get("eval_duration")
+    if eval_count and eval_duration:
+        tokens_per_sec = eval_count / (eval_duration / 1e9)
+    elif chunk_count and first_chunk_at is not None and elapsed > first_chunk_at - start:
+        # Without Ollama's eval stats, count chunks (one token each) after the first one
+        tokens_per_sec = chunk_count / (elapsed - (first_chunk_at - start))
+    else:
+        tokens_per_sec = None
+
+    yield sse("done", {
+        "ttft_ms": None if first_token_at is None else round((first_token_at - start) * 1000, 1),
+        "first_chunk_ms": None if first_chunk_at is None else round((first_chunk_at - start) * 1000, 1),
+        "total_ms": round(elapsed * 1000, 1),
+        "tokens": eval_count or chunk_count,
+        "tokens_per_sec": None if tokens_per_sec is None else round(tokens_per_sec, 2),
+    })
+
+
+def stream_text_events(text, preamble=None, **trailer):
+    """Replays an already known answer (e.g. from a cache) in the same event format."""
+    for event, data in preamble or []:
+        yield sse(event, data)
+    if text:
+        yield sse("token", {"content": text})
+    yield sse("done", {"ttft_ms": 0.0, "total_ms": 0.0, **trailer})
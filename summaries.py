@@ -0,0 +1,76 @@
+# summaries.py
+"""
+Map-reduce summarization of chat history.
+
+New messages are cut into bounded windows; each window is summarized on its
+own (map) and the partial summaries are folded into the stored rolling
+summary (reduce), so no prompt ever grows with the total history.
+"""
+
+from prompting import SYSTEM_PROMPT
+
+WINDOW_MESSAGES = 50
+WINDOW_CHARS = 6000
+MERGE_FAN_IN = 4
+
+
+def windows(rows, max_messages=WINDOW_MESSAGES, max_chars=WINDOW_CHARS):
+    """
+    Groups (id, message) rows into windows bounded by message count and total
+    characters, yielding (last id, messages) for each window.
+    """
+    window, size, last_id = [], 0, None
+    for row_id, message in rows:
+        if window and (len(window) >= max_messages or size + len(message) > max_chars):
+            yield last_id, window
+            window, size = [], 0
+        window.append(message[:max_chars])
+        size += len(window[-1])
+        last_id = row_id
+    if window:
+        yield last_id, window
+
+
+def summarize_window(chat, messages):
+    lines = "\n".join(f"- {message}" for message in messages)
+    return chat([
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Student questions:\n{lines}\n"
+                                    "Question: Which topics do these questions ask about, and how often?"},
+    ])
+
+
+def merge_summaries(chat, previous, partials):
+    parts = ([f"Earlier summary: {previous}"] if previous else []) + [
+        f"New activity: {partial}" for partial in partials
+    ]
+    return chat([
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": "\n".join(parts) + "\nQuestion: Combine these into one summary of "
+                                    "the chat history, with information like which topics are frequently queried."},
+    ])
+
+
+def fold(chat, previous, batches, on_progress=None):
+    """
+    Folds batches of new messages into the previous summary.
+
+    `batches` yields (last_message_id, messages) pairs as produced by
+    windows(). After every merge on_progress(summary, last_message_id) is
+    called so the caller can persist the high-water mark and a failure never
+    loses finished work.
+    """
+    summary = previous
+    partials, last_id = [], None
+    for last_id, messages in batches:
+        partials.append(summarize_window(chat, messages))
+        if len(partials) >= MERGE_FAN_IN:
+            summary = merge_summaries(chat, summary, partials)
+            partials = []
+            if on_progress:
+                on_progress(summary, last_id)
+    if partials:
+        summary = partials[0] if not summary and len(partials) == 1 else merge_summaries(chat, summary, partials)
+        if on_progress:
+            on_progress(summary, last_id)
+    return summary
@@ -0,0 +1,114 @@
+# topics.py
+"""
+Topic analytics over chat history: spherical k-means on the message
+embeddings, with each cluster later labelled by the nearest indexed chunk.
+"""
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+from clustering import kmeans
+
+TREND_DAYS = 7
+
+
+def unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def choose_k(count, requested=None, max_k=12):
+    if count == 0:
+        return 0
+    if requested:
+        return max(1, min(requested, count))
+    # Rule of thumb sqrt(n / 2), capped so the report stays readable
+    return max(1, min(max_k, int(np.sqrt(count / 2)), count))
+
+
+class ChatVectorIndex:
+    """
+    In-memory, append-only copy of the stored chat embeddings so reports do
+    not re-read every vector from the database.
+    """
+
+    def __init__(self, dimension=None):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.courses = np.zeros(0, dtype=object)
+        self.created = np.zeros(0, dtype="datetime64[s]")
+        self.vectors = np.zeros((0, dimension or 0), dtype=np.float32)
+
+    @property
+    def last_id(self):
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def append(self, rows):
+        """rows: (chat id, course id, created_at, float32 vector bytes), in id order."""
+        if not rows:
+            return
+        vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, _, _, vector in rows])
+        with self._lock:
+            if not len(self.vectors):
+                self.vectors = self.vectors.reshape(0, vectors.shape[1])
+            self.ids = np.concatenate([self.ids, [row[0] for row in rows]])
+            self.courses = np.concatenate([self.courses, np.array([row[1] for row in rows], dtype=object)])
+            self.created = np.concatenate([
+                self.created, np.array([row[2] for row in rows], dtype="datetime64[s]")
+            ])
+            self.vectors = np.concatenate([self.vectors, vectors])
+
+    def refresh(self, load_after):
+        """Appends the rows load_after(last_id) returns; one refresh runs at a time."""
+        with self._refresh_lock:
+            self.append(load_after(self.last_id))
+
+    def select(self, course_id=None, since=None, until=None):
+        with self._lock:
+            mask = np.ones(len(self.ids), dtype=bool)
+            if course_id:
+                mask &= self.courses == course_id
+            if since is not None:
+                mask &= self.created >= np.datetime64(since, "s")
+            if until is not None:
+                mask &= self.created < np.datetime64(until, "s")
+            return self.ids[mask], self.created[mask], self.vectors[mask]
+
+
+def topic_clusters(ids, created, vectors, k=None, now=None, max_k=12):
+    """
+    Clusters the selected messages and returns one dict per topic, largest
+    first, with its centroid, the id of the most central message, daily
+    counts and the counts of the last two TREND_DAYS periods before `now`.
+    """
+    k = choose_k(len(ids), k, max_k)
+    if not k:
+        return []
+    labels, centroids = kmeans(vectors, k)
+    days = created.astype("datetime64[D]").astype(str)
+    if now is not None:
+        recent = created >= np.datetime64(now - timedelta(days=TREND_DAYS), "s")
+        previous = ~recent & (created >= np.datetime64(now - timedelta(days=2 * TREND_DAYS), "s"))
+    topics = []
+    for index in range(k):
+        members = np.flatnonzero(labels == index)
+        if not len(members):
+            continue
+        similarity = vectors[members] @ centroids[index]
+        member_days, counts = np.unique(days[members], return_counts=True)
+        topic = {
+            "count": int(len(members)),
+            "centroid": centroids[index],
+            "representative_id": int(ids[members[np.argmax(similarity)]]),
+            "cohesion": round(float(similarity.mean()), 4),
+            "daily_counts": dict(zip(member_days.tolist(), counts.tolist())),
+        }
+        if now is not None:
+            topic["recent"] = int(np.count_nonzero(recent[members]))
+            topic["previous"] = int(np.count_nonzero(previous[members]))
+        topics.append(topic)
+    topics.sort(key=lambda topic: -topic["count"])
+    return topics
@@ -0,0 +1,25 @@
+# transcript.py
+
+
+def transcript_doc_id(lecture_id):
+    return f"lecture-{lecture_id}"
+
+
+def transcript_documents(lectures):
+    """
+    Ingest documents for lecture transcripts, tagged with their course and
+    lecture so retrieval can be scoped to one course.
+    """
+    for lecture in lectures:
+        if not lecture.transcript:
+            continue
+        yield {
+            "id": transcript_doc_id(lecture.id),
+            "text": lecture.transcript,
+            "metadata": {
+                "course_id": lecture.course.course_id,
+                "lecture_id": lecture.id,
+                "source": "transcript",
+                "title": lecture.title,
+            },
+        }
@@ -0,0 +1,453 @@
+# vector_store.py
+"""
+Vector stores for RAG chunks.
+
+Both backends share one small interface:
+
+    upsert(ids, embeddings, metadatas)
+    delete_documents(doc_ids)        # every chunk whose metadata doc_id matches
+    query(embedding, k, where=None)  # [{"id", "metadata", "score"}], best first
+    chunks()                         # every (id, metadata), e.g. to build a lexical index
+    version()                        # changes whenever the stored chunks change
+    count()
+    stats()
+
+`where` is an equality filter on metadata, e.g. {"course_id": "course1"}.
+Scores are cosine similarities of unit-length embeddings.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from clustering import kmeans
+
+
+def _unit(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class ChromaStore:
+    """Wraps a Chroma collection (L2 space over normalized embeddings)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def upsert(self, ids, embeddings, metadatas):
+        self.collection.upsert(
+            ids=list(ids),
+            embeddings=[embedding.tolist() for embedding in _unit(embeddings)],
+            metadatas=list(metadatas),
+        )
+
+    def delete_documents(self, doc_ids):
+        if doc_ids:
+            self.collection.delete(where={"doc_id": {"$in": list(doc_ids)}})
+
+    def query(self, embedding, k=5, where=None):
+        results = self.collection.query(
+            query_embeddings=[_unit(embedding)[0].tolist()], n_results=k, where=where or None,
+        )
+        if not results["ids"] or not results["ids"][0]:
+            return []
+        # Squared L2 distance between unit vectors is 2 - 2 * cosine
+        return [
+            {"id": chunk_id, "metadata": metadata, "score": round(1 - distance / 2, 6)}
+            for chunk_id, metadata, distance in zip(
+                results["ids"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
+    def chunks(self, page_size=1000):
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            yield from zip(page["ids"], page["metadatas"])
+            if len(page["ids"]) < page_size:
+                return
+            offset += page_size
+
+    def version(self):
+        # Chroma has no change counter; the chunk count catches additions and deletions
+        return self.count()
+
+    def count(self):
+        return self.collection.count()
+
+    def stats(self):
+        return {"backend": "chroma", "chunks": self.count()}
+
+
+class NumpyStore:
+    """
+    In-process store: unit float32 vectors in a memory-mapped file, searched
+    with one matrix-vector product (exact top-k).
+
+    With ivf_lists > 0 the vectors are also partitioned by k-means into that
+    many lists and a query only scores the rows in its `probes` nearest lists
+    (approximate, IVF-style); the partition is rebuilt whenever the store has
+    doubled since it was trained.
+
+    Files in `path`:
+        vectors.<generation>.f32  row-major float32 matrix, grown by doubling its capacity
+        chunks.db      SQLite: id, doc_id and metadata of each live row, plus
+                       the generation, dimension, capacity and row count
+        centroids.npy  IVF centroids, when trained
+
+    Opening the store maps the vectors instead of reading them, so startup is
+    instant and gunicorn workers share the pages through the OS page cache.
+    Metadata stays on disk: a worker only keeps the metadata columns its
+    queries filter on. Each write is one SQLite transaction that touches just
+    the changed rows and stamps them with a new `seq`; other processes read
+    those rows on their next query, inside one read snapshot.
+
+    Deletes never move rows in a mapped file: the live rows are copied into
+    the next generation's file, and the transaction that renumbers them also
+    switches `generation`, so a snapshot always pairs its rows with its own
+    file. Old files are unlinked afterwards; mappings that are already open
+    stay valid, and a reader whose file is gone retries on a new snapshot.
+    """
+
+    def __init__(self, path, ivf_lists=0, probes=8):
+        self.path = path
+        self.ivf_lists = ivf_lists
+        self.probes = probes
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db_path = os.path.join(path, "chunks.db")
+        self._centroids_path = os.path.join(path, "centroids.npy")
+        self._db = self._connect()
+        self._db.executescript(_SCHEMA)
+        self.dimension, self._capacity, self._count = None, 0, 0
+        self._generation, self._seq = None, 0
+        self._vectors = None
+        self._columns = {}
+        self._centroids, self._lists, self._trained_at = None, None, None
+        with self._snapshot():
+            pass
+        if self.ivf_lists and self._lists is None and self._count >= 4 * self.ivf_lists:
+            # Written by an exact-mode store: partition it now
+            self._write(lambda: (self._count, None, []))
+
+    # ------------------
+    # Persistence
+    # ------------------
+
+    def _connect(self):
+        connection = sqlite3.connect(self._db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    @contextmanager
+    def _transaction(self, mode=""):
+        """A read snapshot, or with mode="IMMEDIATE" the single writer's transaction."""
+        self._db.execute(f"BEGIN {mode}")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    @contextmanager
+    def _snapshot(self):
+        """A read transaction with the cached state synced to it."""
+        with self._lock:
+            for attempt in range(3):
+                with self._transaction():
+                    try:
+                        self._sync()
+                    except FileNotFoundError:
+                        # Compacted, and the old file removed, after this snapshot began
+                        if attempt == 2:
+                            raise
+                        continue
+                    yield
+                    return
+
+    def _vectors_file(self, generation):
+        return os.path.join(self.path, f"vectors.{generation}.f32")
+
+    def _map(self, generation, capacity, create=False):
+        if create:
+            with open(self._vectors_file(generation), "wb") as f:
+                f.truncate(capacity * self.dimension * 4)
+        return np.memmap(self._vectors_file(generation), dtype=np.float32, mode="r+",
+                         shape=(capacity, self.dimension))
+
+    def _sync(self):
+        """Catches the cached columns and lists up with the stored rows; call inside a transaction."""
+        dimension, capacity, count, generation, seq, trained_at = self._db.execute(
+            "SELECT dimension, capacity, count, generation, seq, trained_at FROM store").fetchone()
+        if (generation, capacity) != (self._generation, self._capacity):
+            self._vectors, self.dimension = None, dimension
+            if capacity:
+                self._vectors = self._map(generation, capacity)
+        changed = []
+        if generation != self._generation:
+            # Rows were renumbered: rebuild everything indexed by row
+            self._columns, self._lists, self._trained_at = {}, None, None
+        elif seq != self._seq:
+            changed = [(row, json.loads(metadata)) for row, metadata in self._db.execute(
+                "SELECT row, metadata FROM chunks WHERE seq > ?", (self._seq,))]
+        self.dimension, self._capacity, self._count = dimension, capacity, count
+        self._generation, self._seq = generation, seq
+        for key in self._columns:
+            self._columns[key] = _grow(self._columns[key], count, object)
+            for row, metadata in changed:
+                self._columns[key][row] = metadata.get(key)
+        if not self.ivf_lists:
+            return
+        if trained_at != self._trained_at:
+            self._load_centroids(trained_at)
+        elif self._lists is not None and changed:
+            self._lists = _grow(self._lists, count, int)
+            rows = np.array([row for row, _ in changed])
+            self._lists[rows] = np.argmax(self._vectors[rows] @ self._centroids.T, axis=1)
+
+    def _load_centroids(self, trained_at):
+        self._centroids, self._lists, self._trained_at = None, None, trained_at
+        if not trained_at:
+            return
+        try:
+            self._centroids = np.load(self._centroids_path)
+        except FileNotFoundError:
+            return
+        count = self._count
+        self._lists = np.argmax(self._vectors[:count] @ self._centroids.T, axis=1) if count else np.zeros(0, int)
+
+    def _write(self, change):
+        """
+        Runs change() in a write transaction. It returns (count, generation or
+        None to keep it, [(row, id, metadata)] to store), or None if there is
+        nothing to write.
+        """
+        with self._lock:
+            try:
+                with self._transaction("IMMEDIATE"):
+                    self._sync()
+                    result = change()
+                    if result is None:
+                        return
+                    count, generation, rows = result
+                    if self._vectors is not None:
+                        self._vectors.flush()
+                    trained_at = self._train(count)
+                    seq = self._seq + 1
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO chunks (row, id, doc_id, metadata, seq) VALUES (?, ?, ?, ?, ?)",
+                        [(row, chunk_id, metadata.get("doc_id"), json.dumps(metadata), seq)
+                         for row, chunk_id, metadata in rows])
+                    self._db.execute(
+                        "UPDATE store SET dimension = ?, capacity = ?, count = ?, generation = ?, seq = ?, trained_at = ?",
+                        (self.dimension, self._capacity, count,
+                         self._generation if generation is None else generation, seq, trained_at))
+            except BaseException:
+                # change() may have remapped the vectors: resync from scratch
+                self._generation = None
+                raise
+            if generation is not None:
+                self._remove_old_vectors(generation)
+            with self._snapshot():
+                pass
+
+    def _remove_old_vectors(self, generation):
+        for name in os.listdir(self.path):
+            match = re.fullmatch(r"vectors\.(\d+)\.f32", name)
+            if match and int(match.group(1)) < generation:
+                os.remove(os.path.join(self.path, name))
+
+    def _reserve(self, rows):
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, 2 * self._capacity, 1024)
+        with open(self._vectors_file(self._generation), "ab") as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._vectors = self._map(self._generation, capacity)
+        self._capacity = capacity
+
+    # ------------------
+    # Writes
+    # ------------------
+
+    def upsert(self, ids, embeddings, metadatas):
+        vectors = _unit(embeddings)
+
+        def change():
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Embeddings have dimension {vectors.shape[1]}, the store {self.dimension}")
+            existing = self._rows_of(ids)
+            count = self._count
+            self._reserve(count + len(ids))
+            rows = {}
+            for chunk_id, vector, metadata in zip(ids, vectors, metadatas):
+                row = existing.get(chunk_id)
+                if row is None:
+                    row = existing[chunk_id] = count
+                    count += 1
+                self._vectors[row] = vector
+                rows[chunk_id] = (row, chunk_id, metadata)
+            return count, None, list(rows.values())
+
+        self._write(change)
+
+    def delete_documents(self, doc_ids):
+        doc_ids = list(set(doc_ids))
+
+        def change():
+            deleted = set()
+            for offset in range(0, len(doc_ids), _BATCH):
+                batch = doc_ids[offset:offset + _BATCH]
+                deleted.update(row for (row,) in self._db.execute(
+                    f"SELECT row FROM chunks WHERE doc_id IN ({','.join('?' * len(batch))})", batch))
+            if not deleted:
+                return None
+            keep = [row for row in range(self._count) if row not in deleted]
+            # Compact the live rows into the next generation's file so rows [0, count) stay dense;
+            # readers still on this generation keep their rows and vectors
+            generation = self._generation + 1
+            vectors = self._map(generation, self._capacity, create=True)
+            for offset in range(0, len(keep), _COPY_ROWS):
+                block = keep[offset:offset + _COPY_ROWS]
+                vectors[offset:offset + len(block)] = self._vectors[block]
+            self._vectors = vectors
+            self._db.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in deleted])
+            # Ascending, so each target row is already free
+            self._db.executemany("UPDATE chunks SET row = ? WHERE row = ?",
+                                 [(new, old) for new, old in enumerate(keep) if new != old])
+            return len(keep), generation, []
+
+        self._write(change)
+
+    def _rows_of(self, ids):
+        rows = {}
+        ids = list(ids)
+        for offset in range(0, len(ids), _BATCH):
+            batch = ids[offset:offset + _BATCH]
+            rows.update((chunk_id, row) for chunk_id, row in self._db.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch))
+        return rows
+
+    # ------------------
+    # IVF partition
+    # ------------------
+
+    def _train(self, count):
+        """Retrains or drops the centroids for `count` rows; returns the stored trained_at."""
+        if not self.ivf_lists:
+            return 0
+        if count < 4 * self.ivf_lists:
+            # Too few vectors to partition usefully; exact search is cheap anyway
+            if os.path.exists(self._centroids_path):
+                os.remove(self._centroids_path)
+            return 0
+        if self._centroids is not None and count < 2 * self._trained_at:
+            return self._trained_at
+        _, centroids = kmeans(np.array(self._vectors[:count]), self.ivf_lists, iterations=10)
+        temporary = self._centroids_path + ".tmp"
+        with open(temporary, "wb") as f:
+            np.save(f, centroids)
+        os.replace(temporary, self._centroids_path)
+        return count
+
+    # ------------------
+    # Reads
+    # ------------------
+
+    def _column(self, key):
+        if key not in self._columns:
+            self._columns[key] = np.array([value for (value,) in self._db.execute(
+                "SELECT json_extract(metadata, ?) FROM chunks ORDER BY row", (f'$."{key}"',))], dtype=object)
+        return self._columns[key]
+
+    def query(self, embedding, k=5, where=None):
+        query = _unit(embedding)[0]
+        with self._snapshot():
+            count = self._count
+            if not count:
+                return []
+            mask = np.ones(count, dtype=bool)
+            for key, value in (where or {}).items():
+                mask &= self._column(key) == value
+            if self._lists is not None:
+                nearest = np.argsort(-(self._centroids @ query))[:self.probes]
+                mask &= np.isin(self._lists, nearest)
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+            if len(rows) == count:
+                scores = self._vectors[:count] @ query
+            else:
+                scores = self._vectors[rows] @ query
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            hits = [int(rows[i]) for i in top]
+            found = {row: (chunk_id, metadata) for row, chunk_id, metadata in self._db.execute(
+                f"SELECT row, id, metadata FROM chunks WHERE row IN ({','.join('?' * len(hits))})", hits)}
+            return [
+                {"id": found[row][0], "metadata": json.loads(found[row][1]), "score": round(float(scores[i]), 6)}
+                for row, i in zip(hits, top)
+            ]
+
+    def chunks(self):
+        # Own connection, so the rows stream without holding the store lock
+        connection = self._connect()
+        try:
+            for chunk_id, metadata in connection.execute("SELECT id, metadata FROM chunks ORDER BY row"):
+                yield chunk_id, json.loads(metadata)
+        finally:
+            connection.close()
+
+    def version(self):
+        with self._snapshot():
+            return self._generation, self._seq
+
+    def count(self):
+        with self._snapshot():
+            return self._count
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "numpy",
+                "mode": "ivf" if self._lists is not None else "exact",
+                "chunks": self._count,
+                "dimension": self.dimension,
+                "capacity": self._capacity,
+                "ivf_lists": self.ivf_lists if self._lists is not None else 0,
+                "probes": self.probes if self._lists is not None else None,
+            }
+
+
+_BATCH = 500
+_COPY_ROWS = 65536
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store (
+    dimension INTEGER, capacity INTEGER NOT NULL, count INTEGER NOT NULL,
+    generation INTEGER NOT NULL, seq INTEGER NOT NULL, trained_at INTEGER NOT NULL
+);
+INSERT INTO store SELECT NULL, 0, 0, 0, 0, 0 WHERE NOT EXISTS (SELECT 1 FROM store);
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, doc_id TEXT, metadata TEXT NOT NULL, seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id);
+CREATE INDEX IF NOT EXISTS chunks_seq ON chunks (seq);
+"""
+
+
+def _grow(array, length, dtype):
+    if len(array) >= length:
+        return array
+    grown = np.zeros(length, dtype=dtype) if dtype is int else np.full(length, None, dtype=object)
+    grown[:len(array)] = array
+    return grown
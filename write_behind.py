@@ -0,0 +1,206 @@
+# write_behind.py
+"""
+Write-behind buffer for append-only inserts.
+
+Request threads hand rows to the queue instead of committing them one by one;
+a background thread writes everything queued so far in one transaction with
+one executemany per table, once `max_batch` rows are waiting or
+`flush_interval` seconds after the first of them arrived. Under SQLite that
+turns one fsync and one write-lock acquisition per request into one per batch.
+
+enqueue() returns a Future. Fire-and-forget callers (chat logging) ignore it.
+Callers that must not acknowledge before the row is durable pass wait=True
+and block on it: such rows are written as soon as the writer is free instead
+of after the interval, and everything that queued up during the previous
+commit goes into the next one (group commit).
+"""
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+
+import numpy as np
+
+from metrics import percentile
+
+
+class WriteBehindQueue:
+    def __init__(self, engine, flush_interval=0.2, max_batch=500, max_queue=10000, enabled=True):
+        # A callable returning the SQLAlchemy engine, resolved on every flush
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.enabled = enabled
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._flushing = 0
+        self._urgent = 0
+        self._enqueued = 0
+        self._written = 0
+        self._failed = 0
+        self._flushes = 0
+        self._blocked = 0
+        self._last_error = None
+        self._batch_sizes = deque(maxlen=1000)
+        self._latencies = deque(maxlen=1000)
+
+    def enqueue(self, table, row, wait=False):
+        """Queues one insert of `row` (a column dict) into `table`; the Future resolves once it is committed."""
+        future = Future()
+        if not self.enabled:
+            with self._condition:
+                self._enqueued += 1
+            self._write([(table, row, future)])
+            return future
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._ensure_thread()
+            if len(self._pending) >= self.max_queue:
+                # Backpressure: wait for the writer rather than growing without bound
+                self._blocked += 1
+                self._condition.notify_all()
+                while len(self._pending) >= self.max_queue:
+                    self._condition.wait()
+            self._pending.append((table, row, future, time.monotonic(), wait))
+            self._enqueued += 1
+            self._urgent += wait
+            if wait or len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._condition.notify_all()
+        return future
+
+    def flush(self, timeout=None):
+        """Writes everything queued so far and waits until it is committed."""
+        with self._condition:
+            if not self._pending and not self._flushing:
+                return True
+            marker = self._pending[-1][2] if self._pending else None
+            self._condition.notify_all()
+            if marker is None:
+                return self._condition.wait_for(lambda: not self._flushing, timeout)
+        try:
+            marker.exception(timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def close(self, timeout=30):
+        """Flushes the queue and stops the writer thread; called at interpreter shutdown."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+
+    # ------------------
+    # Writer thread
+    # ------------------
+
+    def _ensure_thread(self):
+        # A forked worker inherits the queue but not the thread
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending.clear()
+            self._flushing = self._urgent = 0
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # Wait for a full batch, the interval after the oldest row, a
+                # waiting caller or shutdown
+                deadline = self._pending[0][3] + self.flush_interval
+                while len(self._pending) < self.max_batch and not self._urgent and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = []
+                for _ in range(min(len(self._pending), self.max_batch)):
+                    table, row, future, _, wait = self._pending.popleft()
+                    self._urgent -= wait
+                    batch.append((table, row, future))
+                self._flushing = len(batch)
+                self._condition.notify_all()
+            try:
+                self._write(batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._flushing = 0
+                    self._condition.notify_all()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        tables = {}
+        for table, row, future in batch:
+            tables.setdefault(table, []).append((row, future))
+        try:
+            with self.engine().begin() as connection:
+                for table, entries in tables.items():
+                    connection.execute(table.insert(), [row for row, _ in entries])
+            failures = {}
+        except Exception:
+            # One bad row (e.g. a foreign key) must not lose the rest: retry row by row
+            failures = self._write_each(tables)
+        elapsed = time.perf_counter() - start
+        for table, row, future in batch:
+            error = failures.get(id(future))
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+        with self._condition:
+            self._flushes += 1
+            self._written += len(batch) - len(failures)
+            self._failed += len(failures)
+            self._batch_sizes.append(len(batch))
+            self._latencies.append(elapsed)
+
+    def _write_each(self, tables):
+        failures = {}
+        for table, entries in tables.items():
+            for row, future in entries:
+                try:
+                    with self.engine().begin() as connection:
+                        connection.execute(table.insert(), [row])
+                except Exception as e:
+                    failures[id(future)] = e
+                    with self._condition:
+                        self._last_error = f"{table.name}: {e}"
+        return failures
+
+    def stats(self):
+        with self._condition:
+            latencies = np.array(self._latencies) * 1000
+            sizes = list(self._batch_sizes)
+            return {
+                "enabled": self.enabled,
+                "queue_depth": len(self._pending),
+                "in_flight": self._flushing,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "failed": self._failed,
+                "flushes": self._flushes,
+                "blocked_enqueues": self._blocked,
+                "mean_batch_size": round(sum(sizes) / len(sizes), 1) if sizes else None,
+                "flush_p50_ms": percentile(latencies, 50),
+                "flush_p99_ms": percentile(latencies, 99),
+                "last_error": self._last_error,
+            }